@@ -1,8 +1,39 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import bcrypt
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
+
+# bcrypt cost factor for new hashes; existing hashes keep the cost they
+# were created with (it is stored in the hash)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Hashing runs in its own processes so a burst of signups/logins can't
+# starve the request threads. Beyond HASH_POOL_MAX_PENDING queued or running
+# jobs, new ones are rejected with HashPoolBusy.
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+HASH_POOL_MAX_PENDING = int(os.getenv("HASH_POOL_MAX_PENDING", str(HASH_POOL_WORKERS * 8)))
 
-def hash_password(password: str) -> str:
+# Session tokens (HS256 JWTs) are signed with SESSION_SECRET. Without it a
+# random secret is generated on first use and kept in SESSION_SECRET_PATH,
+# so restarts and every worker on the host share it; set SESSION_SECRET
+# when instances run on more than one host.
+SESSION_SECRET_PATH = os.getenv("SESSION_SECRET_PATH", "./session_secret")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "900"))
+_session_secret = os.getenv("SESSION_SECRET")
+_session_secret_lock = threading.Lock()
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
     """
     Hash a password using bcrypt
     Bcrypt has a maximum password length of 72 bytes
@@ -15,7 +46,7 @@ def hash_password(password: str) -> str:
         password_bytes = password_bytes[:72]
     
     # Generate salt and hash
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds)
     hashed = bcrypt.hashpw(password_bytes, salt)
     
     # Return as string
@@ -37,3 +68,226 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     
     # Verify
     return bcrypt.checkpw(password_bytes, hashed_bytes)
+
+class HashPoolBusy(Exception):
+    """Raised when the hash pool already has its maximum number of pending jobs"""
+    pass
+
+class HashPool:
+    """
+    Bounded process pool for bcrypt
+    hash() and verify() are awaited from async endpoints; the executor is
+    created on first use.
+    """
+    
+    def __init__(self, workers: int = HASH_POOL_WORKERS, max_pending: int = HASH_POOL_MAX_PENDING,
+                 rounds: int = BCRYPT_ROUNDS):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._peak_pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._busy_seconds = 0.0
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that runs threads (uvicorn, tap consumer) is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+    
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise HashPoolBusy(f"Password hashing queue is full ({self.max_pending} pending)")
+            self._pending += 1
+            self._peak_pending = max(self._peak_pending, self._pending)
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+                self._busy_seconds += time.perf_counter() - started
+    
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, self.rounds)
+    
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+    
+    def stats(self) -> dict:
+        """Queue depth and throughput counters"""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "rounds": self.rounds,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "peak_pending": self._peak_pending,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_ms": round(self._busy_seconds / self._completed * 1000, 1) if self._completed else 0,
+            }
+    
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+hash_pool = HashPool()
+
+def load_or_create_secret(path: str) -> str:
+    """The secret stored at path, written (mode 0600) by whichever worker gets there first"""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        for _ in range(50):
+            with open(path) as f:
+                secret = f.read().strip()
+            if secret:
+                return secret
+            time.sleep(0.01)  # another worker is still writing it
+        raise RuntimeError(f"{path} is empty; delete it or set SESSION_SECRET")
+    secret = secrets.token_urlsafe(32)
+    with os.fdopen(fd, "w") as f:
+        f.write(secret)
+    return secret
+
+def session_secret() -> str:
+    """SESSION_SECRET, or the secret persisted at SESSION_SECRET_PATH"""
+    global _session_secret
+    if _session_secret is None:
+        with _session_secret_lock:
+            if _session_secret is None:
+                _session_secret = load_or_create_secret(SESSION_SECRET_PATH)
+    return _session_secret
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _sign(message: bytes, secret: str) -> bytes:
+    return hmac.new(secret.encode("utf-8"), message, hashlib.sha256).digest()
+
+class RevocationCache:
+    """
+    Token ids (jti) revoked before they expire, plus per-user cutoffs
+    In-process and in-memory: entries only need to outlive the tokens they
+    cover (at most SESSION_TTL_SECONDS), so the cache stays small. With
+    several API instances, a revocation only applies to the instance that
+    received it until the token expires.
+    """
+    
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._tokens = {}  # jti -> exp
+        self._not_before = {}  # user_id -> iat cutoff
+    
+    def revoke(self, claims: dict):
+        """Revoke one token by its claims"""
+        with self._lock:
+            if len(self._tokens) >= self.max_entries:
+                self._prune(time.time())
+            self._tokens[claims["jti"]] = claims["exp"]
+    
+    def revoke_user(self, user_id: int, before: Optional[float] = None):
+        """Revoke every token issued to a user up to now (e.g. after a password change)"""
+        with self._lock:
+            self._not_before[user_id] = before if before is not None else time.time()
+    
+    def is_revoked(self, claims: dict) -> bool:
+        # Plain dict reads: no lock needed on the hot path
+        if claims["jti"] in self._tokens:
+            return True
+        cutoff = self._not_before.get(claims["sub"])
+        return cutoff is not None and claims["iat"] <= cutoff
+    
+    def _prune(self, now: float):
+        self._tokens = {jti: exp for jti, exp in self._tokens.items() if exp > now}
+        self._not_before = {
+            user_id: cutoff for user_id, cutoff in self._not_before.items()
+            if cutoff + SESSION_TTL_SECONDS > now
+        }
+    
+    def __len__(self):
+        return len(self._tokens) + len(self._not_before)
+
+revoked_tokens = RevocationCache()
+
+def create_session_token(user_id: int, ttl_seconds: Optional[int] = None,
+                         secret: Optional[str] = None) -> Tuple[str, int]:
+    """
+    Issue a signed session token for a user
+    Returns (token, expires_at) with expires_at in Unix seconds
+    """
+    now = time.time()
+    expires_at = int(now) + (ttl_seconds if ttl_seconds is not None else SESSION_TTL_SECONDS)
+    claims = {"sub": str(user_id), "iat": now, "exp": expires_at, "jti": secrets.token_urlsafe(12)}
+    header = _b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":")).encode("utf-8"))
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    signing_input = f"{header}.{payload}".encode("ascii")
+    signature = _b64encode(_sign(signing_input, secret or session_secret()))
+    return f"{header}.{payload}.{signature}", expires_at
+
+def _parse_token(token: str) -> Optional[Tuple[dict, bytes]]:
+    """(claims, signature) of a well-formed token, signature unchecked"""
+    try:
+        header, payload, signature = token.split(".")
+        claims = json.loads(_b64decode(payload))
+        claims["sub"] = int(claims["sub"])
+        float(claims["exp"])
+        signature = _b64decode(signature)
+    except (ValueError, KeyError, TypeError):
+        return None
+    return claims, signature
+
+def _signed_claims(token: str, secret: Optional[str] = None) -> Optional[dict]:
+    """Claims of a token with a valid signature, expired or not"""
+    parsed = _parse_token(token)
+    if parsed is None:
+        return None
+    claims, signature = parsed
+    header, payload, _ = token.split(".")
+    expected = _sign(f"{header}.{payload}".encode("ascii"), secret or session_secret())
+    return claims if hmac.compare_digest(signature, expected) else None
+
+def decode_session_token(token: str, secret: Optional[str] = None) -> Optional[dict]:
+    """
+    Check a session token's signature, expiry and revocation
+    Returns its claims, or None if the token is not valid. Never touches
+    the database.
+    """
+    claims = _signed_claims(token, secret)
+    if claims is None or claims["exp"] <= time.time() or revoked_tokens.is_revoked(claims):
+        return None
+    return claims
+
+def is_stale_session_token(token: str, secret: Optional[str] = None) -> bool:
+    """
+    True for a well-formed token that has run out (and wasn't revoked), or
+    that was signed with another secret, e.g. before SESSION_SECRET changed
+    """
+    if _parse_token(token) is None:
+        return False
+    claims = _signed_claims(token, secret)
+    if claims is None:
+        return True
+    return claims["exp"] <= time.time() and not revoked_tokens.is_revoked(claims)
+
+def verify_session_token(token: str, secret: Optional[str] = None) -> Optional[int]:
+    """User id of a valid session token, else None"""
+    claims = decode_session_token(token, secret)
+    return claims["sub"] if claims else None
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark GET /analytics/{user_id} against transaction history size
+
+Compares the original row-by-row implementation (load every transaction,
+one Card query per row) with the endpoint, which sums the per-day
+rollups. Uses a throwaway database in a temp dir.
+
+    python3 bench_analytics.py [transactions ...]
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+os.chdir(tempfile.mkdtemp(prefix="wallzy-bench-"))
+sys.path.insert(0, str(BACKEND_DIR))
+
+import seed_data
+
+with contextlib.redirect_stdout(io.StringIO()):
+    seed_data.seed_database()
+
+import database
+import main
+import mcc_data
+import rollups
+
+USER_ID = 2
+
+def legacy_analytics(user_id, db):
+    """The pre-aggregation implementation, kept for comparison"""
+    transactions = db.query(database.Transaction).filter(database.Transaction.user_id == user_id).all()
+    by_category = {}
+    by_card = {}
+    for txn in transactions:
+        entry = by_category.setdefault(txn.category, [0, 0, 0])
+        entry[0] += 1
+        entry[1] += txn.amount_cents
+        entry[2] += txn.rewards
+    for txn in transactions:
+        card = db.query(database.Card).filter(database.Card.id == txn.card_id).first()
+        entry = by_card.setdefault(card.card_name if card else "Unknown", [0, 0, 0])
+        entry[0] += 1
+        entry[1] += txn.amount_cents
+        entry[2] += txn.rewards
+    return sum(t.amount_cents for t in transactions), by_category, by_card
+
+def fill_history(db, count):
+    """Top the user's history up to `count` transactions"""
+    existing = db.query(database.Transaction).filter(database.Transaction.user_id == USER_ID).count()
+    card_ids = [c.id for c in db.query(database.Card).filter(database.Card.user_id == USER_ID)]
+    mccs = [codes[0] for codes in mcc_data.MCC_CATEGORIES.values() if codes]
+    start = datetime(2023, 1, 1, 12)
+    rows = []
+    for _ in range(count - existing):
+        mcc = random.choice(mccs)
+        amount = random.randint(500, 50000)
+        rows.append({
+            "user_id": USER_ID,
+            "card_id": random.choice(card_ids),
+            "amount_cents": amount,
+            "mcc_code": mcc,
+            "category": mcc_data.get_category_from_mcc(mcc),
+            "rewards": amount // 100,
+            "multiplier": 1.0,
+            "transaction_date": start + timedelta(days=random.randint(0, 3 * 365)),
+        })
+    if rows:
+        db.bulk_insert_mappings(database.Transaction, rows)
+        rollups.add_rows(db, rows)
+        db.commit()
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000]
+    db = database.SessionLocal()
+    print(f"{'transactions':>12}  {'row-by-row':>12}  {'rollups':>12}")
+    for size in sizes:
+        fill_history(db, size)
+        db.expire_all()
+        legacy = timed(lambda: legacy_analytics(USER_ID, db), 1)
+        current = timed(lambda: main.get_user_analytics(USER_ID, db), 3)
+        print(f"{size:>12}  {legacy * 1000:>9.1f} ms  {current * 1000:>9.1f} ms")
+    db.close()
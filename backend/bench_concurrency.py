@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark concurrent tap writes mixed with analytics reads
+
+Runs the same workload under the old SQLite defaults (rollback journal,
+synchronous=FULL, small cache) and the tuned settings in database.py
+(WAL, synchronous=NORMAL, mmap, larger cache and pool). Each
+configuration runs in its own process against a throwaway database.
+
+    python3 bench_concurrency.py [seconds] [writers] [readers]
+"""
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+CONFIGS = {
+    "defaults": {
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLITE_MMAP_SIZE": "0",
+        "SQLITE_CACHE_SIZE": "-2000",
+        "DB_POOL_SIZE": "5",
+        "DB_MAX_OVERFLOW": "10",
+    },
+    "tuned": {},
+}
+
+def run_worker(seconds, writers, readers):
+    os.chdir(tempfile.mkdtemp(prefix="wallzy-bench-"))
+    sys.path.insert(0, str(BACKEND_DIR))
+    import seed_data
+    with contextlib.redirect_stdout(io.StringIO()):
+        seed_data.seed_database()
+
+    from fastapi import Response
+    import database
+    import main
+
+    user_id = 2
+    card_ids = [c.id for c in database.SessionLocal().query(database.Card).filter(database.Card.user_id == user_id)]
+    counts = {"writes": 0, "reads": 0, "errors": 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def bump(key):
+        with lock:
+            counts[key] += 1
+
+    def writer(n):
+        i = 0
+        while not stop.is_set():
+            db = database.SessionLocal()
+            try:
+                main.create_transaction(main.TransactionCreate(
+                    user_id=user_id, card_id=card_ids[(n + i) % len(card_ids)],
+                    amount_cents=1000 + i, mcc_code="5411"
+                ), db=db)
+                bump("writes")
+            except Exception:
+                db.rollback()
+                bump("errors")
+            finally:
+                db.close()
+            i += 1
+
+    def reader(n):
+        while not stop.is_set():
+            db = database.ReadSessionLocal()
+            try:
+                main.get_user_analytics(user_id, db=db)
+                main.get_user_transactions(user_id, Response(), limit=50, cursor=None, db=db)
+                bump("reads")
+            except Exception:
+                bump("errors")
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    threads += [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    print(json.dumps(counts))
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        run_worker(float(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]))
+        sys.exit(0)
+
+    seconds = sys.argv[1] if len(sys.argv) > 1 else "5"
+    writers = sys.argv[2] if len(sys.argv) > 2 else "4"
+    readers = sys.argv[3] if len(sys.argv) > 3 else "8"
+    print(f"{seconds}s, {writers} writer(s), {readers} reader(s)")
+    print(f"{'config':<10} {'writes/s':>10} {'reads/s':>10} {'errors':>8}")
+    for name, env in CONFIGS.items():
+        output = subprocess.run(
+            [sys.executable, __file__, "--worker", seconds, writers, readers],
+            env={**os.environ, **env}, capture_output=True, text=True, check=True
+        ).stdout
+        counts = json.loads(output.strip().splitlines()[-1])
+        duration = float(seconds)
+        print(f"{name:<10} {counts['writes'] / duration:>10.1f} {counts['reads'] / duration:>10.1f} {counts['errors']:>8}")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark reward extraction on saved issuer pages
+
+Compares the original extractor (full html.parser tree, one soup.select
+per selector, keyword check per element) with parse_html() +
+_extract_reward_texts(), which builds only candidate tags and walks them
+once. The fixture pages are small, so by default each one is padded with
+navigation/footer/script boilerplate to the size of a real product page;
+pass saved pages to measure those as they are.
+
+    python3 bench_extract.py [page.html ...]
+"""
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+BACKEND_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+import scraper
+
+FIXTURES = BACKEND_DIR / "fixtures" / "bofa"
+PADDING_BLOCKS = 250  # ~250 KB per page, about what a live product page weighs
+
+def legacy_extract(html, card_name):
+    """The pre-strainer implementation, kept for comparison"""
+    soup = BeautifulSoup(html, 'html.parser')
+    rewards = []
+    selectors = [
+        'div[class*="reward"]',
+        'div[class*="benefit"]',
+        'div[class*="cash-back"]',
+        'p[class*="reward"]',
+        'li[class*="benefit"]',
+        'span[class*="percent"]'
+    ]
+    for selector in selectors:
+        for elem in soup.select(selector):
+            text = elem.get_text(strip=True)
+            if text and any(keyword in text.lower() for keyword in ['%', 'cash', 'points', 'reward', 'bonus']):
+                rewards.append({
+                    'issuer': 'Bank of America',
+                    'card_name': card_name,
+                    'raw_text': text,
+                    'scraped_at': datetime.now().isoformat()
+                })
+    return rewards
+
+def boilerplate(blocks):
+    """Markup a product page carries around its reward copy"""
+    block = (
+        '<nav class="global-nav"><ul>' + ''.join(f'<li class="nav-item"><a href="/p{i}">Link {i}</a></li>' for i in range(12)) + '</ul></nav>'
+        '<div class="promo-banner"><p class="legal">Terms apply. See offer details.</p><span class="icon"></span></div>'
+        '<script>window.dataLayer = window.dataLayer || []; dataLayer.push({"event": "view"});</script>'
+        '<footer><div class="footer-links"><a href="/privacy">Privacy</a> <a href="/security">Security</a></div>'
+        '<p>Credit card offers are subject to credit approval.</p></footer>'
+    )
+    return block * blocks
+
+def load_pages(paths):
+    if paths:
+        return {Path(p).name: Path(p).read_text() for p in paths}
+    padding = boilerplate(PADDING_BLOCKS)
+    return {
+        page.name: page.read_text().replace("<body>", "<body>" + padding, 1)
+        for page in sorted(FIXTURES.glob("*.html"))
+    }
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def current_extract(html, parser):
+    bofa = scraper.BankOfAmericaScraper()
+    soup = BeautifulSoup(html, parser, parse_only=scraper.REWARD_STRAINER)
+    return bofa._extract_reward_texts(soup, "bench")
+
+if __name__ == "__main__":
+    pages = load_pages(sys.argv[1:])
+    parsers = ["html.parser"]
+    try:
+        import lxml  # noqa: F401
+        parsers.append("lxml")
+    except ImportError:
+        print("lxml not installed; timing html.parser only")
+
+    header = f"{'page':<40}  {'KB':>6}  {'legacy':>10}" + "".join(f"  {p:>12}" for p in parsers)
+    print(header)
+    for name, html in pages.items():
+        legacy_texts = list(dict.fromkeys(r["raw_text"] for r in legacy_extract(html, "bench")))
+        assert all([r["raw_text"] for r in current_extract(html, p)] == legacy_texts for p in parsers), name
+        legacy = timed(lambda: legacy_extract(html, "bench"), 3)
+        current = [timed(lambda: current_extract(html, p), 3) for p in parsers]
+        print(f"{name:<40}  {len(html) // 1024:>6}  {legacy * 1000:>7.1f} ms"
+              + "".join(f"  {t * 1000:>9.1f} ms" for t in current))
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark RewardParser throughput on a large corpus of reward strings
+
+Compares the original parser (uncompiled patterns, one search per
+category, category table rebuilt per call) with parse_reward_text() and
+parse_many(), which also parses repeated texts only once. The corpus
+mixes the fixture pages' reward texts with generated variations; every
+text is checked to parse the same both ways.
+
+    python3 bench_parser.py [texts ...]
+"""
+import random
+import re
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from scraper import BankOfAmericaScraper, RewardParser
+
+FIXTURES = BACKEND_DIR / "fixtures" / "bofa"
+
+def legacy_parse(text):
+    """The pre-compiled implementation, kept for comparison"""
+    result = {
+        'multiplier': None,
+        'category': None,
+        'end_date': None,
+        'cap_cents': None
+    }
+    percent_match = re.search(r'(\d+(?:\.\d+)?)\s*%', text)
+    if percent_match:
+        result['multiplier'] = float(percent_match.group(1))
+    points_match = re.search(r'(\d+(?:\.\d+)?)\s*points?\s*(?:per|for|\/)\s*\$1', text, re.IGNORECASE)
+    if points_match:
+        result['multiplier'] = float(points_match.group(1))
+    categories = {
+        'dining': r'\b(dining|restaurants?|food)\b',
+        'groceries': r'\b(grocery|groceries|supermarket)\b',
+        'gas': r'\b(gas|fuel|gas stations?)\b',
+        'online_shopping': r'\b(online shopping|online purchases?)\b',
+        'drugstores': r'\b(drug stores?|pharmacy|pharmacies)\b',
+        'entertainment': r'\b(entertainment|movies?|concerts?)\b',
+        'streaming': r'\b(streaming|subscription)\b',
+        'other': r'(all other|everything else|other purchases|all purchases|for all|on all|unlimited)'
+    }
+    for category, pattern in categories.items():
+        if re.search(pattern, text, re.IGNORECASE):
+            result['category'] = category
+            break
+    cap_match = re.search(r'\$\s*(\d+(?:,\d{3})*(?:\.\d{2})?)', text)
+    if cap_match and 'quarter' in text.lower():
+        result['cap_cents'] = int(float(cap_match.group(1).replace(',', '')) * 100)
+    for pattern in [r'until\s+(\w+\s+\d{1,2},?\s+\d{4})',
+                    r'through\s+(\w+\s+\d{1,2},?\s+\d{4})',
+                    r'expires?\s+(\w+\s+\d{1,2},?\s+\d{4})']:
+        date_match = re.search(pattern, text, re.IGNORECASE)
+        if date_match:
+            try:
+                result['end_date'] = datetime.strptime(date_match.group(1), "%B %d, %Y").strftime("%Y-%m-%d")
+            except ValueError:
+                pass
+    if result['multiplier'] is not None:
+        return result
+    return None
+
+def fixture_texts():
+    scraper = BankOfAmericaScraper()
+    texts = []
+    for page in sorted(FIXTURES.glob("*.html")):
+        soup = scraper.parse_html(page.read_text())
+        texts += [r["raw_text"] for r in scraper._extract_reward_texts(soup, page.stem)]
+    return texts
+
+RATES = ["1%", "1.5%", "2%", "3%", "5%", "2 points per $1", "3X points for $1", "1 point / $1"]
+PLACES = ["dining", "restaurants", "grocery stores", "supermarkets", "gas stations", "fuel",
+          "online shopping", "drug stores", "pharmacies", "movies", "concerts", "streaming services",
+          "travel", "all other purchases", "everything else", "transit"]
+TAILS = ["", " on up to $1,500 in combined purchases each quarter", " until December 31, 2025",
+         " through March 1, 2026", " offer expires June 30 2026", " after you spend $3,000 in 90 days",
+         " — terms apply, see rewards program rules"]
+
+def corpus(size, seed=7):
+    rng = random.Random(seed)
+    texts = fixture_texts()
+    while len(texts) < size:
+        places = " and ".join(rng.sample(PLACES, rng.choice([1, 1, 2])))
+        texts.append(f"Earn {rng.choice(RATES)} cash back on {places}{rng.choice(TAILS)}")
+    return texts[:size]
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    print(f"{'texts':>8}  {'unique':>8}  {'legacy':>14}  {'compiled':>14}  {'parse_many':>14}")
+    for size in sizes:
+        texts = corpus(size)
+        assert [legacy_parse(t) for t in texts] == RewardParser.parse_many(texts)
+        legacy = timed(lambda: [legacy_parse(t) for t in texts], 3)
+        compiled = timed(lambda: [RewardParser.parse_reward_text(t) for t in texts], 3)
+        batch = timed(lambda: RewardParser.parse_many(texts), 3)
+        print(f"{size:>8}  {len(set(texts)):>8}" + "".join(f"  {size / t:>9.0f} /s " for t in (legacy, compiled, batch)))
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark reward scoring throughput (scores per second)
+
+Compares the original per-purchase loop over rule_index candidates
+(recomputing each card's base rate on every call) with a compiled
+scoring.Scorer, one purchase at a time and through score_many(). Runs
+with and without capped rules in the list; every purchase is checked to
+score the same both ways.
+
+    python3 bench_scoring.py [purchases] [rules]
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+import scoring
+import spend_caps
+from rule_index import Candidate
+
+def legacy_best(candidates, amount_cents, spent):
+    """The pre-scoring implementation, kept for comparison"""
+    bases = {}
+    for candidate in candidates:
+        if candidate.category == "other" and candidate.cap_cents is None:
+            bases[candidate.card_id] = max(bases.get(candidate.card_id, 0.0), candidate.multiplier)
+    best = None
+    best_multiplier = 0
+    best_cashback = 0
+    for candidate in candidates:
+        if candidate.cap_cents is None or spent is None:
+            multiplier = candidate.multiplier
+            cashback = int((amount_cents * multiplier) / 100)
+        else:
+            cashback, multiplier = spend_caps.capped_reward(
+                amount_cents, candidate.multiplier, candidate.cap_cents,
+                spent.get(candidate.rule_id, 0), bases.get(candidate.card_id, 0.0)
+            )
+        if cashback > best_cashback or (cashback == best_cashback and multiplier > best_multiplier):
+            best = candidate
+            best_multiplier = multiplier
+            best_cashback = cashback
+    return best, best_cashback, best_multiplier
+
+def make_candidates(count, capped):
+    """A ranked "dining" list: dining rules plus each card's "other" rule"""
+    rng = random.Random(7)
+    candidates = []
+    for rule_id in range(count):
+        card_id = rule_id // 2
+        category = "other" if rule_id % 2 else "dining"
+        multiplier = 1.0 + (rule_id % 3) * 0.5 if category == "other" else rng.choice([2.0, 3.0, 4.0, 5.0])
+        cap_cents = 250000 if capped and category == "dining" and multiplier >= 4.0 else None
+        candidates.append(Candidate(card_id, f"Card {card_id}", "Issuer", rule_id, category,
+                                    multiplier, cap_cents, None, None))
+    return sorted(candidates, key=lambda c: (-c.multiplier, c.card_id, c.rule_id))
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == "__main__":
+    purchases = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rules = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    rng = random.Random(11)
+    amounts = [rng.randint(500, 50000) for _ in range(purchases)]
+
+    print(f"{purchases} purchases, {rules} candidate rules")
+    print(f"{'rules':<10}  {'legacy':>14}  {'score()':>14}  {'score_many()':>14}")
+    for label, capped in (("uncapped", False), ("capped", True)):
+        candidates = make_candidates(rules, capped)
+        spent = {c.rule_id: 200000 for c in candidates if c.cap_cents is not None}
+        scorer = scoring.Scorer(candidates)
+        assert [legacy_best(candidates, a, spent) for a in amounts] == [scorer.score(a, spent) for a in amounts]
+        assert list(zip(*scorer.score_many(amounts, spent))) == [scorer.score(a, spent) for a in amounts]
+
+        legacy = timed(lambda: [legacy_best(candidates, a, spent) for a in amounts])
+        single = timed(lambda: [scorer.score(a, spent) for a in amounts])
+        many = timed(lambda: scorer.score_many(amounts, spent))
+        print(f"{label:<10}" + "".join(f"  {purchases / t:>10,.0f}/s" for t in (legacy, single, many)))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark tap-to-recommendation latency
+
+Compares the legacy file chain (write hello.json -> json_watcher ->
+POST /recommend -> re-read hello.json) with the direct POST /taps path,
+timed until the tap consumer has recorded the tap.
+Runs a real uvicorn server against a throwaway database in a temp dir.
+
+    python3 bench_tap_latency.py [taps]
+"""
+import contextlib
+import io
+import json
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+WORK_DIR = Path(tempfile.mkdtemp(prefix="wallzy-bench-"))
+HELLO_JSON = WORK_DIR / "hello.json"
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+PORT = free_port()
+API_BASE = f"http://127.0.0.1:{PORT}"
+
+# Point the backend and the watcher at the temp dir before importing them
+os.chdir(WORK_DIR)
+os.environ["HELLO_JSON"] = str(HELLO_JSON)
+os.environ["WALLZY_API"] = API_BASE
+sys.path.insert(0, str(BACKEND_DIR))
+HELLO_JSON.write_text(json.dumps({"uid": "08278ABB", "mcc": "5411", "ts": 0}))
+
+import requests
+import uvicorn
+from watchdog.observers import Observer
+
+import json_watcher
+import seed_data
+
+with contextlib.redirect_stdout(io.StringIO()):
+    seed_data.seed_database()
+
+import main
+
+def start_server():
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=PORT, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+def summarize(name, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<28} median {statistics.median(samples) * 1000:8.2f} ms   p95 {p95 * 1000:8.2f} ms")
+
+def bench_file_chain(taps):
+    done = threading.Event()
+    expected = {"ts": None}
+
+    class TimedHandler(json_watcher.HelloJsonHandler):
+        def on_modified(self, event):
+            super().on_modified(event)
+            if json_watcher.last_processed_timestamp == expected["ts"]:
+                done.set()
+
+    observer = Observer()
+    observer.schedule(TimedHandler(), str(WORK_DIR), recursive=False)
+    observer.start()
+    samples = []
+    try:
+        for ts in range(1, taps + 1):
+            done.clear()
+            expected["ts"] = ts
+            start = time.perf_counter()
+            HELLO_JSON.write_text(json.dumps({"uid": "08278ABB", "mcc": "5411", "ts": ts}, indent=2))
+            if not done.wait(timeout=5):
+                continue  # tap lost by the watcher
+            samples.append(time.perf_counter() - start)
+    finally:
+        observer.stop()
+        observer.join()
+    return samples
+
+def bench_direct(taps):
+    session = requests.Session()
+    samples = []
+    # Fresh timestamps so no tap is answered from an earlier receipt
+    for ts in range(taps + 1, 2 * taps + 1):
+        start = time.perf_counter()
+        response = session.post(f"{API_BASE}/taps", json={"uid": "08278ABB", "mcc": "5411", "ts": ts})
+        response.raise_for_status()
+        if not main.tap_consumer.wait_for(response.json()["seq"]):
+            continue
+        samples.append(time.perf_counter() - start)
+    return samples
+
+if __name__ == "__main__":
+    taps = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    server = start_server()
+    with contextlib.redirect_stdout(io.StringIO()):
+        file_samples = bench_file_chain(taps)
+        direct_samples = bench_direct(taps)
+    server.should_exit = True
+
+    print(f"Tap-to-recommendation latency over {taps} taps")
+    summarize(f"hello.json chain ({len(file_samples)}/{taps})", file_samples)
+    summarize(f"POST /taps ({len(direct_samples)}/{taps})", direct_samples)
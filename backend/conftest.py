@@ -0,0 +1,111 @@
+"""
+Shared test fixtures: a scratch SQLite database per test
+
+engine is created with the app's settings and the current schema;
+test_backends overrides it to run the same tests against PostgreSQL.
+Tokens are signed with a fixed secret. The seeding fixtures (categories,
+user_id, account, tap_account) return ids; modules add the rest of their rows in
+fixtures of their own.
+"""
+from typing import NamedTuple
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+import auth
+import database
+import rule_index
+
+
+@pytest.fixture(autouse=True)
+def session_secret(monkeypatch):
+    # Sign tokens with a fixed secret rather than writing one next to the tests
+    monkeypatch.setattr(auth, "_session_secret", "test-session-secret")
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    engine = database.create_db_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    database.init_db(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def engine(sqlite_engine):
+    return sqlite_engine
+
+
+@pytest.fixture
+def session_factory(engine):
+    # Ids repeat across scratch databases, so never serve another test's cached rules
+    rule_index.invalidate_all()
+    yield sessionmaker(bind=engine)
+    rule_index.invalidate_all()
+
+
+@pytest.fixture
+def db(session_factory):
+    """A session on the scratch database"""
+    session = session_factory()
+    yield session
+    session.close()
+
+
+class Account(NamedTuple):
+    """Ids of a seeded user and their card"""
+    user_id: int
+    card_id: int
+
+
+@pytest.fixture
+def categories(db):
+    """{name: id} of the dining, groceries and other categories"""
+    rows = [database.Category(name=name, mcc_codes="") for name in ("dining", "groceries", "other")]
+    db.add_all(rows)
+    db.commit()
+    return {row.name: row.id for row in rows}
+
+
+@pytest.fixture
+def user_id(db):
+    """Id of a user with no cards"""
+    user = database.User(email="user@example.com", name="user", hashed_password="x")
+    db.add(user)
+    db.commit()
+    return user.id
+
+
+@pytest.fixture
+def account(db, user_id):
+    """A user with one card and no rules yet"""
+    card = database.Card(user_id=user_id, issuer="Issuer", card_name="Card", last_four="0001")
+    db.add(card)
+    db.commit()
+    return Account(user_id, card.id)
+
+
+@pytest.fixture
+def tap_account(db, user_id):
+    """User 2, whom process_tap charges taps from unknown cards to, with one card"""
+    user = database.User(email="taps@example.com", name="taps", hashed_password="x")
+    db.add(user)
+    db.flush()
+    card = database.Card(user_id=user.id, issuer="Issuer", card_name="Tap card", last_four="0002")
+    db.add(card)
+    db.commit()
+    return Account(user.id, card.id)
+
+
+@pytest.fixture
+def statements(engine):
+    """SQL statements run on the engine, in order; clear() it before the part being counted"""
+    captured = []
+
+    def capture(conn, cursor, statement, *args):
+        captured.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    yield captured
+    event.remove(engine, "before_cursor_execute", capture)
@@ -0,0 +1,163 @@
+"""
+Concurrent HTTP fetcher for the reward scrapers
+
+A pooled requests.Session (keep-alive) shared by a thread pool. The pool
+size is the global concurrency cap; requests to one host are spaced at
+least SCRAPER_HOST_INTERVAL apart, and transient failures (connection
+errors, 429 and 5xx) are retried with exponential backoff and full jitter.
+"""
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, Mapping, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+SCRAPER_MAX_CONCURRENCY = int(os.getenv("SCRAPER_MAX_CONCURRENCY", "8"))
+SCRAPER_HOST_INTERVAL = float(os.getenv("SCRAPER_HOST_INTERVAL", "0.5"))  # seconds between requests to one host
+SCRAPER_MAX_RETRIES = int(os.getenv("SCRAPER_MAX_RETRIES", "3"))
+SCRAPER_BACKOFF = float(os.getenv("SCRAPER_BACKOFF", "0.5"))  # base delay, doubled per retry
+SCRAPER_MAX_BACKOFF = float(os.getenv("SCRAPER_MAX_BACKOFF", "10"))
+SCRAPER_TIMEOUT = float(os.getenv("SCRAPER_TIMEOUT", "10"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class FetchResult(NamedTuple):
+    url: str
+    status: Optional[int]  # None when no response was received
+    text: Optional[str]
+    error: Optional[str]
+    attempts: int
+    elapsed: float  # seconds, including retries and rate-limit waits
+    headers: Optional[Mapping[str, str]] = None  # response headers (case-insensitive)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class HostRateLimiter:
+    """Spaces request starts to the same host at least `interval` apart"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_slot: Dict[str, float] = {}
+
+    def wait(self, host: str):
+        # Reserve the next free slot under the lock, sleep outside it
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Fetcher:
+    """
+    Fetch many URLs concurrently
+    Use as a context manager, or call close() to release the threads and
+    pooled connections.
+    """
+
+    def __init__(self, headers: Optional[Dict[str, str]] = None,
+                 max_concurrency: int = SCRAPER_MAX_CONCURRENCY,
+                 host_interval: float = SCRAPER_HOST_INTERVAL,
+                 max_retries: int = SCRAPER_MAX_RETRIES,
+                 backoff: float = SCRAPER_BACKOFF,
+                 max_backoff: float = SCRAPER_MAX_BACKOFF,
+                 timeout: float = SCRAPER_TIMEOUT):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = HostRateLimiter(host_interval)
+
+        self.session = requests.Session()
+        # One pooled connection per worker; retries are handled in fetch()
+        adapter = HTTPAdapter(pool_connections=max_concurrency, pool_maxsize=max_concurrency, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="fetcher")
+
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        # Full jitter: uniform in [0, backoff * 2^attempt]
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        """GET one URL with rate limiting and retries; never raises"""
+        started = time.perf_counter()
+        host = urlsplit(url).netloc
+        attempt = 0
+        while True:
+            attempt += 1
+            self.rate_limiter.wait(host)
+            response = None
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+                if response.status_code < 400:  # includes 304 Not Modified, with an empty body
+                    return FetchResult(url, response.status_code, response.text, None, attempt,
+                                       time.perf_counter() - started, response.headers)
+                error = f"HTTP {response.status_code}"
+                if response.status_code not in RETRY_STATUSES:
+                    return FetchResult(url, response.status_code, None, error, attempt, time.perf_counter() - started)
+            except requests.RequestException as e:
+                error = str(e)
+
+            if attempt > self.max_retries:
+                status = response.status_code if response is not None else None
+                return FetchResult(url, status, None, error, attempt, time.perf_counter() - started)
+            time.sleep(self._retry_delay(attempt - 1, response))
+
+    def iter_fetch(self, urls: Dict[str, str], headers: Optional[Dict[str, Dict[str, str]]] = None,
+                   window: Optional[int] = None) -> Iterator[Tuple[str, FetchResult]]:
+        """
+        Fetch {key: url} concurrently, yielding (key, result) as each completes
+        `headers` adds per-key request headers (e.g. conditional GET validators).
+        At most `window` (default twice the concurrency) fetches are submitted
+        or finished but not yet consumed, so a slow consumer holds back the
+        fetching instead of piling up page bodies.
+        """
+        headers = headers or {}
+        window = window or self.max_concurrency * 2
+        pending = {}
+        remaining = iter(urls.items())
+
+        def submit(count):
+            for key, url in itertools.islice(remaining, count):
+                pending[self._executor.submit(self.fetch, url, headers.get(key))] = key
+
+        submit(window)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = pending.pop(future)
+                yield key, future.result()
+                submit(1)
+
+    def fetch_all(self, urls: Dict[str, str]) -> Dict[str, FetchResult]:
+        """Fetch {key: url} concurrently and return {key: result}"""
+        return dict(self.iter_fetch(urls))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,127 @@
+"""
+In-process background jobs for long-running work such as the scraper
+
+Jobs run one at a time on a single worker thread; the HTTP request that
+starts one gets its id back immediately and polls for progress. Only one
+job of a kind may be queued or running at once. Finished jobs are kept
+(up to JOB_HISTORY) so their results can still be read.
+"""
+import os
+import threading
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "100"))
+
+
+class JobAlreadyRunning(Exception):
+    """Raised when a job of the same kind is already queued or running"""
+
+    def __init__(self, job: "Job"):
+        super().__init__(f"A {job.kind} job is already {job.status} ({job.id})")
+        self.job = job
+
+
+class Job:
+    """State of one background job; updated by the job function as it runs"""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"  # queued -> running -> succeeded | failed (or cancelled)
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.total: Optional[int] = None  # steps expected, if known
+        self.steps: List[Dict] = []
+        self.result = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def record_step(self, name: str, status: str, seconds: float, **details):
+        """Report one finished unit of work (e.g. one card page)"""
+        with self._lock:
+            self.steps.append({"name": name, "status": status, "seconds": round(seconds, 3), **details})
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            steps = list(self.steps)
+        elapsed_until = self.finished_at or datetime.now()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "elapsed_seconds": round((elapsed_until - self.started_at).total_seconds(), 3) if self.started_at else None,
+            "progress": {"done": len(steps), "total": self.total},
+            "steps": steps,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobRunner:
+    """Single-worker executor that tracks its jobs by id"""
+
+    def __init__(self, history: int = JOB_HISTORY):
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jobs")
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: Dict[str, Job] = {}  # kind -> queued or running job
+
+    def submit(self, kind: str, fn: Callable[[Job], object]) -> Job:
+        """
+        Queue fn(job) and return the job right away
+        fn's return value becomes job.result; raises JobAlreadyRunning if a
+        job of this kind hasn't finished yet.
+        """
+        with self._lock:
+            active = self._active.get(kind)
+            if active is not None:
+                raise JobAlreadyRunning(active)
+            job = Job(kind)
+            self._active[kind] = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.finished_at is None:
+                    break
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], object]):
+        job.started_at = datetime.now()
+        job.status = "running"
+        try:
+            job.result = fn(job)
+            status = "succeeded"
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+            status = "failed"
+        job.finished_at = datetime.now()
+        job.status = status
+        with self._lock:
+            self._active.pop(job.kind, None)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self, wait: bool = True, cancel_pending: bool = True):
+        """Stop the worker; jobs that never started are marked cancelled"""
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_pending)
+        with self._lock:
+            for kind, job in list(self._active.items()):
+                if job.status == "queued":
+                    job.status = "cancelled"
+                    job.finished_at = datetime.now()
+                    del self._active[kind]
@@ -1,4 +1,10 @@
+"""
+Legacy tap path: watch hello.json and trigger /recommend on every change.
+The BLE bridge now posts taps straight to /taps, so this is only needed
+when the bridge runs with HELLO_JSON_AUDIT=1 against an older backend.
+"""
 import json
+import os
 import requests
 from pathlib import Path
 from datetime import datetime
@@ -6,8 +12,8 @@ from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
 # Configuration
-HELLO_JSON_PATH = Path("../firmware/hello.json").resolve()
-API_BASE = "http://localhost:8000"
+HELLO_JSON_PATH = Path(os.getenv("HELLO_JSON", "../firmware/hello.json")).expanduser().resolve()
+API_BASE = os.getenv("WALLZY_API", "http://localhost:8000")
 
 # Track last processed timestamp
 last_processed_timestamp = None
@@ -1,17 +1,54 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.exc import IntegrityError, OperationalError, TimeoutError as PoolTimeout
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
 from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Union
+from datetime import date, datetime, timedelta
+import base64
 import json
+import logging
+import os
 import random
 import database
 import mcc_data
 import auth
-from scraper import BankOfAmericaScraper, RewardParser
+import jobs
+import reconcile
+import rollups
+import rule_index
+import rule_schedule
+import scrape_pipeline
+import spend_caps
+import tap_queue
+from scraper import BankOfAmericaScraper
 
-app = FastAPI(title="SmartCard API", version="1.0.0")
+logger = logging.getLogger(__name__)
+
+# Keep this module's body free of side effects: the process pools for
+# bcrypt and scraper parsing use spawn, and every spawned worker imports
+# it again. Schema setup and the tap queue start with the app instead.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(init_database)
+    start_tap_consumer()
+    try:
+        yield
+    finally:
+        stop_tap_consumer()
+        auth.hash_pool.shutdown()
+        scrape_pipeline.shutdown_parse_pool()
+        job_runner.shutdown(wait=False)
+        if database.async_read_engine is not None:
+            await database.async_read_engine.dispose()
+
+app = FastAPI(title="SmartCard API", version="1.0.0", lifespan=lifespan)
 
 # CORS middleware for frontend
 app.add_middleware(
@@ -20,18 +57,41 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# Initialize database
-database.init_db()
+def init_database():
+    # Load (or create) the token secret now, so a bad SESSION_SECRET_PATH fails the start
+    auth.session_secret()
+    database.init_db()
+    with database.SessionLocal() as db:
+        rollups.backfill_if_empty(db)
+
+# Durable queue that absorbs tap bursts from the BLE bridge (opened at startup)
+tap_log: Optional[tap_queue.TapQueue] = None
+
+# Background work started by requests (scraper runs); threads start on first use
+job_runner = jobs.JobRunner()
+
+def db_mode_route(mode: str, route):
+    """
+    Apply a route decorator only when DB_MODE selects this implementation
+    Hot endpoints have a sync and an async variant on the same path; the
+    async reads query an AsyncSession, the async writes run the shared
+    sync code in the threadpool
+    """
+    return route if database.DB_MODE == mode else (lambda endpoint: endpoint)
 
 # Helper functions
+# Path to hello.json in the firmware directory (overridable like the BLE bridge)
+HELLO_JSON_PATH = os.getenv(
+    "HELLO_JSON",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "firmware", "hello.json")
+)
+
 def read_json():
     """Read data from hello.json file"""
-    import os
-    # Path to hello.json in the firmware directory
-    json_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "firmware", "hello.json")
-    with open(json_path, "r") as f:
+    with open(HELLO_JSON_PATH, "r") as f:
         return json.load(f)
 
 def get_random_merchant_name(category):
@@ -142,19 +202,25 @@ class UserResponse(BaseModel):
     email: str
     name: str
 
+class LoginResponse(UserResponse):
+    access_token: str
+    token_type: str = "bearer"
+    expires_at: int  # Unix seconds; refresh before then via /sessions/refresh
+
 class CardCreate(BaseModel):
     issuer: str
     card_name: str
     last_four: str
     expiry_date: Optional[str] = None
     cvv: Optional[str] = None
+    opened_date: Optional[date] = None  # places intro-period rules
 
 class CardRuleCreate(BaseModel):
     category: str
     multiplier: float
     cap_cents: Optional[int] = None
-    start_date: Optional[str] = None
-    end_date: Optional[str] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
     intro_duration_months: Optional[int] = None
     requires_activation: bool = False
     priority: int = 0
@@ -173,6 +239,36 @@ class RecommendResponse(BaseModel):
     category: str
     reason: str
 
+class TapPayload(BaseModel):
+    uid: str
+    mcc: Union[str, int]
+    ts: int  # ms since the epoch, stamped by the bridge when the card is read; (uid, ts) identifies the tap
+
+class TapAccepted(BaseModel):
+    seq: int
+    depth: int
+
+class BatchRecommendRequest(BaseModel):
+    items: List[RecommendRequest]
+    persist: bool = False
+
+class BatchRecommendResult(BaseModel):
+    user_id: int
+    mcc_code: str
+    amount_cents: int
+    category: str
+    recommended_card_id: Optional[int] = None
+    card_name: Optional[str] = None
+    issuer: Optional[str] = None
+    multiplier: Optional[float] = None
+    cashback_cents: int = 0
+    reason: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchRecommendResponse(BaseModel):
+    results: List[BatchRecommendResult]
+    persisted_count: int
+
 class TransactionCreate(BaseModel):
     user_id: int
     card_id: int
@@ -205,23 +301,117 @@ def root():
             "/users",
             "/users/{user_id}/cards",
             "/recommend",
+            "/recommend/batch",
+            "/taps",
             "/mcc/{mcc_code}",
             "/scraper/run",
+            "/scraper/jobs/{job_id}",
+            "/scraper/reconcile",
             "/scraper/results"
         ]
     }
 
+@app.exception_handler(auth.HashPoolBusy)
+def hash_pool_busy(request, exc: auth.HashPoolBusy):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+# With AUTH_REQUIRED=1 every per-user endpoint needs a session token from
+# /login. Otherwise requests without one are still served (older app
+# builds), and so are requests whose token has merely expired or was signed
+# with an older secret; any other token that is sent must be valid and match
+# the user.
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "0") == "1"
+bearer_scheme = HTTPBearer(auto_error=False)
+
+def unauthorized(detail: str = "Invalid or expired session") -> HTTPException:
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+def session_claims(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)) -> Optional[dict]:
+    """Claims of the request's session token; checked in memory, no DB access"""
+    if credentials is None:
+        if AUTH_REQUIRED:
+            raise unauthorized("Not authenticated")
+        return None
+    claims = auth.decode_session_token(credentials.credentials)
+    if claims is None:
+        if not AUTH_REQUIRED and auth.is_stale_session_token(credentials.credentials):
+            return None
+        raise unauthorized()
+    return claims
+
+# Users allowed to call maintenance endpoints, as comma-separated ids
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv("ADMIN_USER_IDS", "").split(",") if user_id.strip()}
+
+def authorize_admin(claims: Optional[dict] = Depends(session_claims)):
+    """Route dependency: a valid session of an admin user, whether or not AUTH_REQUIRED is set"""
+    if claims is None:
+        raise unauthorized("Not authenticated")
+    if claims["sub"] not in ADMIN_USER_IDS:
+        raise HTTPException(status_code=403, detail="Not allowed")
+
+def authorize_user(user_id: int, claims: Optional[dict] = Depends(session_claims)):
+    """Route dependency: the session must belong to the user_id in the path"""
+    if claims is not None and claims["sub"] != user_id:
+        raise HTTPException(status_code=403, detail="Not allowed for this user")
+
+def check_card_owner(owner_id: Optional[int], claims: dict):
+    if owner_id is not None and owner_id != claims["sub"]:
+        raise HTTPException(status_code=403, detail="Not allowed for this card")
+
+def authorize_card(card_id: int, claims: Optional[dict] = Depends(session_claims),
+                   db: Session = Depends(database.get_read_db)):
+    """Route dependency: the session must belong to the card's owner"""
+    if claims is None:
+        return
+    check_card_owner(db.query(database.Card.user_id).filter(database.Card.id == card_id).scalar(), claims)
+
+async def authorize_card_async(card_id: int, claims: Optional[dict] = Depends(session_claims),
+                               db: AsyncSession = Depends(database.get_async_read_db)):
+    """authorize_card for async routes: looks the owner up on the request's AsyncSession"""
+    if claims is None:
+        return
+    check_card_owner(await db.scalar(select(database.Card.user_id).where(database.Card.id == card_id)), claims)
+
+async def authorize_body_users(request: Request, claims: Optional[dict] = Depends(session_claims)):
+    """Route dependency: every user_id in the JSON body (or its items) must be the session's"""
+    if claims is None:
+        return
+    try:
+        body = await request.json()  # cached, the endpoint reads it again for free
+    except ValueError:
+        return  # left for the endpoint's validation error
+    items = body.get("items", [body]) if isinstance(body, dict) else []
+    if any(isinstance(item, dict) and item.get("user_id") != claims["sub"] for item in items):
+        raise HTTPException(status_code=403, detail="Not allowed for this user")
+
+def find_user_by_email(db: Session, email: str) -> Optional[database.User]:
+    return db.query(database.User).filter(database.User.email == email).first()
+
+def insert_user(db: Session, db_user: database.User) -> Optional[database.User]:
+    """Insert a new user; None when the email was registered in the meantime"""
+    db.add(db_user)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    db.refresh(db_user)
+    return db_user
+
+# /users and /login are async so that waiting on the bcrypt process pool
+# doesn't hold one of the worker threads the other endpoints run on; their
+# short DB calls go through run_in_threadpool instead.
 @app.post("/users", response_model=UserResponse)
-def create_user(user: UserCreate, db: Session = Depends(database.get_db)):
+async def create_user(user: UserCreate, db: Session = Depends(database.get_db)):
     """Create a new user (signup)"""
     try:
         # Check if user already exists
-        existing_user = db.query(database.User).filter(database.User.email == user.email).first()
+        existing_user = await run_in_threadpool(find_user_by_email, db, user.email)
         if existing_user:
             raise HTTPException(status_code=400, detail="Email already registered")
         
         # Hash the password
-        hashed_password = auth.hash_password(user.password)
+        hashed_password = await auth.hash_pool.hash(user.password)
         
         # Create new user
         db_user = database.User(
@@ -229,11 +419,11 @@ def create_user(user: UserCreate, db: Session = Depends(database.get_db)):
             name=user.name,
             hashed_password=hashed_password
         )
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        db_user = await run_in_threadpool(insert_user, db, db_user)
+        if db_user is None:
+            raise HTTPException(status_code=400, detail="Email already registered")
         return UserResponse(id=db_user.id, email=db_user.email, name=db_user.name)
-    except HTTPException:
+    except (HTTPException, auth.HashPoolBusy):
         # Re-raise HTTP exceptions
         raise
     except Exception as e:
@@ -241,30 +431,68 @@ def create_user(user: UserCreate, db: Session = Depends(database.get_db)):
         print(f"Error creating user: {str(e)}")
         import traceback
         traceback.print_exc()
-        db.rollback()
+        await run_in_threadpool(db.rollback)
         raise HTTPException(status_code=500, detail=f"Failed to create user: {str(e)}")
 
-@app.post("/login", response_model=UserResponse)
-def login(user_login: UserLogin, db: Session = Depends(database.get_db)):
-    """Authenticate a user (login)"""
+def login_response(db_user: database.User) -> LoginResponse:
+    token, expires_at = auth.create_session_token(db_user.id)
+    return LoginResponse(
+        id=db_user.id, email=db_user.email, name=db_user.name,
+        access_token=token, expires_at=expires_at
+    )
+
+@app.post("/login", response_model=LoginResponse)
+async def login(user_login: UserLogin, db: Session = Depends(database.get_db)):
+    """
+    Authenticate a user (login)
+    Returns a short-lived session token along with the user
+    """
     # Find user by email
-    db_user = db.query(database.User).filter(database.User.email == user_login.email).first()
+    db_user = await run_in_threadpool(find_user_by_email, db, user_login.email)
     if not db_user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     # Verify password
-    if not auth.verify_password(user_login.password, db_user.hashed_password):
+    if not await auth.hash_pool.verify(user_login.password, db_user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    return UserResponse(id=db_user.id, email=db_user.email, name=db_user.name)
+    return login_response(db_user)
+
+@app.post("/sessions/refresh", response_model=LoginResponse)
+def refresh_session(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+                    db: Session = Depends(database.get_read_db)):
+    """
+    Exchange a valid session token for a fresh one
+    Lets the app stay signed in without sending the password again;
+    the old token is revoked
+    """
+    claims = auth.decode_session_token(credentials.credentials) if credentials else None
+    db_user = db.get(database.User, claims["sub"]) if claims else None
+    if not db_user:
+        raise unauthorized()
+    auth.revoked_tokens.revoke(claims)
+    return login_response(db_user)
+
+@app.post("/sessions/logout", status_code=204)
+def logout(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)):
+    """Revoke the current session token"""
+    claims = auth.decode_session_token(credentials.credentials) if credentials else None
+    if claims:
+        auth.revoked_tokens.revoke(claims)
+    return Response(status_code=204)
+
+@app.get("/metrics/hash-pool")
+def hash_pool_metrics():
+    """Queue depth and timings of the password hashing pool"""
+    return auth.hash_pool.stats()
 
 @app.get("/users")
-def list_users(db: Session = Depends(database.get_db)):
+def list_users(db: Session = Depends(database.get_read_db)):
     """List all users"""
     users = db.query(database.User).all()
     return [{"id": u.id, "email": u.email, "name": u.name} for u in users]
 
-@app.post("/users/{user_id}/cards")
+@app.post("/users/{user_id}/cards", dependencies=[Depends(authorize_user)])
 def add_card(user_id: int, card: CardCreate, db: Session = Depends(database.get_db)):
     """Add a credit card to a user"""
     user = db.query(database.User).filter(database.User.id == user_id).first()
@@ -277,31 +505,38 @@ def add_card(user_id: int, card: CardCreate, db: Session = Depends(database.get_
         card_name=card.card_name,
         last_four=card.last_four,
         expiry_date=card.expiry_date,
-        cvv=card.cvv
+        cvv=card.cvv,
+        opened_date=card.opened_date
     )
     db.add(db_card)
+    rule_index.bump_rules_version(db, [user_id])
     db.commit()
     db.refresh(db_card)
+    rule_index.invalidate_user(user_id)
     return {"id": db_card.id, "issuer": db_card.issuer, "card_name": db_card.card_name}
 
-@app.get("/users/{user_id}/cards")
-def get_user_cards(user_id: int, db: Session = Depends(database.get_db)):
+@app.get("/users/{user_id}/cards", dependencies=[Depends(authorize_user)])
+def get_user_cards(user_id: int, db: Session = Depends(database.get_read_db)):
     """Get all cards for a user"""
-    cards = db.query(database.Card).filter(database.Card.user_id == user_id).all()
+    # Count rules in a correlated subquery instead of loading them per card
+    rules_count = select(func.count(database.CardRule.id)).where(
+        database.CardRule.card_id == database.Card.id
+    ).correlate(database.Card).scalar_subquery()
+    rows = db.query(database.Card, rules_count).filter(database.Card.user_id == user_id).all()
     result = []
-    for card in cards:
-        rules = db.query(database.CardRule).filter(database.CardRule.card_id == card.id).all()
+    for card, count in rows:
         result.append({
             "id": card.id,
             "issuer": card.issuer,
             "card_name": card.card_name,
             "last_four": card.last_four,
             "expiry_date": card.expiry_date,
-            "rules_count": len(rules)
+            "opened_date": card.opened_date,
+            "rules_count": count
         })
     return result
 
-@app.post("/cards/{card_id}/rules")
+@app.post("/cards/{card_id}/rules", dependencies=[Depends(authorize_card)])
 def add_card_rule(card_id: int, rule: CardRuleCreate, db: Session = Depends(database.get_db)):
     """Add a reward rule to a card"""
     card = db.query(database.Card).filter(database.Card.id == card_id).first()
@@ -329,17 +564,21 @@ def add_card_rule(card_id: int, rule: CardRuleCreate, db: Session = Depends(data
         priority=rule.priority
     )
     db.add(db_rule)
+    rule_index.bump_rules_version(db, [card.user_id])
     db.commit()
     db.refresh(db_rule)
+    rule_index.invalidate_user(card.user_id)
     return {"id": db_rule.id, "card_id": card_id, "category": rule.category, "multiplier": rule.multiplier}
 
-@app.get("/cards/{card_id}/rules")
-def get_card_rules(card_id: int, db: Session = Depends(database.get_db)):
+@app.get("/cards/{card_id}/rules", dependencies=[Depends(authorize_card)])
+def get_card_rules(card_id: int, db: Session = Depends(database.get_read_db)):
     """Get all reward rules for a card"""
-    rules = db.query(database.CardRule).filter(database.CardRule.card_id == card_id).all()
+    rules = db.query(database.CardRule).options(
+        joinedload(database.CardRule.category)
+    ).filter(database.CardRule.card_id == card_id).all()
     result = []
     for rule in rules:
-        category = db.query(database.Category).filter(database.Category.id == rule.category_id).first()
+        category = rule.category
         result.append({
             "id": rule.id,
             "category": category.name if category else "unknown",
@@ -347,19 +586,140 @@ def get_card_rules(card_id: int, db: Session = Depends(database.get_db)):
             "cap_cents": rule.cap_cents,
             "start_date": rule.start_date,
             "end_date": rule.end_date,
-            "priority": rule.priority
+            "priority": rule.priority,
+            "activated_on": rule.activated_on
         })
     return result
 
-@app.post("/recommend", response_model=RecommendResponse)
+@app.post("/cards/{card_id}/rules/{rule_id}/activate", dependencies=[Depends(authorize_card)])
+def activate_card_rule(card_id: int, rule_id: int, db: Session = Depends(database.get_db)):
+    """Activate a reward rule that requires activation (e.g. quarterly rotating categories)"""
+    rule = db.query(database.CardRule).filter(
+        database.CardRule.id == rule_id, database.CardRule.card_id == card_id
+    ).first()
+    if not rule:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    if rule.activated_on is None:
+        rule.activated_on = date.today()
+        rule_index.bump_rules_version(db, [rule.card.user_id])
+        db.commit()
+        rule_index.invalidate_user(rule.card.user_id)
+    return {"id": rule.id, "card_id": card_id, "activated_on": rule.activated_on}
+
+@db_mode_route("sync", app.post("/recommend", response_model=RecommendResponse))
 def recommend_card(db: Session = Depends(database.get_db)):
     """
     Recommend the best card for a transaction based on MCC code
     Reads data from hello.json file
     """
+    return process_tap(read_json(), db)
+
+@db_mode_route("async", app.post("/recommend", response_model=RecommendResponse))
+async def recommend_card_async(db: Session = Depends(database.get_db)):
+    """Async variant of recommend_card; the file read and ORM work run in the threadpool"""
+    return await run_in_threadpool(lambda: process_tap(read_json(), db))
+
+@app.post("/taps", response_model=TapAccepted, status_code=202)
+def ingest_tap(tap: TapPayload):
+    """
+    Queue a tap pushed directly by the BLE bridge
+    The payload travels inline and is processed by the tap consumer;
+    returns 429 when the backlog is full so the bridge can back off.
+    Taps without a ts are rejected (422): a server-side timestamp would merge
+    distinct taps of one card, and couldn't dedupe a resent one.
+    """
+    try:
+        seq = tap_log.append(tap.uid, tap.mcc, tap.ts)
+    except tap_queue.QueueFull as e:
+        return JSONResponse(status_code=429, content={"detail": str(e)}, headers={"Retry-After": "1"})
+    return TapAccepted(seq=seq, depth=tap_log.depth("recommend"))
 
-    # Get json data
-    data = read_json()
+# Errors that may pass on their own (locked SQLite file, lost connection,
+# exhausted pool): the tap consumer retries the whole batch
+TRANSIENT_DB_ERRORS = (OperationalError, PoolTimeout)
+
+def handle_tap_batch(batch: List[tap_queue.Tap]):
+    """
+    Process a batch of queued taps; safe to call again with the same taps
+    A tap that fails for any other reason is logged and skipped, since
+    retrying it would fail the same way and hold up every tap behind it.
+    """
+    db = database.SessionLocal()
+    try:
+        for tap in batch:
+            try:
+                process_tap({"uid": tap.uid, "mcc": tap.mcc, "ts": tap.ts}, db)
+            except TRANSIENT_DB_ERRORS:
+                raise
+            except HTTPException as e:
+                db.rollback()
+                logger.warning("Dropping tap %s: %s", tap.seq, e.detail)
+            except Exception:
+                db.rollback()
+                logger.exception("Dropping tap %s (uid %s, ts %s)", tap.seq, tap.uid, tap.ts)
+    finally:
+        db.close()
+
+tap_consumer: Optional[tap_queue.TapConsumer] = None
+
+def start_tap_consumer():
+    global tap_log, tap_consumer
+    tap_log = tap_queue.TapQueue()
+    tap_consumer = tap_queue.TapConsumer(tap_log, handle_tap_batch)
+    tap_consumer.start()
+
+def stop_tap_consumer():
+    if tap_consumer is not None:
+        tap_consumer.stop()
+        tap_log.close()
+
+def replay_tap(receipt: database.TapReceipt) -> RecommendResponse:
+    """Rebuild the response for a tap that was already recorded"""
+    txn = receipt.transaction
+    return RecommendResponse(
+        recommended_card_id=txn.card_id,
+        card_name=txn.card.card_name,
+        issuer=txn.card.issuer,
+        multiplier=txn.multiplier,
+        cashback_cents=txn.rewards,
+        category=txn.category,
+        reason="Already processed"
+    )
+
+def commit_tap(data: dict, db_transaction: database.Transaction, db: Session) -> Optional[RecommendResponse]:
+    """
+    Commit a tap's transaction together with its (uid, ts) receipt
+    Returns the earlier response instead if the tap was recorded concurrently
+    """
+    if data.get("ts") is not None:
+        db.add(database.TapReceipt(uid=data["uid"], ts=data["ts"], transaction=db_transaction))
+    rollups.add_transactions(db, [db_transaction])
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        receipt = None
+        if data.get("ts") is not None:
+            receipt = db.query(database.TapReceipt).filter(
+                database.TapReceipt.uid == data["uid"],
+                database.TapReceipt.ts == data["ts"]
+            ).first()
+        if receipt is None:
+            raise  # not a repeat of this tap
+        return replay_tap(receipt)
+    db.refresh(db_transaction)
+    return None
+
+def process_tap(data: dict, db: Session) -> RecommendResponse:
+    """Recommend a card for one RFID tap ({"uid", "mcc", "ts"}) and record it"""
+    # A tap may be delivered more than once; answer repeats from the receipt
+    if data.get("ts") is not None:
+        receipt = db.query(database.TapReceipt).filter(
+            database.TapReceipt.uid == data["uid"],
+            database.TapReceipt.ts == data["ts"]
+        ).first()
+        if receipt:
+            return replay_tap(receipt)
 
     # Get category from MCC
     category = mcc_data.get_category_from_mcc(data["mcc"])
@@ -373,9 +733,9 @@ def recommend_card(db: Session = Depends(database.get_db)):
     else:
         user_id = 2
     
-    # Get user's cards
-    cards = db.query(database.Card).filter(database.Card.user_id == user_id).all()
-    if not cards:
+    # Get user's cards and rules from the in-memory index
+    user_rules = rule_index.get_user(db, user_id)
+    if not user_rules.cards:
         raise HTTPException(status_code=404, detail="No cards found for user")
     
     if uid == "C10AAEA4":
@@ -383,19 +743,18 @@ def recommend_card(db: Session = Depends(database.get_db)):
         random_card_id = random.choice(card_ids)
         random_card = db.query(database.Card).filter(database.Card.id == random_card_id).first()
 
-        rules = db.query(database.CardRule).filter(database.CardRule.card_id == random_card_id).all()
-
         multiplier = 1.0
         cashback = int((random_amount_cents) / 100)
+        applied = None
+        now = datetime.now()
 
         print("random card: " + random_card.card_name)
 
-        for rule in rules:
-            cat = db.query(database.Category).filter(database.Category.id == rule.category_id).first()
-            if cat and cat.name == category:
-                multiplier = rule.multiplier
-                cashback = int((random_amount_cents * multiplier) / 100)
-                break
+        scorer = user_rules.scorer(category)
+        spent = spend_caps.load_spent(db, scorer.capped_rule_ids, now.date())
+        candidate, card_cashback, card_multiplier = scorer.score(random_amount_cents, spent, card_id=random_card_id)
+        if candidate is not None:
+            applied, cashback, multiplier = candidate, card_cashback, card_multiplier
 
         # Generate random merchant name based on category
         merchant_name = get_random_merchant_name(category)
@@ -405,17 +764,20 @@ def recommend_card(db: Session = Depends(database.get_db)):
             user_id=user_id,
             card_id=random_card.id,
             amount_cents=random_amount_cents,
-            mcc_code=data["mcc"],
+            mcc_code=str(data["mcc"]),
             merchant_name=merchant_name,
             category=category,
             rewards=cashback,
             multiplier=multiplier,
-            transaction_date=datetime.now().isoformat(),
+            transaction_date=now,
             description=f"RFID tap - UID: {uid}"
         )
         db.add(db_transaction)
-        db.commit()
-        db.refresh(db_transaction)
+        if applied is not None and applied.cap_cents is not None:
+            spend_caps.add_spend(db, [(applied.rule_id, now.date(), random_amount_cents)])
+        replayed = commit_tap(data, db_transaction, db)
+        if replayed:
+            return replayed
         
         return RecommendResponse(
             recommended_card_id=random_card.id,
@@ -427,65 +789,23 @@ def recommend_card(db: Session = Depends(database.get_db)):
             reason="Random card"
         )
 
-    best_card = None
-    best_multiplier = 0
-    best_cashback = 0
-    best_reason = ""
-    
-    # today = datetime.now().date()
+    # Candidates are pre-compiled, so this is a short arithmetic loop; capped
+    # rules need their spend so far this period (one small lookup)
+    now = datetime.now()
+    scorer = rule_index.get_scorer(db, user_id, category)
+    spent = spend_caps.load_spent(db, scorer.capped_rule_ids, now.date())
+    best, best_cashback, best_multiplier = scorer.score(random_amount_cents, spent)
     
-    for card in cards:
-        # Get active rules for this card and category
-        rules = db.query(database.CardRule).filter(
-            database.CardRule.card_id == card.id
-        ).all()
-        
-        for rule in rules:
-            # Get category for this rule
-            cat = db.query(database.Category).filter(database.Category.id == rule.category_id).first()
-            if not cat:
-                continue
-            
-            # Check if rule applies to this category
-            if cat.name != category and cat.name != "other":
-                continue
-            
-            # # Check if rule is currently active
-            # is_active = True
-            # if rule.start_date:
-            #     start = datetime.fromisoformat(rule.start_date).date()
-            #     if today < start:
-            #         is_active = False
-            
-            # if rule.end_date:
-            #     end = datetime.fromisoformat(rule.end_date).date()
-            #     if today > end:
-            #         is_active = False
-            
-            # if not is_active:
-            #     continue
-            
-            # Calculate cashback
-            multiplier = rule.multiplier
-            cashback = int((random_amount_cents * multiplier) / 100)
-            
-            # # Check spending cap
-            # if rule.cap_cents and cashback > rule.cap_cents:
-            #     cashback = rule.cap_cents
-            
-            # Update best card if this is better
-            if cashback > best_cashback or (cashback == best_cashback and multiplier > best_multiplier):
-                best_card = card
-                best_multiplier = multiplier
-                best_cashback = cashback
-                best_reason = f"{multiplier}% cashback on {cat.name}"
-                if rule.end_date:
-                    best_reason += f" (valid until {rule.end_date})"
-    
-    if not best_card:
+    if not best:
         raise HTTPException(status_code=404, detail="No applicable card rules found")
    
-    print("best card: " + best_card.card_name)
+    best_reason = f"{best_multiplier}% cashback on {best.category}"
+    if best_multiplier != best.multiplier:
+        best_reason = f"{best.multiplier}% cashback on {best.category} up to the {spend_caps.PERIOD_NAME} cap, {best_multiplier}% overall"
+    if best.active_until:
+        best_reason += f" (valid until {best.active_until})"
+    
+    print("best card: " + best.card_name)
     
     # Generate random merchant name based on category
     merchant_name = get_random_merchant_name(category)
@@ -493,30 +813,126 @@ def recommend_card(db: Session = Depends(database.get_db)):
     # Record transaction in database
     db_transaction = database.Transaction(
         user_id=user_id,
-        card_id=best_card.id,
+        card_id=best.card_id,
         amount_cents=random_amount_cents,
-        mcc_code=data["mcc"],
+        mcc_code=str(data["mcc"]),
         merchant_name=merchant_name,
         category=category,
         rewards=best_cashback,
         multiplier=best_multiplier,
-        transaction_date=datetime.now().isoformat(),
+        transaction_date=now,
         description=f"RFID tap - UID: {uid}"
     )
     db.add(db_transaction)
-    db.commit()
-    db.refresh(db_transaction)
+    if best.cap_cents is not None:
+        spend_caps.add_spend(db, [(best.rule_id, now.date(), random_amount_cents)])
+    replayed = commit_tap(data, db_transaction, db)
+    if replayed:
+        return replayed
     
     return RecommendResponse(
-        recommended_card_id=best_card.id,
-        card_name=best_card.card_name,
-        issuer=best_card.issuer,
+        recommended_card_id=best.card_id,
+        card_name=best.card_name,
+        issuer=best.issuer,
         multiplier=best_multiplier,
         cashback_cents=best_cashback,
         category=category,
         reason=best_reason
     )
 
+@db_mode_route("sync", app.post(
+    "/recommend/batch", response_model=BatchRecommendResponse, dependencies=[Depends(authorize_body_users)]
+))
+def recommend_batch(batch: BatchRecommendRequest, db: Session = Depends(database.get_db)):
+    """
+    Recommend the best card for many purchases in one call
+    Optionally records every recommended purchase as a transaction
+    """
+    # Group purchases so each (user, category) candidate list is scored once
+    groups = {}
+    categories = []
+    for i, item in enumerate(batch.items):
+        category = mcc_data.get_category_from_mcc(item.mcc_code)
+        categories.append(category)
+        groups.setdefault((item.user_id, category), []).append(i)
+    
+    results: List[Optional[BatchRecommendResult]] = [None] * len(batch.items)
+    applied: List[Optional[rule_index.Candidate]] = [None] * len(batch.items)
+    today = datetime.now().date()
+    # Period-to-date spend of capped rules, shared by every group so that
+    # recorded purchases count toward caps for the ones after them
+    spent: Dict[int, int] = {}
+    for (user_id, category), indices in groups.items():
+        user_rules = rule_index.get_user(db, user_id)
+        scorer = user_rules.scorer(category)
+        spent.update(spend_caps.load_spent(
+            db, [rule_id for rule_id in scorer.capped_rule_ids if rule_id not in spent], today
+        ))
+        amounts = [batch.items[i].amount_cents for i in indices]
+        best, cashbacks, multipliers = scorer.score_many(amounts, spent, accumulate=batch.persist)
+        
+        for i, candidate, cashback, multiplier in zip(indices, best, cashbacks, multipliers):
+            item = batch.items[i]
+            result = BatchRecommendResult(
+                user_id=item.user_id,
+                mcc_code=item.mcc_code,
+                amount_cents=item.amount_cents,
+                category=category
+            )
+            if not user_rules.cards:
+                result.error = "No cards found for user"
+            elif not candidate:
+                result.error = "No applicable card rules found"
+            else:
+                result.recommended_card_id = candidate.card_id
+                result.card_name = candidate.card_name
+                result.issuer = candidate.issuer
+                result.multiplier = multiplier
+                result.cashback_cents = cashback
+                result.reason = f"{candidate.multiplier}% cashback on {candidate.category}"
+                applied[i] = candidate
+                if candidate.active_until:
+                    result.reason += f" (valid until {candidate.active_until})"
+            results[i] = result
+    
+    persisted_count = 0
+    if batch.persist:
+        now = datetime.now()
+        rows = [
+            {
+                "user_id": result.user_id,
+                "card_id": result.recommended_card_id,
+                "amount_cents": result.amount_cents,
+                "mcc_code": result.mcc_code,
+                "merchant_name": get_random_merchant_name(result.category),
+                "category": result.category,
+                "rewards": result.cashback_cents,
+                "multiplier": result.multiplier,
+                "transaction_date": now,
+                "description": "Batch recommendation"
+            }
+            for result in results if result.error is None
+        ]
+        if rows:
+            db.bulk_insert_mappings(database.Transaction, rows)
+            rollups.add_rows(db, rows)
+            spend_caps.add_spend(db, [
+                (candidate.rule_id, today, item.amount_cents)
+                for candidate, item in zip(applied, batch.items)
+                if candidate is not None and candidate.cap_cents is not None
+            ])
+            db.commit()
+        persisted_count = len(rows)
+    
+    return BatchRecommendResponse(results=results, persisted_count=persisted_count)
+
+@db_mode_route("async", app.post(
+    "/recommend/batch", response_model=BatchRecommendResponse, dependencies=[Depends(authorize_body_users)]
+))
+async def recommend_batch_async(batch: BatchRecommendRequest, db: Session = Depends(database.get_db)):
+    """Async variant of recommend_batch; the ORM work runs in the threadpool"""
+    return await run_in_threadpool(recommend_batch, batch, db=db)
+
 @app.get("/mcc/{mcc_code}")
 def get_mcc_category(mcc_code: str):
     """Get category name for an MCC code"""
@@ -528,51 +944,58 @@ def get_mcc_category(mcc_code: str):
 
 @app.get("/categories")
 def list_categories():
-    """List all available categories and their MCC codes"""
-    return {
-        category: codes for category, codes in mcc_data.MCC_CATEGORIES.items()
-    }
+    """List all available categories and their MCC codes, MCC_RANGES expanded"""
+    return mcc_data.get_all_category_codes()
 
-@app.post("/scraper/run")
-def run_scraper(db: Session = Depends(database.get_db)):
+def scrape_job(job: jobs.Job) -> dict:
     """
-    Run the Bank of America web scraper
+    Background scrape: conditional fetch, parse on a process pool, store
+    only what changed, then promote changed rewards into card rules
     """
     scraper = BankOfAmericaScraper()
-    parser = RewardParser()
+    job.total = len(scraper.CARD_URLS)
     
+    def on_page(page):
+        job.record_step(page.card_name, page.status, page.elapsed)
+    
+    # database.SessionLocal is looked up per run so tests can point it elsewhere
+    pipeline = scrape_pipeline.ScrapePipeline(scraper, database.SessionLocal, on_page=on_page)
+    counts = pipeline.run()
+    with database.SessionLocal() as db:
+        counts["reconciled"] = reconcile.reconcile(db)
+    return counts
+
+@app.post("/scraper/run", status_code=202)
+def run_scraper():
+    """
+    Start the Bank of America web scraper in the background
+    Returns a job id to poll at /scraper/jobs/{job_id}; 409 while a scrape
+    is already queued or running
+    """
     try:
-        # Scrape rewards
-        raw_rewards = scraper.scrape_rewards()
-        
-        # Save raw rewards to database
-        for reward in raw_rewards:
-            parsed = parser.parse_reward_text(reward['raw_text'])
-            
-            db_reward = database.ScrapedReward(
-                issuer=reward['issuer'],
-                card_name=reward['card_name'],
-                raw_text=reward['raw_text'],
-                parsed_category=parsed.get('category') if parsed else None,
-                parsed_multiplier=parsed.get('multiplier') if parsed else None,
-                parsed_end_date=parsed.get('end_date') if parsed else None,
-                scraped_at=reward['scraped_at'],
-                processed=False
-            )
-            db.add(db_reward)
-        
-        db.commit()
-        
-        return {
-            "status": "success",
-            "scraped_count": len(raw_rewards),
-            "message": "Rewards scraped and saved to database"
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Scraper error: {str(e)}")
+        job = job_runner.submit("scraper", scrape_job)
+    except jobs.JobAlreadyRunning as e:
+        return JSONResponse(status_code=409, content={"detail": str(e), "job_id": e.job.id})
+    return {"job_id": job.id, "status": job.status}
+
+@app.post("/scraper/reconcile", dependencies=[Depends(authorize_admin)])
+def reconcile_scraped_rewards(db: Session = Depends(database.get_db)):
+    """
+    Apply unprocessed scraped rewards to the rules of matching cards (also run after each scrape)
+    Rewrites every user's rules, so only ADMIN_USER_IDS may call it
+    """
+    return reconcile.reconcile(db)
+
+@app.get("/scraper/jobs/{job_id}")
+def get_scraper_job(job_id: str):
+    """Progress, per-card timing and result of a scraper job"""
+    job = job_runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
 @app.get("/scraper/results")
-def get_scraper_results(db: Session = Depends(database.get_db)):
+def get_scraper_results(db: Session = Depends(database.get_read_db)):
     """Get all scraped rewards"""
     rewards = db.query(database.ScrapedReward).order_by(database.ScrapedReward.scraped_at.desc()).limit(50).all()
     result = []
@@ -585,19 +1008,24 @@ def get_scraper_results(db: Session = Depends(database.get_db)):
             "parsed_category": reward.parsed_category,
             "parsed_multiplier": reward.parsed_multiplier,
             "parsed_end_date": reward.parsed_end_date,
+            "parsed_cap_cents": reward.parsed_cap_cents,
+            "parsed_unit": reward.parsed_unit,
             "scraped_at": reward.scraped_at,
             "processed": reward.processed
         })
     return result
 
-@app.get("/summary/{user_id}")
-def get_user_summary(user_id: int, db: Session = Depends(database.get_db)):
+@app.get("/summary/{user_id}", dependencies=[Depends(authorize_user)])
+def get_user_summary(user_id: int, db: Session = Depends(database.get_read_db)):
     """Get summary of user's cards and potential rewards"""
     user = db.query(database.User).filter(database.User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    cards = db.query(database.Card).filter(database.Card.user_id == user_id).all()
+    # Rules and their categories come in with one extra statement
+    cards = db.query(database.Card).options(
+        selectinload(database.Card.rules).joinedload(database.CardRule.category)
+    ).filter(database.Card.user_id == user_id).all()
     
     summary = {
         "user_id": user_id,
@@ -606,8 +1034,8 @@ def get_user_summary(user_id: int, db: Session = Depends(database.get_db)):
         "cards": []
     }
     
+    today = date.today()
     for card in cards:
-        rules = db.query(database.CardRule).filter(database.CardRule.card_id == card.id).all()
         card_info = {
             "card_id": card.id,
             "issuer": card.issuer,
@@ -616,68 +1044,43 @@ def get_user_summary(user_id: int, db: Session = Depends(database.get_db)):
             "rewards": []
         }
         
-        for rule in rules:
-            category = db.query(database.Category).filter(database.Category.id == rule.category_id).first()
+        for rule in card.rules:
+            category = rule.category
+            interval = rule_schedule.rule_interval(rule, card.opened_date)
             card_info["rewards"].append({
                 "category": category.name if category else "unknown",
                 "multiplier": rule.multiplier,
                 "cap_cents": rule.cap_cents,
-                "active": True  # TODO: Check date ranges
+                "active": interval is not None and interval.contains(today)
             })
         
         summary["cards"].append(card_info)
     
     return summary
 
-@app.post("/transactions", response_model=TransactionResponse)
+@db_mode_route("sync", app.post(
+    "/transactions", response_model=TransactionResponse, dependencies=[Depends(authorize_body_users)]
+))
 def create_transaction(transaction: TransactionCreate, db: Session = Depends(database.get_db)):
     """
     Record a transaction and calculate cashback earned
     """
-    # Get the card
+    # Get the card; it must be the transaction user's own (authorize_body_users
+    # has already matched that user to the session)
     card = db.query(database.Card).filter(database.Card.id == transaction.card_id).first()
-    if not card:
+    if not card or card.user_id != transaction.user_id:
         raise HTTPException(status_code=404, detail="Card not found")
     
     # Get category from MCC
     category = mcc_data.get_category_from_mcc(transaction.mcc_code)
     
-    # Find the best reward rule for this card and category
-    rules = db.query(database.CardRule).filter(database.CardRule.card_id == transaction.card_id).all()
-    
-    best_multiplier = 0
-    best_cashback = 0
-    today = datetime.now().date()
-    
-    for rule in rules:
-        cat = db.query(database.Category).filter(database.Category.id == rule.category_id).first()
-        if not cat or (cat.name != category and cat.name != "other"):
-            continue
-        
-        # Check if rule is active
-        is_active = True
-        if rule.start_date:
-            start = datetime.fromisoformat(rule.start_date).date()
-            if today < start:
-                is_active = False
-        if rule.end_date:
-            end = datetime.fromisoformat(rule.end_date).date()
-            if today > end:
-                is_active = False
-        
-        if not is_active:
-            continue
-        
-        # Calculate cashback
-        multiplier = rule.multiplier
-        cashback = int((transaction.amount_cents * multiplier) / 100)
-        
-        if rule.cap_cents and cashback > rule.cap_cents:
-            cashback = rule.cap_cents
-        
-        if cashback > best_cashback:
-            best_multiplier = multiplier
-            best_cashback = cashback
+    # Score the card's active rules for this category from the rule index,
+    # the same way /recommend does (caps count spend so far this period)
+    now = datetime.now()
+    today = now.date()
+    scorer = rule_index.get_scorer(db, card.user_id, category)
+    spent = spend_caps.load_spent(db, scorer.capped_rule_ids, today)
+    best_rule, best_cashback, best_multiplier = scorer.score(transaction.amount_cents, spent, card_id=card.id)
     
     # Create transaction record
     db_transaction = database.Transaction(
@@ -689,11 +1092,14 @@ def create_transaction(transaction: TransactionCreate, db: Session = Depends(dat
         category=category,
         rewards=best_cashback,
         multiplier=best_multiplier,
-        transaction_date=datetime.now().isoformat(),
+        transaction_date=now,
         description=transaction.description
     )
     
     db.add(db_transaction)
+    rollups.add_transactions(db, [db_transaction])
+    if best_rule is not None and best_rule.cap_cents is not None:
+        spend_caps.add_spend(db, [(best_rule.rule_id, today, transaction.amount_cents)])
     db.commit()
     db.refresh(db_transaction)
     
@@ -707,77 +1113,165 @@ def create_transaction(transaction: TransactionCreate, db: Session = Depends(dat
         category=db_transaction.category,
         cashback_cents=db_transaction.rewards,
         multiplier=db_transaction.multiplier,
-        transaction_date=db_transaction.transaction_date,
+        transaction_date=db_transaction.transaction_date.isoformat(),
         merchant_name=db_transaction.merchant_name
     )
 
-@app.get("/transactions/{user_id}")
-def get_user_transactions(user_id: int, limit: int = 50, db: Session = Depends(database.get_db)):
+@db_mode_route("async", app.post(
+    "/transactions", response_model=TransactionResponse, dependencies=[Depends(authorize_body_users)]
+))
+async def create_transaction_async(transaction: TransactionCreate, db: Session = Depends(database.get_db)):
+    """Async variant of create_transaction; the ORM work runs in the threadpool"""
+    return await run_in_threadpool(create_transaction, transaction, db=db)
+
+def encode_cursor(txn: database.Transaction) -> str:
+    """Opaque keyset cursor pointing just past a transaction"""
+    raw = json.dumps([txn.transaction_date.isoformat(), txn.id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str):
+    try:
+        transaction_date, txn_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(transaction_date), int(txn_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def paginate_transactions(stmt, cursor: Optional[str], limit: int):
     """
-    Get transaction history for a user
+    Apply keyset pagination on (transaction_date, id), newest first
+    stmt selects Transaction first; one row past the page is fetched so
+    page_rows can tell whether more follow.
     """
-    transactions = db.query(database.Transaction).filter(
-        database.Transaction.user_id == user_id
-    ).order_by(database.Transaction.transaction_date.desc()).limit(limit).all()
-    
-    result = []
-    for txn in transactions:
-        card = db.query(database.Card).filter(database.Card.id == txn.card_id).first()
-        result.append({
-            "id": txn.id,
-            "card_name": card.card_name if card else "Unknown",
-            "card_issuer": card.issuer if card else "Unknown",
-            "amount_cents": txn.amount_cents,
-            "amount_dollars": txn.amount_cents / 100,
-            "mcc_code": txn.mcc_code,
-            "category": txn.category,
-            "merchant_name": txn.merchant_name,
-            "cashback_cents": txn.rewards,
-            "cashback_dollars": txn.rewards / 100,
-            "multiplier": txn.multiplier,
-            "transaction_date": txn.transaction_date,
-            "description": txn.description
-        })
-    
-    return result
+    txn = database.Transaction
+    if cursor:
+        transaction_date, txn_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(txn.transaction_date, txn.id) < tuple_(transaction_date, txn_id))
+    return stmt.order_by(txn.transaction_date.desc(), txn.id.desc()).limit(limit + 1)
+
+def page_rows(rows: list, limit: int, response: Response) -> list:
+    """Rows of a paginate_transactions page; sets X-Next-Cursor when there are more"""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1][0])
+    return rows
 
-@app.get("/transactions/card/{card_id}")
-def get_card_transactions(card_id: int, limit: int = 50, db: Session = Depends(database.get_db)):
+def user_transactions_query(user_id: int):
+    """A user's transactions with the name and issuer of the card used"""
+    return select(
+        database.Transaction, database.Card.card_name, database.Card.issuer
+    ).outerjoin(
+        database.Card, database.Card.id == database.Transaction.card_id
+    ).where(database.Transaction.user_id == user_id)
+
+def user_transaction_json(txn: database.Transaction, card_name: Optional[str], card_issuer: Optional[str]) -> dict:
+    return {
+        "id": txn.id,
+        "card_name": card_name if card_name is not None else "Unknown",
+        "card_issuer": card_issuer if card_issuer is not None else "Unknown",
+        "amount_cents": txn.amount_cents,
+        "amount_dollars": txn.amount_cents / 100,
+        "mcc_code": txn.mcc_code,
+        "category": txn.category,
+        "merchant_name": txn.merchant_name,
+        "cashback_cents": txn.rewards,
+        "cashback_dollars": txn.rewards / 100,
+        "multiplier": txn.multiplier,
+        "transaction_date": txn.transaction_date.isoformat(),
+        "description": txn.description
+    }
+
+@db_mode_route("sync", app.get("/transactions/{user_id}", dependencies=[Depends(authorize_user)]))
+def get_user_transactions(
+    user_id: int,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: Session = Depends(database.get_read_db)
+):
     """
-    Get transaction history for a specific card
+    Get transaction history for a user
+    Pass the X-Next-Cursor response header back as `cursor` for the next page
     """
-    transactions = db.query(database.Transaction).filter(
-        database.Transaction.card_id == card_id
-    ).order_by(database.Transaction.transaction_date.desc()).limit(limit).all()
-    
-    result = []
-    for txn in transactions:
-        result.append({
-            "id": txn.id,
-            "amount_cents": txn.amount_cents,
-            "amount_dollars": txn.amount_cents / 100,
-            "mcc_code": txn.mcc_code,
-            "category": txn.category,
-            "merchant_name": txn.merchant_name,
-            "cashback_cents": txn.rewards,
-            "cashback_dollars": txn.rewards / 100,
-            "multiplier": txn.multiplier,
-            "transaction_date": txn.transaction_date,
-            "description": txn.description
-        })
-    
-    return result
+    rows = db.execute(paginate_transactions(user_transactions_query(user_id), cursor, limit)).all()
+    return [user_transaction_json(*row) for row in page_rows(rows, limit, response)]
+
+@db_mode_route("async", app.get("/transactions/{user_id}", dependencies=[Depends(authorize_user)]))
+async def get_user_transactions_async(
+    user_id: int,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_read_db)
+):
+    """Async variant of get_user_transactions"""
+    rows = (await db.execute(paginate_transactions(user_transactions_query(user_id), cursor, limit))).all()
+    return [user_transaction_json(*row) for row in page_rows(rows, limit, response)]
+
+def card_transactions_query(card_id: int):
+    return select(database.Transaction).where(database.Transaction.card_id == card_id)
 
-@app.get("/analytics/{user_id}")
-def get_user_analytics(user_id: int, db: Session = Depends(database.get_db)):
+def card_transaction_json(txn: database.Transaction) -> dict:
+    return {
+        "id": txn.id,
+        "amount_cents": txn.amount_cents,
+        "amount_dollars": txn.amount_cents / 100,
+        "mcc_code": txn.mcc_code,
+        "category": txn.category,
+        "merchant_name": txn.merchant_name,
+        "cashback_cents": txn.rewards,
+        "cashback_dollars": txn.rewards / 100,
+        "multiplier": txn.multiplier,
+        "transaction_date": txn.transaction_date.isoformat(),
+        "description": txn.description
+    }
+
+@db_mode_route("sync", app.get("/transactions/card/{card_id}", dependencies=[Depends(authorize_card)]))
+def get_card_transactions(
+    card_id: int,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: Session = Depends(database.get_read_db)
+):
     """
-    Get analytics for a user's spending and cashback
+    Get transaction history for a specific card
+    Pass the X-Next-Cursor response header back as `cursor` for the next page
     """
-    transactions = db.query(database.Transaction).filter(
-        database.Transaction.user_id == user_id
-    ).all()
-    
-    if not transactions:
+    rows = db.execute(paginate_transactions(card_transactions_query(card_id), cursor, limit)).all()
+    return [card_transaction_json(txn) for txn, in page_rows(rows, limit, response)]
+
+@db_mode_route("async", app.get("/transactions/card/{card_id}", dependencies=[Depends(authorize_card_async)]))
+async def get_card_transactions_async(
+    card_id: int,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_read_db)
+):
+    """Async variant of get_card_transactions"""
+    rows = (await db.execute(paginate_transactions(card_transactions_query(card_id), cursor, limit))).all()
+    return [card_transaction_json(txn) for txn, in page_rows(rows, limit, response)]
+
+def user_analytics_queries(user_id: int):
+    """(by category, by card) aggregates of a user's rollups"""
+    rollup = database.TransactionRollup
+    aggregates = (
+        func.coalesce(func.sum(rollup.txn_count), 0),
+        func.coalesce(func.sum(rollup.spent_cents), 0),
+        func.coalesce(func.sum(rollup.cashback_cents), 0)
+    )
+    by_category = select(rollup.category, *aggregates).where(
+        rollup.user_id == user_id
+    ).group_by(rollup.category)
+    # Joined so card names come back with the aggregates
+    by_card = select(database.Card.card_name, *aggregates).select_from(rollup).outerjoin(
+        database.Card, database.Card.id == rollup.card_id
+    ).where(rollup.user_id == user_id).group_by(database.Card.card_name)
+    return by_category, by_card
+
+def user_analytics(category_rows: list, card_rows: list) -> dict:
+    """The /analytics response from the rows of user_analytics_queries"""
+    if not category_rows:
         return {
             "total_transactions": 0,
             "total_spent_cents": 0,
@@ -787,41 +1281,32 @@ def get_user_analytics(user_id: int, db: Session = Depends(database.get_db)):
             "by_card": {}
         }
     
-    total_spent = sum(t.amount_cents for t in transactions)
-    total_cashback = sum(t.rewards for t in transactions)
-    avg_rate = (total_cashback / total_spent * 100) if total_spent > 0 else 0
+    by_category = {
+        category: {
+            "count": count,
+            "total_spent_cents": spent,
+            "total_cashback_cents": cashback
+        }
+        for category, count, spent, cashback in category_rows
+    }
     
-    # By category
-    by_category = {}
-    for txn in transactions:
-        if txn.category not in by_category:
-            by_category[txn.category] = {
-                "count": 0,
-                "total_spent_cents": 0,
-                "total_cashback_cents": 0
-            }
-        by_category[txn.category]["count"] += 1
-        by_category[txn.category]["total_spent_cents"] += txn.amount_cents
-        by_category[txn.category]["total_cashback_cents"] += txn.rewards
+    # Totals are the sum of the category rows
+    total_transactions = sum(row[1] for row in category_rows)
+    total_spent = sum(row[2] for row in category_rows)
+    total_cashback = sum(row[3] for row in category_rows)
+    avg_rate = (total_cashback / total_spent * 100) if total_spent > 0 else 0
     
-    # By card
     by_card = {}
-    for txn in transactions:
-        card = db.query(database.Card).filter(database.Card.id == txn.card_id).first()
-        card_key = f"{card.card_name}" if card else "Unknown"
-        
-        if card_key not in by_card:
-            by_card[card_key] = {
-                "count": 0,
-                "total_spent_cents": 0,
-                "total_cashback_cents": 0
-            }
-        by_card[card_key]["count"] += 1
-        by_card[card_key]["total_spent_cents"] += txn.amount_cents
-        by_card[card_key]["total_cashback_cents"] += txn.rewards
+    for card_name, count, spent, cashback in card_rows:
+        card_key = card_name if card_name is not None else "Unknown"
+        by_card[card_key] = {
+            "count": count,
+            "total_spent_cents": spent,
+            "total_cashback_cents": cashback
+        }
     
     return {
-        "total_transactions": len(transactions),
+        "total_transactions": total_transactions,
         "total_spent_cents": total_spent,
         "total_spent_dollars": total_spent / 100,
         "total_cashback_cents": total_cashback,
@@ -831,6 +1316,25 @@ def get_user_analytics(user_id: int, db: Session = Depends(database.get_db)):
         "by_card": by_card
     }
 
+@db_mode_route("sync", app.get("/analytics/{user_id}", dependencies=[Depends(authorize_user)]))
+def get_user_analytics(user_id: int, db: Session = Depends(database.get_read_db)):
+    """
+    Get analytics for a user's spending and cashback
+    Reads the per-day rollups, so cost doesn't grow with raw history
+    """
+    by_category, by_card = user_analytics_queries(user_id)
+    category_rows = db.execute(by_category).all()
+    card_rows = db.execute(by_card).all() if category_rows else []
+    return user_analytics(category_rows, card_rows)
+
+@db_mode_route("async", app.get("/analytics/{user_id}", dependencies=[Depends(authorize_user)]))
+async def get_user_analytics_async(user_id: int, db: AsyncSession = Depends(database.get_async_read_db)):
+    """Async variant of get_user_analytics"""
+    by_category, by_card = user_analytics_queries(user_id)
+    category_rows = (await db.execute(by_category)).all()
+    card_rows = (await db.execute(by_card)).all() if category_rows else []
+    return user_analytics(category_rows, card_rows)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -34,13 +34,59 @@ MCC_CATEGORIES = {
     "other": []
 }
 
-def get_category_from_mcc(mcc_code: str) -> str:
-    """Get category name from MCC code"""
+# Contiguous MCC blocks (inclusive). ISO 18245 assigns whole ranges to
+# individual airlines, car rental agencies and hotel chains.
+MCC_RANGES = {
+    "travel": [
+        (3000, 3299),  # Airlines
+        (3351, 3441),  # Car rental agencies
+        (3501, 3999),  # Lodging
+    ],
+}
+
+# Reverse index from MCC to category, built once at import time.
+# MCCs are four-digit codes, so a flat list indexed by the code is enough.
+MCC_TABLE_SIZE = 10000
+
+def _build_mcc_table() -> list:
+    table = ["other"] * MCC_TABLE_SIZE
+    for category, ranges in MCC_RANGES.items():
+        for start, end in ranges:
+            for code in range(start, end + 1):
+                table[code] = category
+    # Explicit codes win over ranges
     for category, codes in MCC_CATEGORIES.items():
-        if mcc_code in codes:
-            return category
+        for code in codes:
+            table[int(code)] = category
+    return table
+
+_MCC_TABLE = _build_mcc_table()
+
+def get_category_from_mcc(mcc_code) -> str:
+    """Get category name from MCC code (str or int)"""
+    try:
+        code = int(mcc_code)
+    except (TypeError, ValueError):
+        return "other"
+    if 0 <= code < MCC_TABLE_SIZE:
+        return _MCC_TABLE[code]
     return "other"
 
+def _build_category_codes() -> dict:
+    # Every code that maps to each category, range members included;
+    # "other" is whatever no category claims, so it keeps its empty list
+    codes = {category: [] for category in MCC_CATEGORIES}
+    for code, category in enumerate(_MCC_TABLE):
+        if category != "other":
+            codes[category].append(f"{code:04d}")
+    return codes
+
+_CATEGORY_CODES = _build_category_codes()
+
 def get_mcc_codes_for_category(category: str) -> list:
-    """Get MCC codes for a category"""
-    return MCC_CATEGORIES.get(category.lower(), [])
+    """Get MCC codes for a category, including those covered by MCC_RANGES"""
+    return list(_CATEGORY_CODES.get(category.lower(), []))
+
+def get_all_category_codes() -> dict:
+    """{category: MCC codes} for every category, including those covered by MCC_RANGES"""
+    return {category: list(codes) for category, codes in _CATEGORY_CODES.items()}
@@ -0,0 +1,209 @@
+"""
+In-place schema migrations for existing smartcard.db files
+
+create_all() only creates missing tables, so changes to tables that
+already exist are applied here. Each migration runs once and is recorded
+in schema_migrations. Called from database.init_db().
+"""
+from datetime import date, datetime
+
+from sqlalchemy import Date, bindparam, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+# Storage format of SQLAlchemy's SQLite DateTime type. Rows must match it
+# exactly or string ordering (and keyset pagination) breaks.
+SQLITE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+BATCH_SIZE = 1000
+
+
+# Columns that were strings before typed dates, and their new SQL type
+TYPED_DATE_COLUMNS = [
+    ("transactions", "transaction_date", "TIMESTAMP"),
+    ("card_rules", "start_date", "DATE"),
+    ("card_rules", "end_date", "DATE"),
+    ("transaction_rollups", "day", "DATE"),
+]
+
+
+def _typed_dates_postgres(conn: Connection):
+    """Convert VARCHAR date columns left by older schemas in place"""
+    for table, column, sql_type in TYPED_DATE_COLUMNS:
+        data_type = conn.execute(text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = :table AND column_name = :column"
+        ), {"table": table, "column": column}).scalar()
+        if data_type not in ("character varying", "text"):
+            continue
+        conn.execute(text(
+            f"ALTER TABLE {table} ALTER COLUMN {column} TYPE {sql_type} "
+            f"USING NULLIF({column}, '')::{sql_type}"
+        ))
+
+
+def _typed_dates(conn: Connection):
+    """Rewrite ISO-string dates into the typed DateTime/Date storage format"""
+    if conn.dialect.name == "postgresql":
+        _typed_dates_postgres(conn)
+        return
+    if conn.dialect.name != "sqlite":
+        return
+
+    # transaction_date: "2025-01-01T12:00:00[.ffffff]" -> "2025-01-01 12:00:00.ffffff"
+    while True:
+        rows = conn.execute(text(
+            "SELECT id, transaction_date FROM transactions "
+            "WHERE transaction_date IS NOT NULL "
+            "AND (length(transaction_date) != 26 OR substr(transaction_date, 11, 1) != ' ') "
+            "LIMIT :limit"
+        ), {"limit": BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        conn.execute(
+            text("UPDATE transactions SET transaction_date = :value WHERE id = :id"),
+            [
+                {"id": row_id, "value": datetime.fromisoformat(value).strftime(SQLITE_DATETIME_FORMAT)}
+                for row_id, value in rows
+            ]
+        )
+
+    # Rule windows and rollup days are plain dates: keep "YYYY-MM-DD"
+    for table, column, _ in TYPED_DATE_COLUMNS[1:]:
+        conn.execute(text(f"UPDATE {table} SET {column} = NULL WHERE {column} = ''"))
+        conn.execute(text(
+            f"UPDATE {table} SET {column} = substr({column}, 1, 10) WHERE length({column}) > 10"
+        ))
+
+
+def _dedupe_categories(conn: Connection):
+    """Merge duplicate category names so categories.name can be unique"""
+    duplicates = conn.execute(text(
+        "SELECT name, MIN(id) FROM categories GROUP BY name HAVING COUNT(*) > 1"
+    )).fetchall()
+    for name, keep_id in duplicates:
+        params = {"name": name, "keep_id": keep_id}
+        conn.execute(text(
+            "UPDATE card_rules SET category_id = :keep_id WHERE category_id IN "
+            "(SELECT id FROM categories WHERE name = :name AND id != :keep_id)"
+        ), params)
+        conn.execute(text("DELETE FROM categories WHERE name = :name AND id != :keep_id"), params)
+
+
+def _scraped_reward_caps(conn: Connection):
+    """Add scraped_rewards.parsed_cap_cents and have the next scrape re-parse every page"""
+    columns = {column["name"] for column in inspect(conn).get_columns("scraped_rewards")}
+    if "parsed_cap_cents" in columns:
+        return
+    conn.execute(text("ALTER TABLE scraped_rewards ADD COLUMN parsed_cap_cents INTEGER"))
+    # Stored rows were parsed without caps; forget the validators so the
+    # pages come back 200 and their rows get updated
+    conn.execute(text("UPDATE scraped_pages SET etag = NULL, last_modified = NULL, content_hash = NULL"))
+
+
+def _rule_schedule_columns(conn: Connection):
+    """
+    Add cards.opened_date and card_rules.activated_on
+    Rules needing activation used to count as active regardless, so the
+    existing ones are marked activated today rather than switched off.
+    """
+    inspector = inspect(conn)
+    for table, column in (("cards", "opened_date"), ("card_rules", "activated_on")):
+        if column not in {existing["name"] for existing in inspector.get_columns(table)}:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} DATE"))
+    conn.execute(
+        text("UPDATE card_rules SET activated_on = :today WHERE requires_activation AND activated_on IS NULL")
+        .bindparams(bindparam("today", type_=Date)),
+        {"today": date.today()}
+    )
+
+
+def _user_rules_version(conn: Connection):
+    """Add users.rules_version, which rule_index compares to drop stale cached rules"""
+    if "rules_version" not in {column["name"] for column in inspect(conn).get_columns("users")}:
+        conn.execute(text("ALTER TABLE users ADD COLUMN rules_version INTEGER NOT NULL DEFAULT 0"))
+
+
+# (issuer, card_name, raw_text) of the scraper's demo data as of migration
+# 6; frozen here so later edits to the scraper can't change what it flags
+DEMO_REWARDS = [
+    ("Bank of America", "Customized Cash Rewards",
+     "3% cash back in the category of your choice: gas, online shopping, dining, travel, drug stores, "
+     "or home improvement/furnishings"),
+    ("Bank of America", "Customized Cash Rewards",
+     "2% cash back at grocery stores and wholesale clubs (for the first $2,500 in combined choice "
+     "category/grocery store/wholesale club quarterly purchases)"),
+    ("Bank of America", "Customized Cash Rewards", "1% cash back on all other purchases"),
+    ("Bank of America", "Premium Rewards", "2 points per $1 spent on travel and dining purchases"),
+    ("Bank of America", "Premium Rewards", "1.5 points per $1 spent on all other purchases"),
+    ("Bank of America", "Unlimited Cash Rewards", "1.5% unlimited cash back on all purchases"),
+    ("Bank of America", "Travel Rewards", "1.5 points per $1 spent on all purchases"),
+]
+
+
+def _scraped_reward_fallback(conn: Connection):
+    """
+    Add scraped_rewards.fallback
+    Rows stored from a failed page's demo data are recognised by their text
+    and flagged, so reconcile stops promoting them into card rules.
+    """
+    if "fallback" not in {column["name"] for column in inspect(conn).get_columns("scraped_rewards")}:
+        conn.execute(text("ALTER TABLE scraped_rewards ADD COLUMN fallback BOOLEAN NOT NULL DEFAULT FALSE"))
+    conn.execute(text(
+        "UPDATE scraped_rewards SET fallback = TRUE "
+        "WHERE issuer = :issuer AND card_name = :card_name AND raw_text = :raw_text"
+    ), [{"issuer": issuer, "card_name": card_name, "raw_text": raw_text}
+        for issuer, card_name, raw_text in DEMO_REWARDS])
+
+
+def _tap_receipt_ms(conn: Connection):
+    """
+    Widen tap_receipts.ts to BIGINT for the bridge's millisecond timestamps
+    SQLite integers are already 64-bit.
+    """
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE tap_receipts ALTER COLUMN ts TYPE BIGINT"))
+
+
+def _scraped_reward_units(conn: Connection):
+    """
+    Add scraped_rewards.parsed_unit and have the next scrape re-parse every page
+    Until then, only texts that state a percentage and no points or miles
+    count as cashback; the rest stay unknown and aren't promoted.
+    """
+    if "parsed_unit" not in {column["name"] for column in inspect(conn).get_columns("scraped_rewards")}:
+        conn.execute(text("ALTER TABLE scraped_rewards ADD COLUMN parsed_unit VARCHAR"))
+    conn.execute(text(
+        "UPDATE scraped_rewards SET parsed_unit = 'percent' WHERE parsed_unit IS NULL "
+        "AND raw_text LIKE :percent ESCAPE '!' AND lower(raw_text) NOT LIKE :points AND lower(raw_text) NOT LIKE :miles"
+    ), {"percent": "%!%%", "points": "%point%", "miles": "%mile%"})
+    conn.execute(text("UPDATE scraped_pages SET etag = NULL, last_modified = NULL, content_hash = NULL"))
+
+
+MIGRATIONS = [
+    (1, "typed dates", _typed_dates),
+    (2, "unique category names", _dedupe_categories),
+    (3, "scraped reward caps", _scraped_reward_caps),
+    (4, "rule schedule columns", _rule_schedule_columns),
+    (5, "user rules version", _user_rules_version),
+    (6, "scraped reward fallback flag", _scraped_reward_fallback),
+    (7, "millisecond tap receipts", _tap_receipt_ms),
+    (8, "scraped reward units", _scraped_reward_units),
+]
+
+
+def upgrade(engine: Engine):
+    """Apply every migration not yet recorded in schema_migrations"""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, name VARCHAR, applied_at VARCHAR)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+        for version, name, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            migrate(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :at)"),
+                {"v": version, "n": name, "at": datetime.now().isoformat()}
+            )
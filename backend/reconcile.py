@@ -0,0 +1,212 @@
+"""
+Promotion of parsed ScrapedReward rows into CardRule
+
+A scraped reward describes a product (issuer, card name); its rules
+belong to every user's card of that product. For each product with
+unprocessed rows, the product's current rewards are reduced to one offer
+per category and diffed against the rules of each matching card:
+
+- a category the card has no rule for gets a new rule
+- an existing rule (the first one of that category) gets only the fields
+  that differ: the multiplier, and the cap and end date when the scraped
+  text states them (a text that doesn't mention a cap says nothing about
+  one, so a cap entered by hand is kept)
+- rules for categories the issuer no longer advertises are left alone,
+  since rules are also added by hand
+- points and miles rewards are skipped: a CardRule multiplier is a
+  cashback percentage, and what a point is worth depends on the user's
+  valuation (see scoring.py)
+
+Rows stored from a failed page's demo data (ScrapedReward.fallback) are
+not what the issuer advertises and are never promoted.
+
+Everything is read with a few chunked queries, written with bulk
+statements and committed once; the affected users' rule index entries
+are dropped afterwards.
+"""
+from datetime import date
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import insert, tuple_, update
+from sqlalchemy.orm import Session
+
+import database
+import mcc_data
+import rule_index
+
+# Products (and cards) per IN list
+CHUNK_SIZE = 500
+
+Product = Tuple[str, str]  # (issuer, card_name)
+
+
+class Offer(NamedTuple):
+    """What an issuer advertises for one category of one product"""
+    multiplier: float
+    cap_cents: Optional[int]
+    end_date: Optional[date]
+
+
+def _chunks(items: List, size: int = CHUNK_SIZE) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _end_date(value: Optional[str]) -> Optional[date]:
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def product_offers(rewards) -> Dict[str, Offer]:
+    """
+    {category: Offer} from one product's parsed rewards
+    When several texts land in a category the highest multiplier wins,
+    earlier rows breaking ties.
+    """
+    offers: Dict[str, Offer] = {}
+    for reward in rewards:
+        if reward.parsed_category is None or reward.parsed_multiplier is None:
+            continue
+        if reward.parsed_unit != "percent":
+            continue
+        current = offers.get(reward.parsed_category)
+        if current is None or reward.parsed_multiplier > current.multiplier:
+            offers[reward.parsed_category] = Offer(
+                reward.parsed_multiplier, reward.parsed_cap_cents, _end_date(reward.parsed_end_date)
+            )
+    return offers
+
+
+def rule_changes(rule, offer: Offer) -> dict:
+    """Columns of `rule` that differ from `offer`"""
+    changes = {}
+    if rule.multiplier != offer.multiplier:
+        changes["multiplier"] = offer.multiplier
+    if offer.cap_cents is not None and rule.cap_cents != offer.cap_cents:
+        changes["cap_cents"] = offer.cap_cents
+    if offer.end_date is not None and rule.end_date != offer.end_date:
+        changes["end_date"] = offer.end_date
+    return changes
+
+
+def _category_ids(db: Session, names: Iterable[str]) -> Dict[str, int]:
+    """Category ids by name, creating missing categories like POST /cards/{id}/rules does"""
+    names = set(names)
+    ids = {
+        name: category_id for category_id, name in
+        db.query(database.Category.id, database.Category.name).filter(database.Category.name.in_(names))
+    }
+    missing = [
+        {"name": name, "mcc_codes": ",".join(mcc_data.get_mcc_codes_for_category(name))}
+        for name in sorted(names - ids.keys())
+    ]
+    if missing:
+        db.execute(insert(database.Category), missing)
+        ids.update(
+            (name, category_id) for category_id, name in
+            db.query(database.Category.id, database.Category.name).filter(
+                database.Category.name.in_([row["name"] for row in missing])
+            )
+        )
+    return ids
+
+
+def reconcile(db: Session) -> Dict[str, int]:
+    """Apply every unprocessed scraped reward to the matching cards' rules and commit"""
+    reward = database.ScrapedReward
+    counts = {"products": 0, "cards": 0, "rules_created": 0, "rules_updated": 0, "rewards_processed": 0}
+
+    products: List[Product] = [
+        tuple(row) for row in
+        db.query(reward.issuer, reward.card_name).filter(
+            reward.processed.is_(False), reward.fallback.is_(False)
+        ).distinct()
+    ]
+    if not products:
+        return counts
+
+    # Current rewards of those products, processed or not: together they are
+    # what the issuer advertises now
+    rewards_by_product: Dict[Product, list] = {}
+    unprocessed_ids: List[int] = []
+    for chunk in _chunks(products):
+        rows = db.query(
+            reward.id, reward.issuer, reward.card_name, reward.processed, reward.parsed_category,
+            reward.parsed_multiplier, reward.parsed_cap_cents, reward.parsed_end_date, reward.parsed_unit
+        ).filter(
+            tuple_(reward.issuer, reward.card_name).in_(chunk), reward.fallback.is_(False)
+        ).order_by(reward.id)
+        for row in rows:
+            rewards_by_product.setdefault((row.issuer, row.card_name), []).append(row)
+            if not row.processed:
+                unprocessed_ids.append(row.id)
+    offers_by_product = {product: product_offers(rows) for product, rows in rewards_by_product.items()}
+
+    cards: Dict[int, Tuple[int, Product]] = {}  # card_id -> (user_id, product)
+    for chunk in _chunks(products):
+        rows = db.query(
+            database.Card.id, database.Card.user_id, database.Card.issuer, database.Card.card_name
+        ).filter(tuple_(database.Card.issuer, database.Card.card_name).in_(chunk))
+        for card_id, user_id, issuer, card_name in rows:
+            cards[card_id] = (user_id, (issuer, card_name))
+
+    # First rule per (card, category)
+    rules: Dict[Tuple[int, int], object] = {}
+    for chunk in _chunks(list(cards)):
+        rows = db.query(
+            database.CardRule.id, database.CardRule.card_id, database.CardRule.category_id,
+            database.CardRule.multiplier, database.CardRule.cap_cents, database.CardRule.end_date
+        ).filter(database.CardRule.card_id.in_(chunk)).order_by(database.CardRule.id)
+        for rule in rows:
+            rules.setdefault((rule.card_id, rule.category_id), rule)
+
+    category_ids = _category_ids(db, {
+        category for user_id, product in cards.values() for category in offers_by_product.get(product, {})
+    }) if cards else {}
+
+    inserts, updates = [], []
+    users = set()
+    for card_id, (user_id, product) in cards.items():
+        changed = False
+        for category, offer in offers_by_product.get(product, {}).items():
+            rule = rules.get((card_id, category_ids[category]))
+            if rule is None:
+                inserts.append({
+                    "card_id": card_id, "category_id": category_ids[category], "multiplier": offer.multiplier,
+                    "cap_cents": offer.cap_cents, "end_date": offer.end_date,
+                    "requires_activation": False, "priority": 0,
+                })
+                changed = True
+                continue
+            changes = rule_changes(rule, offer)
+            if changes:
+                updates.append({"id": rule.id, **changes})
+                changed = True
+        if changed:
+            users.add(user_id)
+            counts["cards"] += 1
+
+    if inserts:
+        db.execute(insert(database.CardRule), inserts)
+    # Updates change different columns, so group them by column set for executemany
+    by_columns: Dict[Tuple[str, ...], List[dict]] = {}
+    for row in updates:
+        by_columns.setdefault(tuple(sorted(row)), []).append(row)
+    for rows in by_columns.values():
+        db.execute(update(database.CardRule), rows)
+    for chunk in _chunks(unprocessed_ids):
+        db.execute(update(reward).where(reward.id.in_(chunk)).values(processed=True))
+    for chunk in _chunks(sorted(users)):
+        rule_index.bump_rules_version(db, chunk)
+    db.commit()
+
+    for user_id in users:
+        rule_index.invalidate_user(user_id)
+
+    counts.update(
+        products=len(products), rules_created=len(inserts), rules_updated=len(updates),
+        rewards_processed=len(unprocessed_ids)
+    )
+    return counts
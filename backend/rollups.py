@@ -0,0 +1,165 @@
+"""
+Per-user transaction rollups keyed by (user, card, category, day)
+
+Every code path that inserts a Transaction also calls add_transactions or
+add_rows before committing, so the rollups change in the same commit.
+Analytics reads these pre-summed rows instead of the raw history.
+
+Rebuild or check for drift from the command line:
+    python3 rollups.py check
+    python3 rollups.py rebuild
+"""
+import sys
+from datetime import date
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import Date, func, type_coerce
+from sqlalchemy.orm import Session
+
+import database
+
+RollupKey = Tuple[int, int, str, date]
+Totals = Tuple[int, int, int]  # (txn_count, spent_cents, cashback_cents)
+
+KEY_COLUMNS = ["user_id", "card_id", "category", "day"]
+
+
+def day_of(transaction_date) -> date:
+    """Rollup day for a transaction_date value"""
+    return transaction_date.date()
+
+
+def add_transactions(db: Session, transactions: Iterable[database.Transaction]):
+    """Fold new Transaction objects into the rollups (caller commits)"""
+    add_rows(db, [
+        {
+            "user_id": txn.user_id,
+            "card_id": txn.card_id,
+            "category": txn.category,
+            "transaction_date": txn.transaction_date,
+            "amount_cents": txn.amount_cents,
+            "rewards": txn.rewards,
+        }
+        for txn in transactions
+    ])
+
+
+def add_rows(db: Session, rows: Iterable[dict]):
+    """Fold Transaction mappings (as used for bulk inserts) into the rollups"""
+    totals: Dict[RollupKey, List[int]] = {}
+    for row in rows:
+        key = (row["user_id"], row["card_id"], row["category"], day_of(row["transaction_date"]))
+        entry = totals.setdefault(key, [0, 0, 0])
+        entry[0] += 1
+        entry[1] += row["amount_cents"] or 0
+        entry[2] += row["rewards"] or 0
+    if totals:
+        _upsert(db, totals)
+
+
+def insert_for(db: Session):
+    """Dialect insert() with on_conflict_do_update, for counter upserts"""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def _upsert(db: Session, totals: Dict[RollupKey, List[int]]):
+    # Atomic increment, so concurrent writers to the same key don't race
+    rollup = database.TransactionRollup
+    insert = insert_for(db)
+    stmt = insert(rollup).values([
+        dict(zip(KEY_COLUMNS, key), txn_count=count, spent_cents=spent, cashback_cents=cashback)
+        for key, (count, spent, cashback) in totals.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=KEY_COLUMNS,
+        set_={
+            "txn_count": rollup.txn_count + stmt.excluded.txn_count,
+            "spent_cents": rollup.spent_cents + stmt.excluded.spent_cents,
+            "cashback_cents": rollup.cashback_cents + stmt.excluded.cashback_cents,
+        }
+    )
+    db.execute(stmt)
+
+
+def compute_from_transactions(db: Session) -> Dict[RollupKey, Totals]:
+    """Recompute every rollup from the raw transactions table"""
+    txn = database.Transaction
+    # date() gives "YYYY-MM-DD" on SQLite and a DATE on Postgres
+    day = type_coerce(func.date(txn.transaction_date), Date)
+    rows = db.query(
+        txn.user_id, txn.card_id, txn.category, day,
+        func.count(txn.id),
+        func.coalesce(func.sum(txn.amount_cents), 0),
+        func.coalesce(func.sum(txn.rewards), 0)
+    ).group_by(txn.user_id, txn.card_id, txn.category, day).all()
+    return {tuple(row[:4]): tuple(row[4:]) for row in rows}
+
+
+def load_rollups(db: Session) -> Dict[RollupKey, Totals]:
+    rollup = database.TransactionRollup
+    rows = db.query(
+        rollup.user_id, rollup.card_id, rollup.category, rollup.day,
+        rollup.txn_count, rollup.spent_cents, rollup.cashback_cents
+    ).all()
+    return {tuple(row[:4]): tuple(row[4:]) for row in rows}
+
+
+def find_drift(db: Session) -> List[Tuple[RollupKey, Totals, Totals]]:
+    """(key, expected, stored) for every rollup that disagrees with transactions"""
+    expected = compute_from_transactions(db)
+    stored = load_rollups(db)
+    drift = []
+    for key in expected.keys() | stored.keys():
+        want = expected.get(key, (0, 0, 0))
+        have = stored.get(key, (0, 0, 0))
+        if want != have:
+            drift.append((key, want, have))
+    return drift
+
+
+def rebuild(db: Session) -> int:
+    """Replace all rollups with values recomputed from transactions"""
+    expected = compute_from_transactions(db)
+    db.query(database.TransactionRollup).delete()
+    if expected:
+        db.bulk_insert_mappings(database.TransactionRollup, [
+            dict(zip(KEY_COLUMNS, key), txn_count=count, spent_cents=spent, cashback_cents=cashback)
+            for key, (count, spent, cashback) in expected.items()
+        ])
+    db.commit()
+    return len(expected)
+
+
+def backfill_if_empty(db: Session) -> bool:
+    """Build rollups for databases that predate them; returns True if it ran"""
+    if db.query(database.TransactionRollup.id).first() is not None:
+        return False
+    if db.query(database.Transaction.id).first() is None:
+        return False
+    rebuild(db)
+    return True
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if command not in ("check", "rebuild"):
+        print("Usage: python3 rollups.py [check|rebuild]")
+        sys.exit(2)
+
+    database.init_db()
+    db = database.SessionLocal()
+    try:
+        drift = find_drift(db)
+        for key, want, have in drift[:20]:
+            print(f"Drift {key}: expected {want}, stored {have}")
+        print(f"{len(drift)} rollup(s) out of sync")
+        if command == "rebuild":
+            print(f"Rebuilt {rebuild(db)} rollup(s)")
+        elif drift:
+            sys.exit(1)
+    finally:
+        db.close()
@@ -0,0 +1,215 @@
+"""
+In-memory reward-rule index used by /recommend
+
+Rules for a user are loaded once with a single joined query over Card,
+CardRule and Category, then served from memory as a ranked candidate list
+per (user_id, category). Writes to cards or rules invalidate only the
+affected user.
+
+Every instance sharing the database sees those writes too: writers bump
+users.rules_version in the same transaction (bump_rules_version, or
+invalidate_all(db) for every user in one UPDATE), and a lookup reads the
+user's version (one primary-key query) and rebuilds the cached rules when
+it has moved on.
+
+Only rules active today are candidates. Each rule's active interval is
+computed when the user is loaded (see rule_schedule.py); the ranked lists
+are rebuilt from memory when a rule's interval starts or ends.
+
+Each ranked list is compiled into a scoring.Scorer along with it, so
+scoring a purchase reuses precomputed rules.
+"""
+import threading
+from datetime import date
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import update
+
+import database
+import rule_schedule
+import scoring
+
+
+class Candidate(NamedTuple):
+    """A single card rule that can apply to a purchase"""
+    card_id: int
+    card_name: str
+    issuer: str
+    rule_id: int
+    category: str
+    multiplier: float
+    cap_cents: Optional[int]
+    start_date: Optional[date]
+    end_date: Optional[date]
+    active_until: Optional[date] = None  # last active day, including intro periods
+
+
+class UserRules(NamedTuple):
+    """Everything the index knows about one user"""
+    cards: Dict[int, Tuple[str, str]]  # card_id -> (card_name, issuer)
+    schedule: rule_schedule.ActiveRules  # active candidates -> a Scorer per category
+    version: int = 0  # users.rules_version the rules were loaded at
+
+    def by_category(self, day: Optional[date] = None) -> Dict[str, scoring.Scorer]:
+        """Scorers of the ranked candidates per category, "other" rules merged in, for `day` (today)"""
+        return self.schedule.at(day or date.today())
+
+    def scorer(self, category: str, day: Optional[date] = None) -> scoring.Scorer:
+        """Compiled candidates for a purchase in the given category, on `day` (today)"""
+        by_category = self.by_category(day)
+        return by_category.get(category, by_category.get("other", NO_RULES))
+
+
+NO_RULES = scoring.Scorer([])
+
+
+class RuleIndex:
+    """
+    Maps (user_id, category) to a ranked list of candidate rules
+    `valuation` prices a rule's multiplier for scoring (scoring.cashback_value).
+    """
+
+    def __init__(self, valuation: scoring.Valuation = scoring.cashback_value):
+        self._valuation = valuation
+        self._lock = threading.Lock()
+        self._users: Dict[int, UserRules] = {}
+        self._versions: Dict[int, int] = {}
+        self._generation = 0  # moved on by invalidate_all
+
+    def get_user(self, db, user_id: int) -> UserRules:
+        """Return the indexed rules for a user, building them on first use or once they changed"""
+        stored = db.query(database.User.rules_version).filter(database.User.id == user_id).scalar() or 0
+        entry = self._users.get(user_id)
+        if entry is not None and entry.version == stored:
+            return entry
+
+        with self._lock:
+            version = (self._generation, self._versions.get(user_id, 0))
+        entry = self._build(db, user_id)._replace(version=stored)
+        with self._lock:
+            # Don't publish a build that raced with an invalidation
+            if (self._generation, self._versions.get(user_id, 0)) == version:
+                self._users[user_id] = entry
+        return entry
+
+    def scorer(self, db, user_id: int, category: str, day: Optional[date] = None) -> scoring.Scorer:
+        """Compiled candidates for a purchase in the given category, on `day` (today)"""
+        return self.get_user(db, user_id).scorer(category, day)
+
+    def candidates(self, db, user_id: int, category: str, day: Optional[date] = None) -> List[Candidate]:
+        """Ranked candidates for a purchase in the given category, on `day` (today)"""
+        return self.scorer(db, user_id, category, day).candidates
+
+    def invalidate_user(self, user_id: int):
+        """Drop the cached rules for one user"""
+        with self._lock:
+            self._users.pop(user_id, None)
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def invalidate_all(self):
+        """Drop every cached user"""
+        with self._lock:
+            self._generation += 1
+            self._users.clear()
+
+    def _build(self, db, user_id: int) -> UserRules:
+        rows = db.query(
+            database.Card.id,
+            database.Card.card_name,
+            database.Card.issuer,
+            database.CardRule.id,
+            database.Category.name,
+            database.CardRule.multiplier,
+            database.CardRule.cap_cents,
+            database.CardRule.start_date,
+            database.CardRule.end_date,
+            database.Card.opened_date,
+            database.CardRule.intro_duration_months,
+            database.CardRule.requires_activation,
+            database.CardRule.activated_on,
+        ).outerjoin(
+            database.CardRule, database.CardRule.card_id == database.Card.id
+        ).outerjoin(
+            database.Category, database.Category.id == database.CardRule.category_id
+        ).filter(
+            database.Card.user_id == user_id
+        ).order_by(database.Card.id, database.CardRule.id).all()
+
+        cards: Dict[int, Tuple[str, str]] = {}
+        scheduled = []
+        for row in rows:
+            card_id, card_name, issuer, rule_id, cat_name, multiplier, cap_cents, start_date, end_date = row[:9]
+            cards[card_id] = (card_name, issuer)
+            if rule_id is None or cat_name is None:
+                continue
+            interval = rule_schedule.active_interval(
+                start_date, end_date, row.intro_duration_months, row.opened_date,
+                bool(row.requires_activation), row.activated_on
+            )
+            if interval is None:
+                continue
+            scheduled.append((Candidate(
+                card_id, card_name, issuer, rule_id, cat_name,
+                multiplier, cap_cents, start_date, end_date, interval.end
+            ), interval))
+        return UserRules(cards=cards, schedule=rule_schedule.ActiveRules(scheduled, self._rank))
+
+    def _rank(self, candidates: List[Candidate]) -> Dict[str, scoring.Scorer]:
+        grouped: Dict[str, List[Candidate]] = {}
+        for candidate in candidates:
+            grouped.setdefault(candidate.category, []).append(candidate)
+
+        # Rules for "other" apply to every category, so merge them in up front.
+        # Rank by multiplier, keeping card/rule order for ties.
+        other = grouped.get("other", [])
+        by_category = {}
+        for cat_name, rules in grouped.items():
+            merged = rules if cat_name == "other" else rules + other
+            by_category[cat_name] = scoring.Scorer(
+                sorted(merged, key=lambda c: (-c.multiplier, c.card_id, c.rule_id)), self._valuation
+            )
+        return by_category
+
+
+# Process-wide index shared by the API
+_index = RuleIndex()
+
+
+def get_user(db, user_id: int) -> UserRules:
+    return _index.get_user(db, user_id)
+
+
+def get_candidates(db, user_id: int, category: str, day: Optional[date] = None) -> List[Candidate]:
+    return _index.candidates(db, user_id, category, day)
+
+
+def get_scorer(db, user_id: int, category: str, day: Optional[date] = None) -> scoring.Scorer:
+    return _index.scorer(db, user_id, category, day)
+
+
+def bump_rules_version(db, user_ids: Optional[Iterable[int]] = None):
+    """
+    Mark users' cards or rules as changed for every instance (all users
+    when user_ids is None); commit it with the change
+    """
+    stmt = update(database.User).values(rules_version=database.User.rules_version + 1)
+    if user_ids is not None:
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return
+        stmt = stmt.where(database.User.id.in_(user_ids))
+    db.execute(stmt.execution_options(synchronize_session=False))
+
+
+def invalidate_user(user_id: int):
+    _index.invalidate_user(user_id)
+
+
+def invalidate_all(db=None):
+    """
+    Drop every cached user; given the writer's session, also bump every
+    user's rules_version in its transaction so other instances rebuild
+    """
+    if db is not None:
+        bump_rules_version(db)
+    _index.invalidate_all()
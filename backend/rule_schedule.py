@@ -0,0 +1,109 @@
+"""
+When each reward rule is active
+
+A rule's active interval is worked out once from its typed dates, when
+the rule index loads a user (or a transaction loads its card's rules):
+
+- start_date / end_date bound it (both inclusive)
+- intro_duration_months limits it to the first N months after the card's
+  opened_date; with no open date on file the intro limit can't be placed
+  and only start/end apply
+- a rule with requires_activation starts on the day it was activated
+  (activated_on) and is never active before that
+
+ActiveRules then answers "which rules are active today" from those
+intervals and only recomputes when today crosses the next boundary, so
+serving a tap is a date comparison.
+"""
+import bisect
+import calendar
+from datetime import date, timedelta
+from typing import Callable, Generic, Iterable, List, NamedTuple, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class Interval(NamedTuple):
+    """Days a rule is active, inclusive; None means unbounded"""
+    start: Optional[date]
+    end: Optional[date]
+
+    def contains(self, day: date) -> bool:
+        return (self.start is None or self.start <= day) and (self.end is None or day <= self.end)
+
+
+def add_months(day: date, months: int) -> date:
+    """Same day `months` later, clamped to the end of a shorter month"""
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def active_interval(start_date: Optional[date], end_date: Optional[date],
+                    intro_duration_months: Optional[int] = None, opened_date: Optional[date] = None,
+                    requires_activation: bool = False, activated_on: Optional[date] = None
+                    ) -> Optional[Interval]:
+    """The rule's active interval, or None if it can't be active (not activated, or empty)"""
+    start, end = start_date, end_date
+    if requires_activation:
+        if activated_on is None:
+            return None
+        start = max(start, activated_on) if start else activated_on
+    if intro_duration_months and opened_date:
+        intro_end = add_months(opened_date, intro_duration_months) - timedelta(days=1)
+        start = max(start, opened_date) if start else opened_date
+        end = min(end, intro_end) if end else intro_end
+    if start and end and start > end:
+        return None
+    return Interval(start, end)
+
+
+def rule_interval(rule, opened_date: Optional[date] = None) -> Optional[Interval]:
+    """active_interval() of a CardRule (or any object with its columns)"""
+    return active_interval(
+        rule.start_date, rule.end_date, rule.intro_duration_months, opened_date,
+        bool(rule.requires_activation), rule.activated_on
+    )
+
+
+def boundaries(intervals: Iterable[Optional[Interval]]) -> List[date]:
+    """Sorted days on which some rule becomes active or stops being active"""
+    days = set()
+    for interval in intervals:
+        if interval is None:
+            continue
+        if interval.start is not None:
+            days.add(interval.start)
+        if interval.end is not None:
+            days.add(interval.end + timedelta(days=1))
+    return sorted(days)
+
+
+class ActiveRules(Generic[T]):
+    """
+    Items whose interval contains a given day, cached until the next boundary
+    `select(active_items)` builds the view served until the set next changes
+    (e.g. ranked candidate lists per category).
+    """
+
+    def __init__(self, items: List[Tuple[T, Optional[Interval]]], select: Callable[[List[T]], object]):
+        self._items = [(item, interval) for item, interval in items if interval is not None]
+        self._select = select
+        self._boundaries = boundaries(interval for _, interval in self._items)
+        # (valid_from, valid_until, view): the view holds for valid_from <= day < valid_until.
+        # Replaced as one tuple, so other threads never see a view with another view's span.
+        self._cached: Optional[Tuple[Optional[date], Optional[date], object]] = None
+
+    def at(self, day: date):
+        """The view for `day`; recomputed only when `day` is outside the cached span"""
+        cached = self._cached
+        if cached is not None:
+            valid_from, valid_until, view = cached
+            if (valid_from is None or valid_from <= day) and (valid_until is None or day < valid_until):
+                return view
+        view = self._select([item for item, interval in self._items if interval.contains(day)])
+        position = bisect.bisect_right(self._boundaries, day)
+        valid_from = self._boundaries[position - 1] if position else None
+        valid_until = self._boundaries[position] if position < len(self._boundaries) else None
+        self._cached = (valid_from, valid_until, view)
+        return view
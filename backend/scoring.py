@@ -0,0 +1,135 @@
+"""
+Reward scoring shared by every endpoint that picks or prices a card rule
+
+A candidate list (rule_index.Candidate, or anything with the same fields)
+is compiled once into a Scorer: slotted rule objects holding the valued
+multiplier and the card's base rate, ordered so the best uncapped rule is
+known up front. The rule index keeps one Scorer per category for the
+rules active today, so /recommend, /recommend/batch and /transactions
+all score the same compiled rules the same way:
+
+- the purchase goes to the rule earning the most cashback, ties going to
+  the higher multiplier and then to the earlier candidate
+- a capped rule earns its multiplier only on the spend left under its cap
+  (`spent`, see spend_caps.py); the rest earns the card's base rate, its
+  best uncapped "other" rule. Without `spent` caps are ignored.
+
+Two extension points:
+
+- valuation(candidate) -> cents per unit of multiplier; 1.0 for cashback
+  percentages, e.g. 1.5 for points a user redeems at 1.5 cents
+- cap_reward(amount, multiplier, cap, spent, base) -> (cashback, effective
+  multiplier) for a capped rule; defaults to spend_caps.capped_reward
+"""
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import spend_caps
+
+Valuation = Callable[[object], float]
+CapReward = Callable[[int, float, int, int, float], Tuple[int, float]]
+
+
+def cashback_value(candidate) -> float:
+    """Default valuation: a multiplier is a cashback percentage"""
+    return 1.0
+
+
+class CompiledRule:
+    """One candidate with what scoring needs precomputed"""
+    __slots__ = ("candidate", "rule_id", "card_id", "multiplier", "cap_cents", "base")
+
+    def __init__(self, candidate, multiplier: float, base: float):
+        self.candidate = candidate
+        self.rule_id = candidate.rule_id
+        self.card_id = candidate.card_id
+        self.multiplier = multiplier  # valued: cents per dollar
+        self.cap_cents = candidate.cap_cents
+        self.base = base  # what spend past the cap earns
+
+
+class Scorer:
+    """Compiled, ranked rules of one candidate list"""
+    __slots__ = ("candidates", "rules", "capped_rule_ids", "top", "cap_reward")
+
+    def __init__(self, candidates: Sequence, valuation: Valuation = cashback_value,
+                 cap_reward: CapReward = spend_caps.capped_reward):
+        self.candidates = list(candidates)
+        values = [candidate.multiplier * valuation(candidate) for candidate in self.candidates]
+        bases: Dict[int, float] = {}
+        for candidate, value in zip(self.candidates, values):
+            if candidate.category == "other" and candidate.cap_cents is None:
+                bases[candidate.card_id] = max(bases.get(candidate.card_id, 0.0), value)
+        self.rules = [
+            CompiledRule(candidate, value, bases.get(candidate.card_id, 0.0))
+            for candidate, value in zip(self.candidates, values)
+        ]
+        self.capped_rule_ids = [rule.rule_id for rule in self.rules if rule.cap_cents is not None]
+        # Without caps cashback only grows with the multiplier, so the first
+        # rule with the highest one wins every purchase
+        self.top = max(self.rules, key=lambda rule: rule.multiplier, default=None)
+        if self.top is not None and self.top.multiplier <= 0:
+            self.top = None
+        self.cap_reward = cap_reward
+
+    def score(self, amount_cents: int, spent: Optional[Dict[int, int]] = None,
+              card_id: Optional[int] = None) -> Tuple[Optional[object], int, float]:
+        """
+        (candidate, cashback, effective multiplier) of the best rule for a purchase
+        `card_id` limits the choice to one card's rules (e.g. the card a
+        transaction was made with).
+        """
+        if card_id is None and (spent is None or not self.capped_rule_ids):
+            top = self.top
+            if top is None:
+                return None, 0, 0
+            return top.candidate, int((amount_cents * top.multiplier) / 100), top.multiplier
+
+        best = None
+        best_multiplier = 0
+        best_cashback = 0
+        for rule in self.rules:
+            if card_id is not None and rule.card_id != card_id:
+                continue
+            if rule.cap_cents is None or spent is None:
+                multiplier = rule.multiplier
+                cashback = int((amount_cents * multiplier) / 100)
+            else:
+                cashback, multiplier = self.cap_reward(
+                    amount_cents, rule.multiplier, rule.cap_cents, spent.get(rule.rule_id, 0), rule.base
+                )
+            if cashback > best_cashback or (cashback == best_cashback and multiplier > best_multiplier):
+                best = rule
+                best_multiplier = multiplier
+                best_cashback = cashback
+        return (best.candidate if best else None), best_cashback, best_multiplier
+
+    def score_many(self, amounts: List[int], spent: Optional[Dict[int, int]] = None, accumulate: bool = False
+                   ) -> Tuple[List[Optional[object]], List[int], List[float]]:
+        """
+        score() for many purchases at once, as three parallel lists
+
+        Without caps in play every purchase goes to the top rule, so the
+        cashback column is one pass over the amounts. Otherwise purchases
+        are scored one after another; with `accumulate` each one's spend is
+        added to `spent` in place and counts toward the cap for the
+        purchases after it, as when they are recorded.
+        """
+        if spent is None or not self.capped_rule_ids:
+            top = self.top
+            count = len(amounts)
+            if top is None:
+                return [None] * count, [0] * count, [0] * count
+            multiplier = top.multiplier
+            return [top.candidate] * count, [int((amount * multiplier) / 100) for amount in amounts], [multiplier] * count
+
+        best: List[Optional[object]] = []
+        best_cashback: List[int] = []
+        best_multiplier: List[float] = []
+        for amount in amounts:
+            candidate, cashback, multiplier = self.score(amount, spent)
+            if accumulate and candidate is not None and candidate.cap_cents is not None:
+                spent[candidate.rule_id] = spent.get(candidate.rule_id, 0) + amount
+            best.append(candidate)
+            best_cashback.append(cashback)
+            best_multiplier.append(multiplier)
+        return best, best_cashback, best_multiplier
@@ -0,0 +1,172 @@
+"""
+Streaming scrape pipeline used by /scraper/run
+
+Three stages connected by bounded queues:
+
+1. fetch: the scraper's Fetcher, at most a window of pages in flight;
+   unchanged pages (304 or same content hash) stop here
+2. extract and parse: changed pages go to a process pool, so
+   BeautifulSoup and the reward regexes run on other cores while the
+   next pages download
+3. store: a writer thread takes parsed pages in fetch order and upserts
+   them SCRAPER_BATCH_PAGES at a time, one short transaction per batch
+
+A full queue blocks the stage feeding it, so however many pages an issuer
+has, only a bounded number of page bodies and parsed results are held at
+once.
+"""
+import multiprocessing
+import os
+import queue
+import threading
+import traceback
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import scrape_store
+from fetcher import Fetcher
+from scraper import PageResult, extract_page
+
+SCRAPER_PARSE_WORKERS = int(os.getenv("SCRAPER_PARSE_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+SCRAPER_QUEUE_SIZE = int(os.getenv("SCRAPER_QUEUE_SIZE", "16"))  # pages waiting between stages
+SCRAPER_BATCH_PAGES = int(os.getenv("SCRAPER_BATCH_PAGES", "25"))  # pages per commit
+
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+
+
+def parse_pool() -> ProcessPoolExecutor:
+    """Process pool shared by every run, created on first use (workers start once, not per scrape)"""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # spawn: forking a process that runs threads (uvicorn, tap consumer) is unsafe
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=SCRAPER_PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _parse_pool
+
+
+def shutdown_parse_pool():
+    global _parse_pool
+    with _parse_pool_lock:
+        pool, _parse_pool = _parse_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ScrapePipeline:
+    """
+    One scrape of one issuer, streamed through fetch -> parse -> store
+    `executor` runs extract_page; by default the shared parse_pool().
+    """
+
+    def __init__(self, scraper, session_factory: Callable, executor: Optional[Executor] = None,
+                 queue_size: int = SCRAPER_QUEUE_SIZE, batch_pages: int = SCRAPER_BATCH_PAGES,
+                 on_page: Optional[Callable[[PageResult], None]] = None):
+        self.scraper = scraper
+        self.session_factory = session_factory
+        self.executor = executor
+        self.batch_pages = batch_pages
+        self.on_page = on_page
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._held = 0  # pages fetched but not yet committed
+        self.peak_held = 0
+        self._error: Optional[BaseException] = None
+
+    def _hold(self, count: int):
+        with self._lock:
+            self._held += count
+            self.peak_held = max(self.peak_held, self._held)
+
+    def run(self) -> Dict[str, int]:
+        """Scrape every card page and store the changes; returns row and page counts"""
+        scraper = self.scraper
+        urls = scraper.card_urls()
+        with self.session_factory() as db:
+            known_pages = scrape_store.load_page_states(db, urls.values())
+        headers = {card_name: scraper.conditional_headers(known_pages.get(url)) for card_name, url in urls.items()}
+
+        counts = {"scraped_count": 0, "inserted": 0, "updated": 0, "deleted": 0,
+                  "pages_changed": 0, "pages_unchanged": 0, "pages_failed": 0}
+        writer = threading.Thread(target=self._store, args=(counts,), name="scrape-writer", daemon=True)
+        executor = self.executor or parse_pool()
+        fetcher = scraper.fetcher or Fetcher(headers=scraper.headers)
+        writer.start()
+        try:
+            for card_name, result in fetcher.iter_fetch(urls, headers):
+                if self._error is not None:
+                    break
+                self._hold(1)
+                known = known_pages.get(result.url)
+                try:
+                    page = scraper.check_page(card_name, result, known)
+                except Exception as e:
+                    self._queue.put(scraper.failed_page(card_name, result, known, e))
+                    continue
+                if page.status != "changed":
+                    self._queue.put((page, []))
+                    continue
+                # Blocks while the queue is full: parsing or storing is behind
+                self._queue.put((page, executor.submit(extract_page, type(scraper), card_name, result.text), known))
+        finally:
+            self._queue.put(None)
+            writer.join()
+            if scraper.fetcher is None:
+                fetcher.close()
+
+        if self._error is not None:
+            raise self._error
+        return counts
+
+    def _store(self, counts: Dict[str, int]):
+        """Writer thread: resolve parsed pages in order and commit them in batches"""
+        pages: List[PageResult] = []
+        rewards: List[dict] = []
+        with self.session_factory() as db:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                if self._error is not None:
+                    if len(item) == 3:
+                        item[1].cancel()  # the pool is shared: don't parse pages nobody will store
+                    continue  # keep draining so the fetch stage never blocks
+                try:
+                    page, page_rewards = self._resolve(item)
+                    pages.append(page)
+                    rewards += page_rewards
+                    if self.on_page:
+                        self.on_page(page)
+                    if len(pages) >= self.batch_pages:
+                        self._flush(db, pages, rewards, counts)
+                        pages, rewards = [], []
+                except BaseException as e:
+                    traceback.print_exc()
+                    self._error = e
+            if pages and self._error is None:
+                try:
+                    self._flush(db, pages, rewards, counts)
+                except BaseException as e:
+                    traceback.print_exc()
+                    self._error = e
+
+    def _resolve(self, item):
+        if len(item) == 2:
+            return item
+        page, future, known = item
+        try:
+            return page, future.result()
+        except Exception as e:
+            # Parsing failed; report it like a failed fetch (a PageResult has
+            # the url and elapsed that failed_page reads off a FetchResult)
+            return self.scraper.failed_page(page.card_name, page, known, e)
+
+    def _flush(self, db, pages: List[PageResult], rewards: List[dict], counts: Dict[str, int]):
+        batch = scrape_store.save_scrape(db, self.scraper.ISSUER, pages, rewards)
+        counts["scraped_count"] += len(rewards)
+        for key, value in batch.items():
+            counts[key] += value
+        with self._lock:
+            self._held -= len(pages)
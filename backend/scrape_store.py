@@ -0,0 +1,131 @@
+"""
+Persistence for scraper runs
+
+Remembers each card page's validators and content hash (ScrapedPage) so
+the next run can send conditional GETs, and upserts ScrapedReward rows
+for changed pages only: new reward texts are inserted, re-parsed ones
+updated, and texts that disappeared from the page deleted. Rows from a
+page's demo data (status "fallback") are flagged so reconcile.py never
+promotes them into card rules. Pages and
+rows change in the same commit (one per batch of pages, see
+scrape_pipeline.py).
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, insert, update
+from sqlalchemy.orm import Session
+
+import database
+from scraper import PageResult, PageState, RewardParser
+
+# Page outcomes whose rewards replace the card's stored rows
+REPLACING_STATUSES = ("changed", "fallback")
+
+
+def load_page_states(db: Session, urls: Iterable[str]) -> Dict[str, PageState]:
+    """{url: PageState} for the pages scraped before"""
+    pages = db.query(database.ScrapedPage).filter(database.ScrapedPage.url.in_(list(urls))).all()
+    return {page.url: PageState(page.etag, page.last_modified, page.content_hash) for page in pages}
+
+
+def _parsed_values(parsed: Optional[dict]) -> dict:
+    parsed = parsed or {}
+    return {
+        "parsed_category": parsed.get("category"),
+        "parsed_multiplier": parsed.get("multiplier"),
+        "parsed_end_date": parsed.get("end_date"),
+        "parsed_cap_cents": parsed.get("cap_cents"),
+        "parsed_unit": parsed.get("unit"),
+    }
+
+
+def save_scrape(db: Session, issuer: str, pages: Iterable[PageResult], rewards: List[dict]) -> Dict[str, int]:
+    """
+    Store one scrape (or one batch of pages of it) of an issuer and commit
+    `rewards` only needs to hold the rewards of changed cards, as returned
+    by scrape_rewards(known_pages). Rewards already carrying their parse
+    result under "parsed" (see scraper.extract_page) aren't parsed again.
+    Rows are written with one bulk INSERT, UPDATE and DELETE each.
+    Returns row counts by outcome.
+    """
+    pages = list(pages)
+    now = datetime.now()
+    counts = {"inserted": 0, "updated": 0, "deleted": 0,
+              "pages_changed": 0, "pages_unchanged": 0, "pages_failed": 0}
+
+    # Rewards of changed cards, deduplicated by text
+    replaced_cards = {page.card_name for page in pages if page.status in REPLACING_STATUSES}
+    fallback_cards = {page.card_name for page in pages if page.status == "fallback"}
+    new_rewards = {}
+    for reward in rewards:
+        if reward["card_name"] in replaced_cards:
+            new_rewards.setdefault((reward["card_name"], reward["raw_text"]), reward)
+
+    unparsed = [key for key, reward in new_rewards.items() if "parsed" not in reward]
+    parsed = dict(zip(unparsed, RewardParser.parse_many(text for _, text in unparsed)))
+
+    existing = {}
+    if replaced_cards:
+        reward = database.ScrapedReward
+        rows = db.query(
+            reward.id, reward.card_name, reward.raw_text, reward.fallback,
+            reward.parsed_category, reward.parsed_multiplier, reward.parsed_end_date, reward.parsed_cap_cents,
+            reward.parsed_unit
+        ).filter(
+            reward.issuer == issuer,
+            reward.card_name.in_(replaced_cards)
+        ).order_by(reward.id).all()
+        for row in rows:
+            existing.setdefault((row.card_name, row.raw_text), []).append(row)
+
+    inserts, updates, deletes = [], [], []
+    for key, reward in new_rewards.items():
+        values = _parsed_values(parsed[key] if key in parsed else reward["parsed"])
+        values["fallback"] = reward["card_name"] in fallback_cards
+        rows = existing.pop(key, [])
+        if not rows:
+            inserts.append({
+                "issuer": issuer, "card_name": reward["card_name"], "raw_text": reward["raw_text"],
+                "scraped_at": reward["scraped_at"], "processed": False, **values
+            })
+            continue
+        row, duplicates = rows[0], rows[1:]
+        deletes += [duplicate.id for duplicate in duplicates]
+        if any(getattr(row, column) != value for column, value in values.items()):
+            updates.append({"id": row.id, "scraped_at": reward["scraped_at"], "processed": False, **values})
+
+    # Texts no longer on a changed page
+    for rows in existing.values():
+        deletes += [row.id for row in rows]
+
+    if inserts:
+        db.execute(insert(database.ScrapedReward), inserts)
+    if updates:
+        # ORM bulk UPDATE by primary key: one executemany
+        db.execute(update(database.ScrapedReward), updates)
+    if deletes:
+        db.execute(delete(database.ScrapedReward).where(database.ScrapedReward.id.in_(deletes)))
+    counts["inserted"], counts["updated"], counts["deleted"] = len(inserts), len(updates), len(deletes)
+
+    stored_pages = {
+        page.url: page for page in db.query(database.ScrapedPage).filter(
+            database.ScrapedPage.url.in_([page.url for page in pages])
+        )
+    }
+    for page in pages:
+        status = "failed" if page.status == "fallback" else page.status
+        counts[f"pages_{status}"] += 1
+        if page.state is None:
+            continue
+        stored = stored_pages.get(page.url)
+        if stored is None:
+            stored = database.ScrapedPage(url=page.url, issuer=issuer, card_name=page.card_name)
+            db.add(stored)
+        stored.etag, stored.last_modified, stored.content_hash = page.state
+        stored.checked_at = now
+        if page.status == "changed":
+            stored.changed_at = now
+
+    db.commit()
+    return counts
@@ -1,87 +1,204 @@
-import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+import hashlib
+import os
 import re
 from datetime import datetime
-from typing import List, Dict, Optional
-import time
+from typing import Callable, Iterable, List, Dict, NamedTuple, Optional
+
+from fetcher import Fetcher
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# Elements that can hold reward text: tag -> substrings of its class
+# attribute (the old CSS selectors, e.g. div[class*="reward"])
+REWARD_ELEMENTS = {
+    "div": ("reward", "benefit", "cash-back"),
+    "p": ("reward",),
+    "li": ("benefit",),
+    "span": ("percent",),
+}
+REWARD_KEYWORDS = re.compile(r"%|cash|points|reward|bonus", re.IGNORECASE)
+
+def _is_reward_element(tag) -> bool:
+    markers = REWARD_ELEMENTS.get(tag.name)
+    if not markers:
+        return False
+    classes = tag.get("class")
+    if not classes:
+        return False
+    class_attr = " ".join(classes) if isinstance(classes, list) else classes
+    return any(marker in class_attr for marker in markers)
+
+# Only these tags (with a class) are built; navigation, scripts and
+# footers are skipped while parsing
+REWARD_STRAINER = SoupStrainer(list(REWARD_ELEMENTS), class_=True)
+
+class PageState(NamedTuple):
+    """What we know about a page from its last successful fetch"""
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_hash: Optional[str]
+
+class PageResult(NamedTuple):
+    """Outcome of one card page in a scrape"""
+    card_name: str
+    url: str
+    status: str  # "changed", "unchanged", "fallback" or "failed"
+    state: Optional[PageState]  # to remember for next time; None unless fetched
+    elapsed: float
 
 class BankOfAmericaScraper:
     """
     Web scraper for Bank of America credit card rewards
     """
     
-    def __init__(self):
-        self.base_url = "https://www.bankofamerica.com"
+    ISSUER = "Bank of America"
+    
+    # Common Bank of America credit cards to scrape
+    CARD_URLS = {
+        "Customized Cash Rewards": "/en-us/credit-cards/products/cash-back-credit-card/",
+        "Premium Rewards": "/en-us/credit-cards/products/premium-rewards-credit-card/",
+        "Unlimited Cash Rewards": "/en-us/credit-cards/products/unlimited-cash-back-credit-card/",
+        "Travel Rewards": "/en-us/credit-cards/products/travel-rewards-credit-card/"
+    }
+    
+    def __init__(self, base_url: Optional[str] = None, fetcher: Optional[Fetcher] = None):
+        # BOFA_BASE_URL points the scraper at a mirror or a local test server
+        self.base_url = (base_url or os.getenv("BOFA_BASE_URL", "https://www.bankofamerica.com")).rstrip("/")
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
+        self.fetcher = fetcher
+        # Fetch results and page outcomes of the last scrape_rewards() run, by card name
+        self.last_results = {}
+        self.pages: Dict[str, PageResult] = {}
+    
+    def card_urls(self) -> Dict[str, str]:
+        return {card_name: self.base_url + url_path for card_name, url_path in self.CARD_URLS.items()}
     
-    def scrape_rewards(self) -> List[Dict]:
+    @staticmethod
+    def conditional_headers(state: Optional[PageState]) -> Dict[str, str]:
+        headers = {}
+        if state and state.etag:
+            headers['If-None-Match'] = state.etag
+        if state and state.last_modified:
+            headers['If-Modified-Since'] = state.last_modified
+        return headers
+    
+    def scrape_rewards(self, known_pages: Optional[Dict[str, PageState]] = None,
+                       on_page: Optional[Callable[[PageResult], None]] = None) -> List[Dict]:
         """
         Scrape Bank of America credit card rewards information
+        Pages are fetched concurrently (see fetcher.py). With `known_pages`
+        ({url: PageState} from the last run) requests are conditional, and
+        pages that come back 304 or with the same content hash are not
+        parsed: only changed cards appear in the result. See self.pages for
+        each card's outcome; `on_page` is also called with each one as it
+        finishes.
+        
+        A card whose page can't be fetched or parsed falls back to the
+        built-in data, unless it was scraped before (its stored rows stay).
         
         Returns:
             List of dictionaries containing reward information
         """
-        rewards = []
+        known_pages = known_pages or {}
+        by_card = {}
+        urls = self.card_urls()
+        headers = {card_name: self.conditional_headers(known_pages.get(url)) for card_name, url in urls.items()}
         
-        # Common Bank of America credit cards to scrape
-        card_urls = {
-            "Customized Cash Rewards": "/en-us/credit-cards/products/cash-back-credit-card/",
-            "Premium Rewards": "/en-us/credit-cards/products/premium-rewards-credit-card/",
-            "Unlimited Cash Rewards": "/en-us/credit-cards/products/unlimited-cash-back-credit-card/",
-            "Travel Rewards": "/en-us/credit-cards/products/travel-rewards-credit-card/"
-        }
+        fetcher = self.fetcher or Fetcher(headers=self.headers)
+        try:
+            self.last_results = {}
+            self.pages = {}
+            for card_name, result in fetcher.iter_fetch(urls, headers):
+                self.last_results[card_name] = result
+                self.pages[card_name], by_card[card_name] = self._process_page(
+                    card_name, result, known_pages.get(result.url)
+                )
+                if on_page:
+                    on_page(self.pages[card_name])
+        finally:
+            if self.fetcher is None:
+                fetcher.close()
+        
+        # Pages finish in any order; keep the output in card order
+        return [reward for card_name in urls for reward in by_card[card_name]]
+    
+    def _process_page(self, card_name: str, result, known: Optional[PageState]):
+        """(PageResult, rewards) for one fetched card page"""
+        try:
+            page = self.check_page(card_name, result, known)
+            if page.status != "changed":
+                return page, []
+            
+            # Extract reward information from various sections
+            return page, self.extract_rewards(card_name, result.text)
+            
+        except Exception as e:
+            return self.failed_page(card_name, result, known, e)
+    
+    def check_page(self, card_name: str, result, known: Optional[PageState]) -> PageResult:
+        """
+        Outcome of a fetch before any parsing: "unchanged" for a 304 or the
+        same content hash, else "changed" (the page needs parsing)
+        Raises if the fetch failed.
+        """
+        if not result.ok:
+            raise RuntimeError(result.error)
         
-        for card_name, url_path in card_urls.items():
-            try:
-                print(f"Scraping {card_name}...")
-                full_url = self.base_url + url_path
-                
-                response = requests.get(full_url, headers=self.headers, timeout=10)
-                response.raise_for_status()
-                
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Extract reward information from various sections
-                reward_texts = self._extract_reward_texts(soup, card_name)
-                rewards.extend(reward_texts)
-                
-                # Be respectful - add delay between requests
-                time.sleep(2)
-                
-            except Exception as e:
-                print(f"Error scraping {card_name}: {str(e)}")
-                # Add fallback data for demonstration
-                rewards.extend(self._get_fallback_data(card_name))
+        if result.status == 304:
+            print(f"{card_name}: not modified")
+            return PageResult(card_name, result.url, "unchanged", known, result.elapsed)
         
-        return rewards
+        state = PageState(
+            etag=result.headers.get('ETag'),
+            last_modified=result.headers.get('Last-Modified'),
+            content_hash=hashlib.sha256(result.text.encode('utf-8')).hexdigest()
+        )
+        if known and known.content_hash == state.content_hash:
+            print(f"{card_name}: content unchanged")
+            return PageResult(card_name, result.url, "unchanged", state, result.elapsed)
+        
+        print(f"Scraped {card_name} in {result.elapsed:.2f}s ({result.attempts} attempt(s))")
+        return PageResult(card_name, result.url, "changed", state, result.elapsed)
+    
+    def failed_page(self, card_name: str, result, known: Optional[PageState], error: Exception):
+        """(PageResult, rewards) for a page that couldn't be fetched or parsed"""
+        print(f"Error scraping {card_name}: {str(error)}")
+        if known:
+            return PageResult(card_name, result.url, "failed", None, result.elapsed), []
+        # Add fallback data for demonstration
+        return PageResult(card_name, result.url, "fallback", None, result.elapsed), self._get_fallback_data(card_name)
+    
+    def extract_rewards(self, card_name: str, html: str) -> List[Dict]:
+        return self._extract_reward_texts(self.parse_html(html), card_name)
+    
+    @staticmethod
+    def parse_html(html: str) -> BeautifulSoup:
+        """Parse only the elements _extract_reward_texts can use (lxml if installed)"""
+        return BeautifulSoup(html, HTML_PARSER, parse_only=REWARD_STRAINER)
     
     def _extract_reward_texts(self, soup: BeautifulSoup, card_name: str) -> List[Dict]:
-        """Extract reward text from parsed HTML"""
+        """Extract reward text from parsed HTML in one pass, without duplicates"""
         rewards = []
+        seen = set()
+        scraped_at = datetime.now().isoformat()
         
-        # Look for common reward-related elements
-        selectors = [
-            'div[class*="reward"]',
-            'div[class*="benefit"]',
-            'div[class*="cash-back"]',
-            'p[class*="reward"]',
-            'li[class*="benefit"]',
-            'span[class*="percent"]'
-        ]
-        
-        for selector in selectors:
-            elements = soup.select(selector)
-            for elem in elements:
-                text = elem.get_text(strip=True)
-                if text and any(keyword in text.lower() for keyword in ['%', 'cash', 'points', 'reward', 'bonus']):
-                    rewards.append({
-                        'issuer': 'Bank of America',
-                        'card_name': card_name,
-                        'raw_text': text,
-                        'scraped_at': datetime.now().isoformat()
-                    })
+        for elem in soup.find_all(_is_reward_element):
+            text = elem.get_text(strip=True)
+            if text and text not in seen and REWARD_KEYWORDS.search(text):
+                seen.add(text)
+                rewards.append({
+                    'issuer': self.ISSUER,
+                    'card_name': card_name,
+                    'raw_text': text,
+                    'scraped_at': scraped_at
+                })
         
         return rewards
     
@@ -145,10 +262,54 @@ class BankOfAmericaScraper:
 class RewardParser:
     """
     Parse scraped reward text into structured data
+    Every pattern is compiled once, when the class is defined. Patterns
+    are written in lower case and run on the lower-cased text, which keeps
+    their literal prefixes fast to scan for (re.IGNORECASE defeats that).
     """
     
-    @staticmethod
-    def parse_reward_text(text: str) -> Optional[Dict]:
+    PERCENT = re.compile(r'(\d+(?:\.\d+)?)\s*%')
+    POINTS = re.compile(r'(\d+(?:\.\d+)?)\s*(point|mile)s?\s*(?:per|for|\/)\s*\$1')
+    CAP = re.compile(r'\$\s*(\d+(?:,\d{3})*(?:\.\d{2})?)')
+    
+    # In priority order: a text mentioning several categories gets the first
+    CATEGORIES = {
+        'dining': r'\b(?:dining|restaurants?|food)\b',
+        'groceries': r'\b(?:grocery|groceries|supermarket)\b',
+        'gas': r'\b(?:gas|fuel|gas stations?)\b',
+        # 'travel': r'\b(?:travel|hotels?|flights?|airlines?)\b',
+        'online_shopping': r'\b(?:online shopping|online purchases?)\b',
+        'drugstores': r'\b(?:drug stores?|pharmacy|pharmacies)\b',
+        'entertainment': r'\b(?:entertainment|movies?|concerts?)\b',
+        # 'transit': r'\b(?:transit|transportation|subway|bus)\b',
+        'streaming': r'\b(?:streaming|subscription)\b',
+        'other': r'(?:all other|everything else|other purchases|all purchases|for all|on all|unlimited)'
+    }
+    # All categories as one alternation of named groups: a single scan of
+    # the text finds every mention, match.lastgroup names its category, and
+    # the mention with the best priority wins
+    CATEGORY = re.compile('|'.join(f'(?P<{category}>{pattern})' for category, pattern in CATEGORIES.items()))
+    PRIORITY = {category: rank for rank, category in enumerate(CATEGORIES)}
+    
+    # Tried in order; a later pattern that yields a valid date wins
+    DATES = (
+        re.compile(r'until\s+(\w+\s+\d{1,2},?\s+\d{4})'),
+        re.compile(r'through\s+(\w+\s+\d{1,2},?\s+\d{4})'),
+        re.compile(r'expires?\s+(\w+\s+\d{1,2},?\s+\d{4})')
+    )
+    
+    @classmethod
+    def find_category(cls, lowered: str) -> Optional[str]:
+        """The highest-priority category mentioned in lower-cased text"""
+        best = None
+        for mention in cls.CATEGORY.finditer(lowered):
+            if best is None or cls.PRIORITY[mention.lastgroup] < cls.PRIORITY[best]:
+                best = mention.lastgroup
+                if cls.PRIORITY[best] == 0:
+                    break
+        return best
+    
+    @classmethod
+    def parse_reward_text(cls, text: str) -> Optional[Dict]:
         """
         Parse reward text to extract multiplier, category, and dates
         
@@ -158,73 +319,63 @@ class RewardParser:
         Returns:
             Dictionary with parsed reward information or None
         """
+        lowered = text.lower()
+        # Points/miles multiplier, else cashback percentage; 'unit' tells which
+        match = cls.POINTS.search(lowered)
+        unit = f'{match.group(2)}s' if match else 'percent'
+        match = match or cls.PERCENT.search(lowered)
+        # Only return if we found at least a multiplier
+        if match is None:
+            return None
+        
         result = {
-            'multiplier': None,
-            'category': None,
+            'multiplier': float(match.group(1)),
+            'unit': unit,
+            'category': cls.find_category(lowered),
             'end_date': None,
             'cap_cents': None
         }
         
-        # Extract percentage/multiplier
-        percent_pattern = r'(\d+(?:\.\d+)?)\s*%'
-        percent_match = re.search(percent_pattern, text)
-        if percent_match:
-            result['multiplier'] = float(percent_match.group(1))
-        
-        # Extract points multiplier
-        points_pattern = r'(\d+(?:\.\d+)?)\s*points?\s*(?:per|for|\/)\s*\$1'
-        points_match = re.search(points_pattern, text, re.IGNORECASE)
-        if points_match:
-            result['multiplier'] = float(points_match.group(1))
-        
-        # Extract category
-        categories = {
-            'dining': r'\b(dining|restaurants?|food)\b',
-            'groceries': r'\b(grocery|groceries|supermarket)\b',
-            'gas': r'\b(gas|fuel|gas stations?)\b',
-            # 'travel': r'\b(travel|hotels?|flights?|airlines?)\b',
-            'online_shopping': r'\b(online shopping|online purchases?)\b',
-            'drugstores': r'\b(drug stores?|pharmacy|pharmacies)\b',
-            'entertainment': r'\b(entertainment|movies?|concerts?)\b',
-            # 'transit': r'\b(transit|transportation|subway|bus)\b',
-            'streaming': r'\b(streaming|subscription)\b',
-            'other': r'(all other|everything else|other purchases|all purchases|for all|on all|unlimited)'
-        }
-        
-        for category, pattern in categories.items():
-            if re.search(pattern, text, re.IGNORECASE):
-                result['category'] = category
-                break
-        
         # Extract spending cap
-        cap_pattern = r'\$\s*(\d+(?:,\d{3})*(?:\.\d{2})?)'
-        cap_match = re.search(cap_pattern, text)
-        if cap_match and 'quarter' in text.lower():
-            cap_amount = float(cap_match.group(1).replace(',', ''))
-            result['cap_cents'] = int(cap_amount * 100)
+        if 'quarter' in lowered:
+            cap_match = cls.CAP.search(text)
+            if cap_match:
+                cap_amount = float(cap_match.group(1).replace(',', ''))
+                result['cap_cents'] = int(cap_amount * 100)
         
         # Extract end date
-        date_patterns = [
-            r'until\s+(\w+\s+\d{1,2},?\s+\d{4})',
-            r'through\s+(\w+\s+\d{1,2},?\s+\d{4})',
-            r'expires?\s+(\w+\s+\d{1,2},?\s+\d{4})'
-        ]
-        
-        for pattern in date_patterns:
-            date_match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in cls.DATES:
+            date_match = pattern.search(lowered)
             if date_match:
                 try:
-                    date_str = date_match.group(1)
-                    parsed_date = datetime.strptime(date_str, "%B %d, %Y")
+                    parsed_date = datetime.strptime(date_match.group(1), "%B %d, %Y")
                     result['end_date'] = parsed_date.strftime("%Y-%m-%d")
-                except:
+                except ValueError:
                     pass
         
-        # Only return if we found at least a multiplier
-        if result['multiplier'] is not None:
-            return result
-        
-        return None
+        return result
+    
+    @classmethod
+    def parse_many(cls, texts: Iterable[str]) -> List[Optional[Dict]]:
+        """parse_reward_text for each text, in order; repeated texts are parsed once"""
+        parsed = {}
+        results = []
+        for text in texts:
+            if text not in parsed:
+                parsed[text] = cls.parse_reward_text(text)
+            result = parsed[text]
+            results.append(dict(result) if result is not None else None)
+        return results
+
+def extract_page(scraper_cls, card_name: str, html: str) -> List[Dict]:
+    """
+    Reward texts of one card page, each with its parsed values under 'parsed'
+    (None if unparseable). Module-level so a process pool can run it.
+    """
+    rewards = scraper_cls().extract_rewards(card_name, html)
+    for reward, parsed in zip(rewards, RewardParser.parse_many(r['raw_text'] for r in rewards)):
+        reward['parsed'] = parsed
+    return rewards
 
 def run_scraper():
     """Run the Bank of America scraper and parse results"""
@@ -1,7 +1,8 @@
 """
 Seed the database with sample users, cards, and reward rules
 """
-from database import SessionLocal, init_db, User, Card, Category, CardRule
+from database import (SessionLocal, init_db, User, Card, Category, CardRule, RuleSpend, TapReceipt,
+                      Transaction, TransactionRollup)
 import mcc_data
 
 def seed_database():
@@ -10,7 +11,11 @@ def seed_database():
     db = SessionLocal()
     
     try:
-        # Clear existing data
+        # Clear existing data, referencing rows first (foreign keys)
+        db.query(TapReceipt).delete()
+        db.query(RuleSpend).delete()
+        db.query(TransactionRollup).delete()
+        db.query(Transaction).delete()
         db.query(CardRule).delete()
         db.query(Card).delete()
         db.query(Category).delete()
@@ -20,7 +25,7 @@ def seed_database():
         print("Creating categories...")
         # Create categories (shared across all users)
         categories = {}
-        for cat_name, mcc_codes in mcc_data.MCC_CATEGORIES.items():
+        for cat_name, mcc_codes in mcc_data.get_all_category_codes().items():
             category = Category(name=cat_name, mcc_codes=",".join(mcc_codes))
             db.add(category)
             db.commit()
@@ -119,6 +124,7 @@ def seed_database():
     except Exception as e:
         print(f"Error seeding database: {e}")
         db.rollback()
+        raise
     finally:
         db.close()
 
@@ -0,0 +1,78 @@
+"""
+Period-to-date spend on capped reward rules
+
+A rule's cap_cents is how much spend per period (PERIOD_MONTHS calendar
+months: a quarter) earns its multiplier (e.g. 3% on the first $2,500 of
+purchases each quarter); spend past the cap earns the card's base rate, its best uncapped "other" rule.
+Every purchase a capped rule is applied to adds its amount to a RuleSpend
+counter in the same commit as the Transaction, so scoring a purchase reads
+one small row per capped candidate instead of summing history.
+"""
+from datetime import date
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy.orm import Session
+
+import database
+from rollups import insert_for
+
+
+PERIOD_MONTHS = 3
+PERIOD_NAME = {1: "monthly", 3: "quarterly", 6: "half-yearly", 12: "yearly"}[PERIOD_MONTHS]
+
+
+def period_start(day: date) -> date:
+    """First day of the cap period containing `day`"""
+    return date(day.year, PERIOD_MONTHS * ((day.month - 1) // PERIOD_MONTHS) + 1, 1)
+
+
+def load_spent(db: Session, rule_ids: Iterable[int], day: date) -> Dict[int, int]:
+    """{rule_id: spend so far this period} for the given rules (absent means 0)"""
+    rule_ids = list(rule_ids)
+    if not rule_ids:
+        return {}
+    spend = database.RuleSpend
+    rows = db.query(spend.rule_id, spend.spent_cents).filter(
+        spend.rule_id.in_(rule_ids),
+        spend.period_start == period_start(day)
+    )
+    return dict(rows.all())
+
+
+def capped_reward(amount_cents: int, multiplier: float, cap_cents: int, spent_cents: int,
+                  base_multiplier: float) -> Tuple[int, float]:
+    """
+    (cashback, effective multiplier) for a purchase under a capped rule
+    The part of the purchase that still fits under the cap earns
+    `multiplier`, the rest `base_multiplier`.
+    """
+    within = max(0, min(amount_cents, cap_cents - spent_cents))
+    over = amount_cents - within
+    cashback = int((within * multiplier + over * base_multiplier) / 100)
+    if over == 0:
+        return cashback, multiplier
+    if within == 0:
+        return cashback, base_multiplier
+    return cashback, round((within * multiplier + over * base_multiplier) / amount_cents, 2)
+
+
+def add_spend(db: Session, rows: Iterable[Tuple[int, date, int]]):
+    """Count (rule_id, day, amount_cents) purchases toward their rules' caps (caller commits)"""
+    totals: Dict[Tuple[int, date], int] = {}
+    for rule_id, day, amount_cents in rows:
+        key = (rule_id, period_start(day))
+        totals[key] = totals.get(key, 0) + amount_cents
+    if not totals:
+        return
+    # Atomic increment, so concurrent writers to the same rule don't race
+    spend = database.RuleSpend
+    insert = insert_for(db)
+    stmt = insert(spend).values([
+        {"rule_id": rule_id, "period_start": start, "spent_cents": amount}
+        for (rule_id, start), amount in totals.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["rule_id", "period_start"],
+        set_={"spent_cents": spend.spent_cents + stmt.excluded.spent_cents}
+    )
+    db.execute(stmt)
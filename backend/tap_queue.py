@@ -0,0 +1,218 @@
+"""
+Durable tap queue between the BLE bridge and the recommendation engine
+
+Taps are appended to a SQLite (WAL) log with increasing sequence numbers
+and drained by consumers in batches at their own pace. Each consumer keeps
+its own committed offset, so delivery is at-least-once; processing must be
+idempotent on (uid, ts).
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+TAP_QUEUE_PATH = os.getenv("TAP_QUEUE_PATH", "./tap_queue.db")
+TAP_QUEUE_MAX_DEPTH = int(os.getenv("TAP_QUEUE_MAX_DEPTH", "10000"))
+TAP_QUEUE_BATCH_SIZE = int(os.getenv("TAP_QUEUE_BATCH_SIZE", "100"))
+
+
+class Tap(NamedTuple):
+    seq: int
+    uid: str
+    mcc: str
+    ts: int
+
+
+class QueueFull(Exception):
+    """Raised when the backlog exceeds the configured maximum depth"""
+
+
+class TapQueue:
+    """
+    Append-only tap log with per-consumer offsets
+    """
+
+    def __init__(self, path: str = TAP_QUEUE_PATH, max_depth: int = TAP_QUEUE_MAX_DEPTH):
+        self.path = path
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._appended = threading.Event()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS taps (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                uid TEXT NOT NULL,
+                mcc TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                received_at REAL NOT NULL,
+                UNIQUE (uid, ts)
+            );
+            CREATE TABLE IF NOT EXISTS consumer_offsets (
+                consumer TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL
+            );
+        """)
+
+    def append(self, uid: str, mcc, ts: int, consumer: str = "recommend") -> int:
+        """
+        Durably append a tap and return its sequence number
+        Re-sending the same (uid, ts) returns the original sequence number,
+        even while the queue is full. Raises QueueFull when a new tap would
+        take the consumer's backlog past max_depth.
+        """
+        with self._lock:
+            seq = self._seq_of(uid, ts)
+            if seq is not None:
+                return seq
+            if self._depth(consumer) >= self.max_depth:
+                raise QueueFull(f"tap backlog is at {self.max_depth}")
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO taps (uid, mcc, ts, received_at) VALUES (?, ?, ?, ?)",
+                (uid, str(mcc), ts, time.time())
+            )
+            if not cursor.rowcount:
+                return self._seq_of(uid, ts)  # appended by another process sharing the file
+            self._appended.set()
+            return cursor.lastrowid
+
+    def read_batch(self, consumer: str, limit: int = TAP_QUEUE_BATCH_SIZE) -> List[Tap]:
+        """Taps after the consumer's committed offset, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, uid, mcc, ts FROM taps WHERE seq > ? ORDER BY seq LIMIT ?",
+                (self._offset(consumer), limit)
+            ).fetchall()
+        return [Tap(*row) for row in rows]
+
+    def commit(self, consumer: str, seq: int):
+        """Mark everything up to and including seq as processed by the consumer"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO consumer_offsets (consumer, seq) VALUES (?, ?) "
+                "ON CONFLICT(consumer) DO UPDATE SET seq = MAX(seq, excluded.seq)",
+                (consumer, seq)
+            )
+
+    def depth(self, consumer: str) -> int:
+        """Number of taps the consumer has not committed yet"""
+        with self._lock:
+            return self._depth(consumer)
+
+    def offset(self, consumer: str) -> int:
+        with self._lock:
+            return self._offset(consumer)
+
+    def compact(self) -> int:
+        """Delete taps every consumer has committed; returns rows removed"""
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(seq) FROM consumer_offsets").fetchone()
+            if row[0] is None:
+                return 0
+            return self._conn.execute("DELETE FROM taps WHERE seq <= ?", (row[0],)).rowcount
+
+    def clear_appended(self):
+        """Reset the append signal; call before reading so no append is missed"""
+        self._appended.clear()
+
+    def wait_for_append(self, timeout: float):
+        """Block until something is appended or the timeout expires"""
+        self._appended.wait(timeout)
+
+    def wake(self):
+        """Wake anyone blocked in wait_for_append"""
+        self._appended.set()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _seq_of(self, uid: str, ts: int) -> Optional[int]:
+        row = self._conn.execute("SELECT seq FROM taps WHERE uid = ? AND ts = ?", (uid, ts)).fetchone()
+        return row[0] if row else None
+
+    def _offset(self, consumer: str) -> int:
+        row = self._conn.execute(
+            "SELECT seq FROM consumer_offsets WHERE consumer = ?", (consumer,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _depth(self, consumer: str) -> int:
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM taps WHERE seq > ?", (self._offset(consumer),)
+        ).fetchone()[0]
+
+
+class TapConsumer:
+    """
+    Background thread that drains a TapQueue in batches
+
+    handler(batch) must be idempotent. If it raises, the batch is not
+    committed and is redelivered after a short backoff.
+    """
+
+    def __init__(self, queue: TapQueue, handler: Callable[[List[Tap]], None],
+                 name: str = "recommend", batch_size: int = TAP_QUEUE_BATCH_SIZE,
+                 idle_timeout: float = 0.5, retry_backoff: float = 1.0):
+        self.queue = queue
+        self.handler = handler
+        self.name = name
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self.retry_backoff = retry_backoff
+        self._stop = threading.Event()
+        self._committed = threading.Condition()
+        self._uncompacted = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"tap-consumer-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.queue.wake()
+        if self._thread:
+            self._thread.join()
+
+    def drain_once(self) -> int:
+        """Process one batch; returns the number of taps handled"""
+        batch = self.queue.read_batch(self.name, self.batch_size)
+        if not batch:
+            return 0
+        self.handler(batch)
+        self.queue.commit(self.name, batch[-1].seq)
+        self._uncompacted = True
+        with self._committed:
+            self._committed.notify_all()
+        return len(batch)
+
+    def wait_for(self, seq: int, timeout: float = 5.0) -> bool:
+        """Block until the consumer has committed seq"""
+        deadline = time.monotonic() + timeout
+        with self._committed:
+            while self.queue.offset(self.name) < seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._committed.wait(remaining)
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.queue.clear_appended()
+                if not self.drain_once():
+                    # Caught up: drop committed taps so the log stays small
+                    if self._uncompacted:
+                        self.queue.compact()
+                        self._uncompacted = False
+                    self.queue.wait_for_append(self.idle_timeout)
+            except Exception:
+                logger.exception("Tap consumer error, retrying batch")
+                self._stop.wait(self.retry_backoff)
@@ -0,0 +1,91 @@
+"""
+Tests for /analytics/{user_id} aggregated in SQL
+Run with: python3 -m pytest test_analytics.py
+"""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+import main
+import rollups
+
+
+@pytest.fixture
+def user_ids(db):
+    """Two users with random transactions"""
+    users = [database.User(email=f"user{i}@example.com", name=f"user{i}", hashed_password="x") for i in (1, 2)]
+    db.add_all(users)
+    db.flush()
+    # Two of the user's cards share a name: the breakdown is by card name
+    cards = [
+        database.Card(user_id=users[0].id, issuer="Issuer", card_name=name, last_four=f"000{i}")
+        for i, name in enumerate(("Dining", "Travel", "Travel"))
+    ] + [database.Card(user_id=users[1].id, issuer="Issuer", card_name="Other user", last_four="0009")]
+    db.add_all(cards)
+    db.flush()
+
+    rng = random.Random(3)
+    rows = []
+    for i in range(60):
+        card = rng.choice(cards)
+        amount = rng.randint(100, 50000)
+        rows.append({
+            "user_id": card.user_id, "card_id": card.id if i % 10 else None, "amount_cents": amount,
+            "mcc_code": "5812", "category": rng.choice(["dining", "travel", "other"]),
+            "rewards": amount * rng.choice([1, 2, 3]) // 100, "multiplier": 1.0,
+            "transaction_date": datetime(2025, 1, 1, 12) + timedelta(days=rng.randint(0, 400)),
+        })
+    db.bulk_insert_mappings(database.Transaction, rows)
+    rollups.add_rows(db, rows)
+    db.commit()
+    return [user.id for user in users]
+
+
+def row_by_row(db, user_id):
+    """What the endpoint computed before it aggregated in SQL"""
+    card_names = {card.id: card.card_name for card in db.query(database.Card)}
+    by_category, by_card = {}, {}
+    for txn in db.query(database.Transaction).filter(database.Transaction.user_id == user_id):
+        for breakdown, key in ((by_category, txn.category), (by_card, card_names.get(txn.card_id, "Unknown"))):
+            entry = breakdown.setdefault(key, {"count": 0, "total_spent_cents": 0, "total_cashback_cents": 0})
+            entry["count"] += 1
+            entry["total_spent_cents"] += txn.amount_cents
+            entry["total_cashback_cents"] += txn.rewards
+    return by_category, by_card
+
+
+def test_breakdowns_match_the_raw_transactions(db, user_ids):
+    for user_id in user_ids:
+        by_category, by_card = row_by_row(db, user_id)
+
+        analytics = main.get_user_analytics(user_id, db=db)
+
+        assert analytics["by_category"] == by_category
+        assert analytics["by_card"] == by_card
+        spent = sum(entry["total_spent_cents"] for entry in by_category.values())
+        cashback = sum(entry["total_cashback_cents"] for entry in by_category.values())
+        assert analytics["total_transactions"] == sum(entry["count"] for entry in by_category.values())
+        assert (analytics["total_spent_cents"], analytics["total_cashback_cents"]) == (spent, cashback)
+        assert analytics["total_spent_dollars"] == spent / 100
+        assert analytics["average_cashback_rate"] == round(cashback / spent * 100, 2)
+    assert "Unknown" in main.get_user_analytics(user_ids[0], db=db)["by_card"]
+
+
+def test_user_without_transactions_gets_empty_analytics(db, user_ids):
+    assert main.get_user_analytics(user_ids[-1] + 1, db=db) == {
+        "total_transactions": 0,
+        "total_spent_cents": 0,
+        "total_cashback_cents": 0,
+        "average_cashback_rate": 0,
+        "by_category": {},
+        "by_card": {}
+    }
+
+
+def test_analytics_runs_two_grouped_queries(db, user_ids, statements):
+    statements.clear()
+    main.get_user_analytics(user_ids[0], db=db)
+
+    assert len(statements) == 2
@@ -0,0 +1,193 @@
+"""
+Tests for the async database path (DB_MODE=async)
+The async endpoints must return exactly what their sync variants return;
+reads query an AsyncSession, writes run in the threadpool.
+Run with: python3 -m pytest test_async_db.py
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+import database
+import main
+import rollups
+
+pytest.importorskip("aiosqlite")
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+
+@pytest.fixture
+def url(engine, db):
+    session = db
+    dining = database.Category(name="dining", mcc_codes="5812")
+    user = database.User(email="async@example.com", name="async", hashed_password="x")
+    session.add_all([dining, user])
+    session.flush()
+    card = database.Card(user_id=user.id, issuer="Issuer", card_name="Card", last_four="0000")
+    session.add(card)
+    session.flush()
+    session.add(database.CardRule(card_id=card.id, category_id=dining.id, multiplier=3.0))
+    transactions = [
+        database.Transaction(user_id=user.id, card_id=card.id, amount_cents=1000 + i, mcc_code="5812",
+                             category="dining", rewards=30, multiplier=3.0,
+                             transaction_date=datetime(2025, 1, 1 + i, 12))
+        for i in range(5)
+    ]
+    session.add_all(transactions)
+    rollups.add_transactions(session, transactions)
+    session.commit()
+    return engine.url.render_as_string(hide_password=False)
+
+
+def run_both(url, sync_call, async_call):
+    """Call the sync endpoint and its async variant against the same database"""
+    engine = database.create_db_engine(url)
+    with sessionmaker(bind=engine)() as session:
+        expected = sync_call(session)
+    engine.dispose()
+    return expected, run_async(url, async_call)
+
+
+def run_async(url, async_call):
+    """Await an async endpoint with an AsyncSession on the database"""
+    async def run():
+        async_engine = database.create_async_db_engine(url)
+        try:
+            async with async_sessionmaker(async_engine)() as session:
+                return await async_call(session)
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(run())
+
+
+def run_write(url, async_call):
+    """Await an async write endpoint with the sync Session it hands to the threadpool"""
+    engine = database.create_db_engine(url)
+    try:
+        with sessionmaker(bind=engine)() as session:
+            return asyncio.run(async_call(session))
+    finally:
+        engine.dispose()
+
+
+def off_the_event_loop(monkeypatch, name):
+    """Record the threads main.<name> runs on"""
+    fn, threads = getattr(main, name), []
+
+    def tracked(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return fn(*args, **kwargs)
+
+    monkeypatch.setattr(main, name, tracked)
+    return threads
+
+
+def test_async_url():
+    assert database.async_url("sqlite:///./smartcard.db") == "sqlite+aiosqlite:///./smartcard.db"
+    assert database.async_url("postgresql://u@h/db") == "postgresql+psycopg://u@h/db"
+
+
+def test_async_analytics_matches_sync(url):
+    expected, actual = run_both(
+        url,
+        lambda db: main.get_user_analytics(1, db=db),
+        lambda db: main.get_user_analytics_async(1, db=db)
+    )
+    assert actual == expected
+    assert actual["total_transactions"] == 5
+
+
+def test_async_transactions_match_sync(url):
+    sync_page, async_page = Response(), Response()
+    expected, actual = run_both(
+        url,
+        lambda db: main.get_user_transactions(1, sync_page, limit=2, cursor=None, db=db),
+        lambda db: main.get_user_transactions_async(1, async_page, limit=2, cursor=None, db=db)
+    )
+    assert actual == expected
+    assert async_page.headers["X-Next-Cursor"] == sync_page.headers["X-Next-Cursor"]
+
+    sync_page, async_page = Response(), Response()
+    expected, actual = run_both(
+        url,
+        lambda db: main.get_card_transactions(1, sync_page, limit=3, cursor=None, db=db),
+        lambda db: main.get_card_transactions_async(1, async_page, limit=3, cursor=None, db=db)
+    )
+    assert actual == expected and len(actual) == 3
+    assert async_page.headers["X-Next-Cursor"] == sync_page.headers["X-Next-Cursor"]
+
+
+def test_async_create_transaction(url, monkeypatch):
+    request = main.TransactionCreate(user_id=1, card_id=1, amount_cents=2000, mcc_code="5812")
+    threads = off_the_event_loop(monkeypatch, "create_transaction")
+
+    created = run_write(url, lambda db: main.create_transaction_async(request, db=db))
+
+    assert created.cashback_cents == 60
+    assert threads and threading.main_thread() not in threads
+
+    engine = database.create_db_engine(url)
+    with sessionmaker(bind=engine)() as session:
+        assert main.get_user_analytics(1, db=session)["total_transactions"] == 6
+    engine.dispose()
+
+
+def test_async_card_check_reads_the_owner_on_the_async_session(url):
+    run_async(url, lambda db: main.authorize_card_async(1, {"sub": 1}, db=db))
+    run_async(url, lambda db: main.authorize_card_async(1, None, db=db))
+    with pytest.raises(HTTPException) as error:
+        run_async(url, lambda db: main.authorize_card_async(1, {"sub": 2}, db=db))
+    assert error.value.status_code == 403
+
+
+def test_async_recommend_runs_off_the_event_loop(url, db, tmp_path, monkeypatch):
+    # Taps from any card but C10AAEA4 belong to user 2
+    user = database.User(email="taps@example.com", name="taps", hashed_password="x")
+    db.add(user)
+    db.flush()
+    card = database.Card(user_id=user.id, issuer="Issuer", card_name="Tap card", last_four="0002")
+    db.add(card)
+    db.flush()
+    db.add(database.CardRule(card_id=card.id, category_id=1, multiplier=2.0))
+    db.commit()
+    hello = tmp_path / "hello.json"
+    hello.write_text(json.dumps({"uid": "0A1B2C3D", "mcc": "5812", "ts": 1700000000}))
+    monkeypatch.setattr(main, "HELLO_JSON_PATH", str(hello))
+    read_threads = off_the_event_loop(monkeypatch, "read_json")
+    tap_threads = off_the_event_loop(monkeypatch, "process_tap")
+
+    response = run_write(url, lambda session: main.recommend_card_async(db=session))
+
+    assert (response.card_name, response.multiplier) == ("Tap card", 2.0)
+    assert read_threads and tap_threads and threading.main_thread() not in read_threads + tap_threads
+
+
+def test_db_mode_selects_async_routes(tmp_path):
+    script = (
+        "import main\n"
+        "from fastapi.testclient import TestClient\n"
+        "routes = {r.path: r.endpoint.__name__ for r in main.app.routes if r.path.startswith('/analytics')}\n"
+        "assert routes == {'/analytics/{user_id}': 'get_user_analytics_async'}, routes\n"
+        "card_route = next(r for r in main.app.routes if r.path == '/transactions/card/{card_id}')\n"
+        "assert card_route.dependant.dependencies[0].call is main.authorize_card_async\n"
+        "with TestClient(main.app) as client:\n"
+        "    assert client.get('/analytics/1').status_code == 200\n"
+    )
+    subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=tmp_path, check=True,
+        env={**os.environ, "DB_MODE": "async", "PYTHONPATH": str(BACKEND_DIR),
+             "TAP_QUEUE_PATH": str(tmp_path / "taps.db")}
+    )
@@ -0,0 +1,216 @@
+"""
+Tests for password hashing off the request thread and session tokens
+Run with: python3 -m pytest test_auth.py
+"""
+import asyncio
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+import auth
+import database
+import main
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+
+@pytest.fixture
+def hash_pool():
+    pool = auth.HashPool(workers=1, max_pending=2, rounds=4)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture
+def client(session_factory, monkeypatch):
+    def get_test_db():
+        with session_factory() as db:
+            yield db
+
+    pool = auth.HashPool(workers=1, max_pending=4, rounds=4)
+    monkeypatch.setattr(auth, "hash_pool", pool)
+    main.app.dependency_overrides[database.get_db] = get_test_db
+    main.app.dependency_overrides[database.get_read_db] = get_test_db
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+    pool.shutdown()
+
+
+def test_pool_hashes_with_configured_cost(hash_pool):
+    hashed = asyncio.run(hash_pool.hash("hunter2"))
+
+    assert hashed.startswith("$2b$04$")
+    assert asyncio.run(hash_pool.verify("hunter2", hashed))
+    assert not asyncio.run(hash_pool.verify("hunter3", hashed))
+    assert hash_pool.stats()["completed"] == 3
+
+
+def test_pool_rejects_beyond_max_pending(hash_pool):
+    async def burst():
+        return await asyncio.gather(*(hash_pool.hash("pw") for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(burst())
+
+    assert sum(isinstance(r, auth.HashPoolBusy) for r in results) == 1
+    assert hash_pool.stats()["rejected"] == 1
+    assert hash_pool.stats()["pending"] == 0
+
+
+def test_session_token_round_trip():
+    token, expires_at = auth.create_session_token(42, secret="s")
+
+    assert auth.verify_session_token(token, secret="s") == 42
+    assert auth.verify_session_token(token, secret="other") is None
+    assert auth.verify_session_token(token[:-2] + "AA", secret="s") is None
+    assert auth.verify_session_token("not-a-token", secret="s") is None
+
+
+def test_expired_session_token_is_rejected():
+    token, _ = auth.create_session_token(42, ttl_seconds=-1, secret="s")
+
+    assert auth.verify_session_token(token, secret="s") is None
+
+
+def test_login_returns_refreshable_session(client):
+    created = client.post("/users", json={"email": "a@example.com", "name": "a", "password": "pw"})
+    assert created.status_code == 200
+
+    assert client.post("/login", json={"email": "a@example.com", "password": "wrong"}).status_code == 401
+    login = client.post("/login", json={"email": "a@example.com", "password": "pw"})
+    assert login.status_code == 200
+    assert login.json()["id"] == created.json()["id"]
+
+    token = login.json()["access_token"]
+    refreshed = client.post("/sessions/refresh", headers={"Authorization": f"Bearer {token}"})
+    assert refreshed.status_code == 200
+    assert refreshed.json()["email"] == "a@example.com"
+    assert client.post("/sessions/refresh", headers={"Authorization": "Bearer nope"}).status_code == 401
+
+
+def test_signup_racing_another_with_the_same_email_is_rejected(client, monkeypatch):
+    # Both requests passed the "already registered" check before either inserted
+    monkeypatch.setattr(main, "find_user_by_email", lambda db, email: None)
+    signup = {"email": "dana@example.com", "name": "dana", "password": "pw"}
+
+    assert client.post("/users", json=signup).status_code == 200
+    again = client.post("/users", json=signup)
+
+    assert (again.status_code, again.json()["detail"]) == (400, "Email already registered")
+    assert client.post("/users", json=dict(signup, email="erin@example.com")).status_code == 200
+
+
+def test_revoked_session_token_is_rejected():
+    token, _ = auth.create_session_token(7)
+    claims = auth.decode_session_token(token)
+    assert claims["sub"] == 7
+
+    auth.revoked_tokens.revoke(claims)
+    assert auth.verify_session_token(token) is None
+
+    later, _ = auth.create_session_token(8)
+    auth.revoked_tokens.revoke_user(8)
+    assert auth.verify_session_token(later) is None
+
+
+def sign_up(client, email):
+    user = client.post("/users", json={"email": email, "name": email, "password": "pw"}).json()
+    token = client.post("/login", json={"email": email, "password": "pw"}).json()["access_token"]
+    return user["id"], {"Authorization": f"Bearer {token}"}
+
+
+def test_endpoints_check_the_session_user(client, monkeypatch):
+    alice, alice_auth = sign_up(client, "alice@example.com")
+    bob, _ = sign_up(client, "bob@example.com")
+
+    assert client.get(f"/users/{alice}/cards", headers=alice_auth).status_code == 200
+    assert client.get(f"/users/{bob}/cards", headers=alice_auth).status_code == 403
+    assert client.get(f"/analytics/{bob}", headers=alice_auth).status_code == 403
+    assert client.get(f"/users/{alice}/cards", headers={"Authorization": "Bearer nope"}).status_code == 401
+    purchase = {"user_id": bob, "card_id": 1, "amount_cents": 100, "mcc_code": "5812"}
+    assert client.post("/transactions", json=purchase, headers=alice_auth).status_code == 403
+
+    # Tokens stay optional until AUTH_REQUIRED is set
+    assert client.get(f"/users/{bob}/cards").status_code == 200
+    monkeypatch.setattr(main, "AUTH_REQUIRED", True)
+    assert client.get(f"/users/{bob}/cards").status_code == 401
+
+
+def test_transactions_only_go_on_the_users_own_cards(client):
+    alice, alice_auth = sign_up(client, "alice@example.com")
+    bob, bob_auth = sign_up(client, "bob@example.com")
+    card = {"issuer": "Issuer", "card_name": "Card", "last_four": "0000"}
+    alice_card = client.post(f"/users/{alice}/cards", json=card, headers=alice_auth).json()["id"]
+    bob_card = client.post(f"/users/{bob}/cards", json=card, headers=bob_auth).json()["id"]
+
+    purchase = {"user_id": alice, "card_id": bob_card, "amount_cents": 100, "mcc_code": "5812"}
+    assert client.post("/transactions", json=purchase, headers=alice_auth).status_code == 404
+    assert client.post("/transactions", json=purchase).status_code == 404
+    assert client.get(f"/transactions/card/{bob_card}", headers=bob_auth).json() == []
+
+    purchase["card_id"] = alice_card
+    assert client.post("/transactions", json=purchase, headers=alice_auth).status_code == 200
+
+
+def test_expired_token_counts_as_anonymous_until_auth_is_required(client, monkeypatch):
+    alice, _ = sign_up(client, "alice@example.com")
+    expired, _ = auth.create_session_token(alice, ttl_seconds=-1)
+    headers = {"Authorization": f"Bearer {expired}"}
+
+    assert auth.is_stale_session_token(expired)
+    assert client.get(f"/users/{alice}/cards", headers=headers).status_code == 200
+    monkeypatch.setattr(main, "AUTH_REQUIRED", True)
+    assert client.get(f"/users/{alice}/cards", headers=headers).status_code == 401
+
+
+def test_token_signed_with_an_old_secret_counts_as_anonymous_until_auth_is_required(client, monkeypatch):
+    alice, _ = sign_up(client, "alice@example.com")
+    old, _ = auth.create_session_token(alice, secret="secret-before-a-restart")
+    headers = {"Authorization": f"Bearer {old}"}
+
+    assert auth.is_stale_session_token(old) and not auth.is_stale_session_token("nope")
+    assert client.get(f"/users/{alice}/cards", headers=headers).status_code == 200
+    assert client.get(f"/users/{alice}/cards", headers={"Authorization": "Bearer nope"}).status_code == 401
+    monkeypatch.setattr(main, "AUTH_REQUIRED", True)
+    assert client.get(f"/users/{alice}/cards", headers=headers).status_code == 401
+
+
+def test_generated_secret_is_kept_for_restarts_and_other_workers(tmp_path):
+    path = tmp_path / "session_secret"
+
+    secret = auth.load_or_create_secret(str(path))
+
+    assert len(secret) >= 32 and auth.load_or_create_secret(str(path)) == secret
+    assert path.stat().st_mode & 0o777 == 0o600
+
+
+def test_reconcile_is_for_admins_only(client, monkeypatch):
+    alice, alice_auth = sign_up(client, "alice@example.com")
+    _, bob_auth = sign_up(client, "bob@example.com")
+    monkeypatch.setattr(main, "ADMIN_USER_IDS", {alice})
+
+    assert client.post("/scraper/reconcile").status_code == 401
+    assert client.post("/scraper/reconcile", headers=bob_auth).status_code == 403
+    assert client.post("/scraper/reconcile", headers=alice_auth).json()["products"] == 0
+
+
+def test_logout_revokes_the_token(client):
+    alice, alice_auth = sign_up(client, "carol@example.com")
+
+    assert client.post("/sessions/logout", headers=alice_auth).status_code == 204
+    assert client.get(f"/users/{alice}/cards", headers=alice_auth).status_code == 401
+    assert client.post("/sessions/refresh", headers=alice_auth).status_code == 401
+
+
+def test_importing_main_has_no_side_effects(tmp_path):
+    # Spawned hash-pool workers import main again; only startup may touch the databases
+    subprocess.run(
+        [sys.executable, "-c", "import main"],
+        cwd=tmp_path, check=True,
+        env={**os.environ, "PYTHONPATH": str(BACKEND_DIR), "DATABASE_URL": "sqlite:///./app.db",
+             "TAP_QUEUE_PATH": str(tmp_path / "taps.db")}
+    )
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,194 @@
+"""
+Storage backend tests: the same scenarios against SQLite and PostgreSQL
+Postgres runs against TEST_POSTGRES_URL (a server where the user may
+create databases), or a throwaway local server from the pgserver package
+(pip install pgserver psycopg[binary]); otherwise it is skipped.
+Run with: python3 -m pytest test_backends.py
+"""
+import os
+import uuid
+from datetime import date, datetime
+
+import pytest
+from fastapi import Response
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+import database
+import main
+import migrations
+import reconcile
+import rollups
+import seed_data
+
+
+@pytest.fixture(scope="session")
+def postgres_url(tmp_path_factory):
+    url = os.getenv("TEST_POSTGRES_URL")
+    if url:
+        yield url
+        return
+    pgserver = pytest.importorskip("pgserver", reason="set TEST_POSTGRES_URL or install pgserver")
+    pytest.importorskip("psycopg")
+    server = pgserver.get_server(str(tmp_path_factory.mktemp("pgdata")), cleanup_mode="stop")
+    yield server.get_uri()
+    server.cleanup()
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def engine(request):
+    """Overrides conftest's engine: the same scratch database, on each backend"""
+    if request.param == "sqlite":
+        yield request.getfixturevalue("sqlite_engine")
+        return
+
+    # A scratch database per test, so runs never see each other's rows
+    server_url = database.normalize_url(request.getfixturevalue("postgres_url"))
+    name = f"wallzy_test_{uuid.uuid4().hex[:12]}"
+    admin = database.create_db_engine(server_url).execution_options(isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text(f"CREATE DATABASE {name}"))
+    engine = database.create_db_engine(make_url(server_url).set(database=name).render_as_string(hide_password=False))
+    database.init_db(bind=engine)
+    yield engine
+    engine.dispose()
+    with admin.connect() as conn:
+        conn.execute(text(f"DROP DATABASE {name}"))
+    admin.dispose()
+
+
+@pytest.fixture
+def dining_rule_id(db, categories, account, tap_account):
+    """
+    Both users' cards earn 3% on dining within a date window and 1% on
+    everything else; the id of the account's dining rule
+    """
+    dining = {}
+    for card_id in (account.card_id, tap_account.card_id):
+        dining[card_id] = database.CardRule(card_id=card_id, category_id=categories["dining"], multiplier=3.0,
+                                            start_date=date(2020, 1, 1), end_date=date(2099, 12, 31))
+        db.add_all([dining[card_id],
+                    database.CardRule(card_id=card_id, category_id=categories["other"], multiplier=1.0)])
+    db.commit()
+    return dining[account.card_id].id
+
+
+def add_transaction(db, account, amount_cents, mcc_code="5812"):
+    return main.create_transaction(main.TransactionCreate(
+        user_id=account.user_id, card_id=account.card_id, amount_cents=amount_cents, mcc_code=mcc_code
+    ), db=db)
+
+
+def test_init_db_is_idempotent(engine, dining_rule_id):
+    database.init_db(bind=engine)
+    with engine.connect() as conn:
+        versions = [row[0] for row in conn.execute(text("SELECT version FROM schema_migrations ORDER BY version"))]
+    assert versions == [version for version, _, _ in migrations.MIGRATIONS]
+
+
+def test_transaction_dates_and_rule_windows(db, account, dining_rule_id):
+    created = add_transaction(db, account, 1000)
+    assert created.multiplier == 3.0
+    assert created.cashback_cents == 30
+    assert isinstance(db.get(database.Transaction, created.id).transaction_date, datetime)
+
+
+def test_history_pagination(db, account, dining_rule_id):
+    ids = [add_transaction(db, account, 1000 + i).id for i in range(5)]
+
+    first_page = Response()
+    page = main.get_user_transactions(account.user_id, first_page, limit=3, cursor=None, db=db)
+    second = main.get_user_transactions(account.user_id, Response(), limit=3,
+                                        cursor=first_page.headers["X-Next-Cursor"], db=db)
+
+    assert [t["id"] for t in page + second] == ids[::-1]
+
+
+def test_analytics_and_rollups(db, account, dining_rule_id):
+    add_transaction(db, account, 1000)
+    add_transaction(db, account, 2000, mcc_code="5411")
+
+    analytics = main.get_user_analytics(account.user_id, db=db)
+    assert analytics["total_transactions"] == 2
+    assert analytics["by_category"]["dining"]["total_cashback_cents"] == 30
+    assert rollups.find_drift(db) == []
+
+
+def test_repeated_tap_is_recorded_once(db, dining_rule_id):
+    tap = {"uid": "AAAA", "mcc": "5812", "ts": 1700000000123}  # ms, past 32-bit range
+    first = main.process_tap(tap, db)
+    again = main.process_tap(tap, db)
+
+    assert (again.recommended_card_id, again.cashback_cents) == (first.recommended_card_id, first.cashback_cents)
+    assert db.query(database.Transaction).count() == 1
+
+
+def test_spend_counts_toward_rule_caps(db, account, dining_rule_id):
+    dining = db.get(database.CardRule, dining_rule_id)
+    dining.cap_cents = 1500
+    db.commit()
+
+    first, second = add_transaction(db, account, 1000), add_transaction(db, account, 1000)
+
+    assert (first.cashback_cents, second.cashback_cents) == (30, 20)  # $5 at 3%, $5 at 1%
+    assert db.query(database.RuleSpend.spent_cents).filter(database.RuleSpend.rule_id == dining.id).scalar() == 2000
+
+
+def test_scraped_rewards_are_reconciled(db, account, dining_rule_id):
+    db.add_all([
+        database.ScrapedReward(issuer="Issuer", card_name="Card", raw_text="4% dining until June 30, 2026",
+                               parsed_category="dining", parsed_multiplier=4.0, parsed_end_date="2026-06-30",
+                               scraped_at="2025-01-01T00:00:00", processed=False),
+        database.ScrapedReward(issuer="Issuer", card_name="Card", raw_text="2% groceries",
+                               parsed_category="groceries", parsed_multiplier=2.0,
+                               scraped_at="2025-01-01T00:00:00", processed=False),
+    ])
+    db.commit()
+
+    counts = reconcile.reconcile(db)
+
+    assert (counts["rules_created"], counts["rules_updated"]) == (1, 1)
+    dining = db.get(database.CardRule, dining_rule_id)
+    assert (dining.multiplier, dining.end_date) == (4.0, date(2026, 6, 30))
+    assert main.create_transaction(
+        main.TransactionCreate(user_id=account.user_id, card_id=account.card_id, amount_cents=1000,
+                               mcc_code="5411"), db=db
+    ).multiplier == 2.0
+
+
+def test_reseeding_clears_activity_first(db, account, dining_rule_id, session_factory, monkeypatch):
+    dining = db.get(database.CardRule, dining_rule_id)
+    dining.cap_cents = 1500
+    db.commit()
+    add_transaction(db, account, 1000)
+    main.process_tap({"uid": "AAAA", "mcc": "5812", "ts": 1700000000123}, db)
+    db.close()
+    monkeypatch.setattr(seed_data, "SessionLocal", session_factory)
+    monkeypatch.setattr(seed_data, "init_db", lambda: None)
+
+    seed_data.seed_database()
+
+    with session_factory() as session:
+        for table in (database.TapReceipt, database.RuleSpend, database.TransactionRollup, database.Transaction):
+            assert session.query(table).count() == 0, table.__tablename__
+        assert session.query(database.Card).count() > 0
+
+
+def test_string_dates_are_converted_on_postgres(engine, session_factory):
+    if engine.dialect.name != "postgresql":
+        pytest.skip("SQLite rewrites string dates in place, see test_query_plans.py")
+    with engine.begin() as conn:
+        # Recreate a schema from before typed dates
+        conn.execute(text("ALTER TABLE transactions ALTER COLUMN transaction_date TYPE VARCHAR"))
+        conn.execute(text("ALTER TABLE card_rules ALTER COLUMN end_date TYPE VARCHAR"))
+        conn.execute(text("DELETE FROM schema_migrations"))
+        conn.execute(text("INSERT INTO transactions (id, amount_cents, category, rewards, transaction_date) "
+                          "VALUES (1, 100, 'dining', 3, '2025-01-02T09:30:00')"))
+        conn.execute(text("INSERT INTO card_rules (id, multiplier, end_date) VALUES (1, 3.0, '')"))
+
+    database.init_db(bind=engine)
+
+    session = session_factory()
+    assert session.get(database.Transaction, 1).transaction_date == datetime(2025, 1, 2, 9, 30)
+    assert session.get(database.CardRule, 1).end_date is None
+    session.close()
@@ -0,0 +1,81 @@
+"""
+Tests for engine setup: SQLite pragmas, pool settings and the read engine
+Run with: python3 -m pytest test_database.py
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from sqlalchemy import text
+
+import database
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+
+def test_sqlite_connections_get_the_pragmas(engine):
+    with engine.connect() as conn:
+        pragmas = {name: conn.execute(text(f"PRAGMA {name}")).scalar()
+                   for name in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "mmap_size")}
+
+    assert pragmas == {
+        "journal_mode": database.SQLITE_JOURNAL_MODE.lower(),
+        "synchronous": 1,  # NORMAL
+        "busy_timeout": database.SQLITE_BUSY_TIMEOUT_MS,
+        "cache_size": database.SQLITE_CACHE_SIZE,
+        "mmap_size": database.SQLITE_MMAP_SIZE,
+    }
+
+
+def test_readers_see_the_last_commit_while_a_write_is_open(engine):
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (email, name) VALUES ('a@example.com', 'a')"))
+
+    with engine.connect() as writer, engine.connect() as reader:
+        writer.begin()
+        writer.execute(text("INSERT INTO users (email, name) VALUES ('b@example.com', 'b')"))
+        # With WAL this doesn't wait for the writer or fail with "database is locked"
+        assert reader.execute(text("SELECT count(*) FROM users")).scalar() == 1
+        writer.commit()
+        assert reader.execute(text("SELECT count(*) FROM users")).scalar() == 2
+
+
+def test_pool_settings_by_backend(monkeypatch):
+    file_engine = database.create_db_engine("sqlite:///./unused.db")
+    assert (file_engine.pool.size(), file_engine.pool._max_overflow, file_engine.pool._timeout) == (
+        database.DB_POOL_SIZE, database.DB_MAX_OVERFLOW, database.DB_POOL_TIMEOUT
+    )
+    file_engine.dispose()
+    assert "pool_size" not in database._engine_kwargs("sqlite:///:memory:")
+
+    monkeypatch.setattr(database, "DB_STATEMENT_TIMEOUT_MS", 2500)
+    kwargs = database._engine_kwargs("postgresql://wallzy@db.internal/wallzy")
+    assert kwargs["pool_pre_ping"] == database.DB_POOL_PRE_PING
+    assert (kwargs["pool_recycle"], kwargs["pool_use_lifo"]) == (database.DB_POOL_RECYCLE, True)
+    assert kwargs["connect_args"] == {"application_name": "wallzy", "options": "-c statement_timeout=2500"}
+    assert kwargs["pool_size"] == database.DB_POOL_SIZE
+
+
+def test_urls_are_normalized():
+    assert database.normalize_url("postgres://u:p@host/db") == "postgresql://u:p@host/db"
+    assert database.async_url("postgres://u:p@host/db") == "postgresql+psycopg://u:p@host/db"
+    assert database.async_url("sqlite:///./smartcard.db") == "sqlite+aiosqlite:///./smartcard.db"
+
+
+def test_read_endpoints_use_the_read_database_when_set(tmp_path):
+    script = (
+        "import database\n"
+        "assert database.read_engine is not database.engine\n"
+        "assert database.read_engine.url.database == 'replica.db', database.read_engine.url\n"
+        "session = next(database.get_read_db())\n"
+        "assert session.get_bind() is database.read_engine\n"
+        "assert next(database.get_db()).get_bind() is database.engine\n"
+    )
+    env = {**os.environ, "PYTHONPATH": str(BACKEND_DIR), "DATABASE_URL": "sqlite:///primary.db"}
+    subprocess.run([sys.executable, "-c", script], cwd=tmp_path, check=True,
+                   env={**env, "READ_DATABASE_URL": "sqlite:///replica.db"})
+
+    env.pop("READ_DATABASE_URL", None)
+    subprocess.run([sys.executable, "-c", "import database\nassert database.read_engine is database.engine\n"],
+                   cwd=tmp_path, check=True, env=env)
@@ -0,0 +1,57 @@
+"""
+Tests for MCC to category lookup
+Run with: python3 -m pytest test_mcc_data.py
+"""
+import pytest
+
+import main
+import mcc_data
+
+
+@pytest.mark.parametrize("code, category", [
+    ("5812", "dining"), (5812, "dining"),
+    ("5411", "groceries"), (5411, "groceries"),
+    ("0742", "other"), (742, "other"),
+])
+def test_str_and_int_codes_agree(code, category):
+    assert mcc_data.get_category_from_mcc(code) == category
+
+
+@pytest.mark.parametrize("start, end", mcc_data.MCC_RANGES["travel"])
+def test_travel_ranges_include_both_ends(start, end):
+    for code in (start, start + 1, (start + end) // 2, end):
+        assert mcc_data.get_category_from_mcc(code) == "travel"
+        assert mcc_data.get_category_from_mcc(str(code)) == "travel"
+
+
+@pytest.mark.parametrize("code", [2999, 3300, 3350, 3442, 3500, 4000])
+def test_codes_next_to_the_ranges_are_not_travel(code):
+    assert mcc_data.get_category_from_mcc(code) == "other"
+
+
+@pytest.mark.parametrize("code", [-1, 10000, 123456, "", "abc", "58 12", None, "5812.5"])
+def test_out_of_range_and_non_numeric_codes_are_other(code):
+    assert mcc_data.get_category_from_mcc(code) == "other"
+
+
+def test_explicit_codes_win_over_ranges(monkeypatch):
+    monkeypatch.setitem(mcc_data.MCC_CATEGORIES, "dining", mcc_data.MCC_CATEGORIES["dining"] + ["3600"])
+
+    table = mcc_data._build_mcc_table()
+
+    assert table[3600] == "dining"
+    assert table[3599] == table[3601] == "travel"
+
+
+def test_category_listings_include_range_codes():
+    travel = mcc_data.get_mcc_codes_for_category("Travel")
+
+    assert {"3000", "3299", "3351", "3441", "3501", "3999", "4511"} <= set(travel)
+    assert not {"2999", "3300", "3350", "3442", "3500"} & set(travel)
+    assert len(travel) == len(set(travel))
+    assert mcc_data.get_mcc_codes_for_category("dining") == ["5811", "5812", "5813", "5814"]
+    assert mcc_data.get_mcc_codes_for_category("other") == []
+    assert mcc_data.get_mcc_codes_for_category("unknown") == []
+    assert main.list_categories()["travel"] == travel
+    assert all(mcc_data.get_category_from_mcc(code) == category
+               for category, codes in main.list_categories().items() for code in codes)
@@ -0,0 +1,102 @@
+"""
+Tests for keyset pagination of transaction history
+Run with: python3 -m pytest test_pagination.py
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException, Response
+from fastapi.testclient import TestClient
+
+import database
+import main
+
+
+@pytest.fixture
+def card_ids(db, account):
+    """The account's two cards, with transactions on each and on no card"""
+    second = database.Card(user_id=account.user_id, issuer="Issuer", card_name="Card 2", last_four="0002")
+    db.add(second)
+    db.flush()
+    card_ids = [account.card_id, second.id]
+    # Pairs of transactions share a timestamp, so pages must break ties by id
+    for i in range(11):
+        add_transaction(db, account.user_id, card_ids[i % 2] if i != 4 else None,
+                        datetime(2025, 1, 1) + timedelta(hours=i // 2))
+    return card_ids
+
+
+def add_transaction(db, user_id, card_id, when):
+    txn = database.Transaction(user_id=user_id, card_id=card_id, amount_cents=1000, mcc_code="5812",
+                               category="dining", rewards=10, multiplier=1.0, transaction_date=when)
+    db.add(txn)
+    db.commit()
+    return txn
+
+
+def newest_first(db, **filters):
+    txn = database.Transaction
+    return [row.id for row in db.query(txn.id).filter_by(**filters).order_by(txn.transaction_date.desc(), txn.id.desc())]
+
+
+def walk(fetch, limit):
+    """Every page of an endpoint, following X-Next-Cursor; the ids of each page"""
+    pages, cursor = [], None
+    while True:
+        response = Response()
+        pages.append([row["id"] for row in fetch(response, limit=limit, cursor=cursor)])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("limit", [1, 3, 4, 11, 50])
+def test_pages_cover_the_history_once_in_order(db, account, card_ids, limit):
+    by_user = walk(lambda response, **page: main.get_user_transactions(account.user_id, response, db=db, **page), limit)
+    card_id = card_ids[0]
+    by_card = walk(lambda response, **page: main.get_card_transactions(card_id, response, db=db, **page), limit)
+
+    assert sum(by_user, []) == newest_first(db, user_id=account.user_id)
+    assert sum(by_card, []) == newest_first(db, card_id=card_id)
+    assert all(len(page) == limit for page in by_user[:-1]) and 0 < len(by_user[-1]) <= limit
+
+
+def test_new_transactions_do_not_shift_later_pages(db, account, card_ids):
+    first_page = Response()
+    first = main.get_user_transactions(account.user_id, first_page, limit=4, cursor=None, db=db)
+    add_transaction(db, account.user_id, card_ids[0], datetime(2030, 1, 1))
+
+    rest = main.get_user_transactions(account.user_id, Response(), limit=50,
+                                      cursor=first_page.headers["X-Next-Cursor"], db=db)
+
+    assert [row["id"] for row in first + rest] == newest_first(db, user_id=account.user_id)[1:]
+
+
+def test_rows_come_with_card_details_in_one_query(db, account, card_ids, statements):
+    statements.clear()
+    rows = main.get_user_transactions(account.user_id, Response(), limit=50, cursor=None, db=db)
+
+    assert len(statements) == 1
+    assert {row["card_name"] for row in rows} == {"Card", "Card 2", "Unknown"}
+
+
+def test_bad_cursor_and_limit_are_rejected(db, account, card_ids, session_factory):
+    with pytest.raises(HTTPException) as error:
+        main.get_user_transactions(account.user_id, Response(), limit=3, cursor="not-a-cursor", db=db)
+    assert error.value.status_code == 400
+
+    def get_test_db():
+        with session_factory() as session:
+            yield session
+
+    main.app.dependency_overrides[database.get_read_db] = get_test_db
+    try:
+        client = TestClient(main.app)
+        first = client.get(f"/transactions/{account.user_id}", params={"limit": 5})
+        second = client.get(f"/transactions/{account.user_id}", params={"limit": 5, "cursor": first.headers["X-Next-Cursor"]})
+        assert [row["id"] for row in first.json() + second.json()] == newest_first(db, user_id=account.user_id)[:10]
+        assert client.get(f"/transactions/{account.user_id}", params={"cursor": "%%%"}).status_code == 400
+        assert client.get(f"/transactions/{account.user_id}", params={"limit": 0}).status_code == 422
+        assert client.get(f"/transactions/{account.user_id}", params={"limit": 501}).status_code == 422
+    finally:
+        main.app.dependency_overrides.clear()
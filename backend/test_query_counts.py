@@ -0,0 +1,65 @@
+"""
+Statement-count tests for the card listing endpoints
+Each endpoint must run a constant number of SQL statements no matter how
+many cards and rules a user has.
+Run with: python3 -m pytest test_query_counts.py
+"""
+import pytest
+
+import database
+import main
+
+
+def get_categories(db):
+    names = ("dining", "groceries", "gas", "other")
+    categories = db.query(database.Category).order_by(database.Category.id).all()
+    if not categories:
+        categories = [database.Category(name=name, mcc_codes="") for name in names]
+        db.add_all(categories)
+        db.flush()
+    return categories
+
+
+def add_user(db, cards, rules_per_card):
+    categories = get_categories(db)
+    user = database.User(email=f"user{cards}@example.com", name="user", hashed_password="x")
+    db.add(user)
+    db.flush()
+    for i in range(cards):
+        card = database.Card(user_id=user.id, issuer="Issuer", card_name=f"Card {i}", last_four="0000")
+        db.add(card)
+        db.flush()
+        for j in range(rules_per_card):
+            db.add(database.CardRule(card_id=card.id, category_id=categories[j % len(categories)].id, multiplier=1.0 + j))
+    db.commit()
+    return user.id
+
+
+def count_statements(db, statements, endpoint, user_id):
+    db.expunge_all()
+    statements.clear()
+    result = endpoint(user_id, db=db)
+    return len(statements), result
+
+
+@pytest.mark.parametrize("endpoint", [main.get_user_cards, main.get_user_summary])
+def test_statement_count_is_constant(db, statements, endpoint):
+    small_user = add_user(db, cards=1, rules_per_card=1)
+    large_user = add_user(db, cards=12, rules_per_card=4)
+
+    small_count, _ = count_statements(db, statements, endpoint, small_user)
+    large_count, _ = count_statements(db, statements, endpoint, large_user)
+
+    assert large_count == small_count
+    assert large_count <= 3
+
+
+def test_card_listing_results(db):
+    user_id = add_user(db, cards=3, rules_per_card=4)
+
+    cards = main.get_user_cards(user_id, db=db)
+    summary = main.get_user_summary(user_id, db=db)
+
+    assert [c["rules_count"] for c in cards] == [4, 4, 4]
+    assert summary["total_cards"] == 3
+    assert [r["category"] for r in summary["cards"][0]["rewards"]] == ["dining", "groceries", "gas", "other"]
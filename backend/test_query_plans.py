@@ -0,0 +1,121 @@
+"""
+Query-plan tests: the hot queries must search an index, never full-scan
+Also checks that init_db backfills databases created before typed dates.
+Run with: python3 -m pytest test_query_plans.py
+"""
+from datetime import date, datetime
+
+import pytest
+from fastapi import Response
+from sqlalchemy import event, inspect, text
+
+import database
+import main
+import rollups
+import rule_index
+
+
+@pytest.fixture
+def history(db, categories, account):
+    """The account with three cards, 2% on every category and 60 transactions"""
+    more = [database.Card(user_id=account.user_id, issuer="Issuer", card_name=f"Card {i}", last_four="0000")
+            for i in (1, 2)]
+    db.add_all(more)
+    db.flush()
+    card_ids = [account.card_id] + [card.id for card in more]
+    for card_id in card_ids:
+        for category_id in categories.values():
+            db.add(database.CardRule(card_id=card_id, category_id=category_id, multiplier=2.0))
+    transactions = [
+        database.Transaction(user_id=account.user_id, card_id=card_ids[i % 3], amount_cents=1000, mcc_code="5812",
+                             category="dining", rewards=20, multiplier=2.0,
+                             transaction_date=datetime(2025, 1, 1 + i % 28, 12))
+        for i in range(60)
+    ]
+    db.add_all(transactions)
+    rollups.add_transactions(db, transactions)
+    db.commit()
+    return account
+
+
+def query_plans(db, fn):
+    """Run fn and return the EXPLAIN QUERY PLAN details of every SELECT it issued"""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        db.expunge_all()
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    assert statements
+    with engine.connect() as conn:
+        return [
+            (statement, [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)])
+            for statement, parameters in statements
+        ]
+
+
+def assert_no_full_scans(plans):
+    for statement, details in plans:
+        scans = [detail for detail in details if detail.startswith("SCAN ")]
+        assert not scans, f"{scans} in {statement}"
+
+
+HOT_QUERIES = {
+    "transactions by user": lambda db, ids: main.get_user_transactions(ids.user_id, Response(), limit=20,
+                                                                       cursor=None, db=db),
+    "transactions by card": lambda db, ids: main.get_card_transactions(ids.card_id, Response(), limit=20,
+                                                                       cursor=None, db=db),
+    "analytics": lambda db, ids: main.get_user_analytics(ids.user_id, db=db),
+    "user cards": lambda db, ids: main.get_user_cards(ids.user_id, db=db),
+    "summary": lambda db, ids: main.get_user_summary(ids.user_id, db=db),
+    "card rules": lambda db, ids: main.get_card_rules(ids.card_id, db=db),
+    "rule index build": lambda db, ids: rule_index.RuleIndex().get_user(db, ids.user_id),
+}
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_query_uses_indexes(db, history, name):
+    assert_no_full_scans(query_plans(db, lambda: HOT_QUERIES[name](db, history)))
+
+
+def test_deep_page_uses_index(db, history):
+    first_page = Response()
+    main.get_user_transactions(history.user_id, first_page, limit=20, cursor=None, db=db)
+    cursor = first_page.headers["X-Next-Cursor"]
+
+    assert_no_full_scans(query_plans(db, lambda: main.get_user_transactions(
+        history.user_id, Response(), limit=20, cursor=cursor, db=db
+    )))
+
+
+def test_init_db_backfills_string_dates(engine, session_factory):
+    with engine.begin() as conn:
+        # Recreate the pre-migration state: ISO strings and duplicate categories
+        conn.execute(text("DROP INDEX ix_categories_name"))
+        conn.execute(text("DELETE FROM schema_migrations"))
+        conn.execute(text("INSERT INTO categories (id, name) VALUES (1, 'dining'), (2, 'dining')"))
+        conn.execute(text("INSERT INTO card_rules (id, card_id, category_id, multiplier, end_date) "
+                          "VALUES (1, 1, 2, 3.0, '2025-12-31T00:00:00')"))
+        conn.execute(text("INSERT INTO transactions (id, user_id, card_id, amount_cents, category, rewards, transaction_date) "
+                          "VALUES (1, 1, 1, 100, 'dining', 3, '2025-01-02T09:30:00'), "
+                          "(2, 1, 1, 100, 'dining', 3, '2025-01-10T08:00:00.250000')"))
+
+    database.init_db(bind=engine)
+
+    session = session_factory()
+    rule = session.get(database.CardRule, 1)
+    ordered = session.query(database.Transaction).order_by(database.Transaction.transaction_date.desc()).all()
+    assert rule.category_id == 1
+    assert rule.end_date == date(2025, 12, 31)
+    assert [t.transaction_date for t in ordered] == [datetime(2025, 1, 10, 8, 0, 0, 250000), datetime(2025, 1, 2, 9, 30)]
+    assert session.query(database.Category).count() == 1
+    assert any(index["unique"] for index in inspect(engine).get_indexes("categories"))
+    session.close()
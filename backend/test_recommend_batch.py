@@ -0,0 +1,98 @@
+"""
+Tests for scoring many purchases in one /recommend/batch call
+Run with: python3 -m pytest test_recommend_batch.py
+"""
+from typing import List, NamedTuple
+
+import pytest
+
+import database
+import main
+import mcc_data
+import rule_index
+
+
+class Seeded(NamedTuple):
+    user_ids: List[int]
+    dining_id: int
+    grocery_id: int
+
+
+@pytest.fixture
+def seeded(db, categories, user_id):
+    # User 1: 4% dining and 2% groceries on two cards; user 2: dining only;
+    # user 3: no cards
+    others = [database.User(email=f"user{i}@example.com", name=f"user{i}", hashed_password="x") for i in (2, 3)]
+    db.add_all(others)
+    db.flush()
+    dining = database.Card(user_id=user_id, issuer="Issuer", card_name="Dining", last_four="0001")
+    grocery = database.Card(user_id=user_id, issuer="Issuer", card_name="Grocery", last_four="0002")
+    dining_only = database.Card(user_id=others[0].id, issuer="Issuer", card_name="Dining", last_four="0003")
+    db.add_all([dining, grocery, dining_only])
+    db.flush()
+    db.add_all([
+        database.CardRule(card_id=dining.id, category_id=categories["dining"], multiplier=4.0),
+        database.CardRule(card_id=grocery.id, category_id=categories["groceries"], multiplier=2.0),
+        database.CardRule(card_id=dining_only.id, category_id=categories["dining"], multiplier=3.0),
+    ])
+    db.commit()
+    return Seeded([user_id] + [user.id for user in others], dining.id, grocery.id)
+
+
+def item(user_id, mcc_code, amount_cents):
+    return main.RecommendRequest(user_id=user_id, mcc_code=mcc_code, amount_cents=amount_cents)
+
+
+def test_results_follow_the_input_order_with_per_item_errors(db, seeded):
+    first, second, third = seeded.user_ids
+    items = [
+        item(first, "5411", 10000),
+        item(third, "5812", 500),
+        item(first, "5812", 2500),
+        item(second, "5411", 1000),
+        item(first, "5411", 333),
+    ]
+
+    response = main.recommend_batch(main.BatchRecommendRequest(items=items), db=db)
+
+    assert [(r.user_id, r.amount_cents, r.category) for r in response.results] == [
+        (i.user_id, i.amount_cents, mcc_data.get_category_from_mcc(i.mcc_code)) for i in items
+    ]
+    assert [(r.recommended_card_id, r.cashback_cents, r.error) for r in response.results] == [
+        (seeded.grocery_id, 200, None),
+        (None, 0, "No cards found for user"),
+        (seeded.dining_id, 100, None),
+        (None, 0, "No applicable card rules found"),
+        (seeded.grocery_id, 6, None),
+    ]
+    assert response.results[0].reason == "2.0% cashback on groceries"
+    assert response.persisted_count == 0
+    assert db.query(database.Transaction).count() == 0
+
+
+def test_persist_records_only_the_scored_purchases(db, seeded):
+    first, _, third = seeded.user_ids
+    items = [item(first, "5812", 2500), item(third, "5812", 500), item(first, "5411", 10000)]
+
+    response = main.recommend_batch(main.BatchRecommendRequest(items=items, persist=True), db=db)
+
+    assert response.persisted_count == 2
+    rows = db.query(database.Transaction.user_id, database.Transaction.card_id, database.Transaction.rewards).order_by(
+        database.Transaction.id
+    ).all()
+    assert rows == [(first, seeded.dining_id, 100), (first, seeded.grocery_id, 200)]
+
+
+def test_batch_agrees_with_single_recommendations(db, seeded):
+    first, second, _ = seeded.user_ids
+    items = [item(user_id, mcc, amount) for user_id in (first, second) for mcc in ("5812", "5411", "5999")
+             for amount in (1, 999, 12345)]
+
+    batch = main.recommend_batch(main.BatchRecommendRequest(items=items), db=db).results
+
+    for request, result in zip(items, batch):
+        scorer = rule_index.get_scorer(db, request.user_id, result.category)
+        candidate, cashback, _ = scorer.score(request.amount_cents)
+        assert (result.recommended_card_id, result.cashback_cents) == (
+            candidate.card_id if candidate else None, cashback
+        )
@@ -0,0 +1,191 @@
+"""
+Tests for promoting scraped rewards into card rules
+Run with: python3 -m pytest test_reconcile.py
+"""
+from datetime import date
+
+from sqlalchemy import text
+
+import database
+import reconcile
+import rule_index
+import scrape_store
+from scraper import BankOfAmericaScraper, PageResult
+
+ISSUER = "Bank of America"
+
+
+def category(db, name):
+    found = db.query(database.Category).filter(database.Category.name == name).first()
+    if found is None:
+        found = database.Category(name=name, mcc_codes="")
+        db.add(found)
+        db.flush()
+    return found
+
+
+def add_card(db, email, card_name, rules):
+    user = database.User(email=email, name=email, hashed_password="x")
+    db.add(user)
+    db.flush()
+    card = database.Card(user_id=user.id, issuer=ISSUER, card_name=card_name, last_four="0000")
+    db.add(card)
+    db.flush()
+    for name, multiplier, cap_cents in rules:
+        db.add(database.CardRule(card_id=card.id, category_id=category(db, name).id,
+                                 multiplier=multiplier, cap_cents=cap_cents))
+    db.commit()
+    return user.id, card.id
+
+
+def add_reward(db, card_name, category_name, multiplier, cap_cents=None, end_date=None, processed=False,
+               unit="percent"):
+    db.add(database.ScrapedReward(
+        issuer=ISSUER, card_name=card_name, raw_text=f"{multiplier}% on {category_name} {cap_cents} {end_date}",
+        parsed_category=category_name, parsed_multiplier=multiplier, parsed_cap_cents=cap_cents,
+        parsed_end_date=end_date, parsed_unit=unit, scraped_at="2025-01-01T00:00:00", processed=processed
+    ))
+    db.commit()
+
+
+def card_rules(db, card_id):
+    rows = db.query(database.Category.name, database.CardRule.multiplier, database.CardRule.cap_cents,
+                    database.CardRule.end_date).join(database.Category).filter(database.CardRule.card_id == card_id)
+    return {name: (multiplier, cap, end) for name, multiplier, cap, end in rows}
+
+
+def test_changed_offers_are_applied_to_every_matching_card(db):
+    user_a, card_a = add_card(db, "a@example.com", "Customized Cash Rewards",
+                              [("dining", 3.0, 250000), ("groceries", 2.0, 250000), ("other", 1.0, None)])
+    user_b, card_b = add_card(db, "b@example.com", "Customized Cash Rewards", [("dining", 3.0, None)])
+    _, other_card = add_card(db, "c@example.com", "Travel Rewards", [("other", 1.5, None)])
+    rule_index.get_user(db, user_a)
+
+    add_reward(db, "Customized Cash Rewards", "dining", 3.0)  # no cap stated: hand-entered cap stays
+    add_reward(db, "Customized Cash Rewards", "groceries", 3.0, cap_cents=300000, end_date="2026-06-30")
+    add_reward(db, "Customized Cash Rewards", "groceries", 2.0)  # lower offer in the same category
+    add_reward(db, "Customized Cash Rewards", "gas", 3.0)
+    add_reward(db, "Customized Cash Rewards", None, None)  # unparseable
+
+    counts = reconcile.reconcile(db)
+
+    assert card_rules(db, card_a) == {
+        "dining": (3.0, 250000, None),
+        "groceries": (3.0, 300000, date(2026, 6, 30)),
+        "gas": (3.0, None, None),
+        "other": (1.0, None, None),
+    }
+    assert set(card_rules(db, card_b)) == {"dining", "groceries", "gas"}
+    assert card_rules(db, other_card) == {"other": (1.5, None, None)}
+    assert counts == {"products": 1, "cards": 2, "rules_created": 3, "rules_updated": 1, "rewards_processed": 5}
+    assert db.query(database.ScrapedReward).filter(database.ScrapedReward.processed.is_(False)).count() == 0
+    # The cached rules were dropped, so recommendations see the new multiplier
+    groceries = rule_index.get_candidates(db, user_a, "groceries", date(2026, 1, 1))
+    assert groceries[0].multiplier == 3.0
+
+    assert reconcile.reconcile(db)["products"] == 0
+
+
+def test_only_products_with_new_rewards_are_revisited(db):
+    _, card = add_card(db, "a@example.com", "Premium Rewards", [("dining", 2.0, None)])
+    add_reward(db, "Premium Rewards", "dining", 2.0, processed=True)
+    add_reward(db, "Premium Rewards", "other", 1.5)
+
+    counts = reconcile.reconcile(db)
+
+    # Processed rows still count as the product's current offers
+    assert card_rules(db, card) == {"dining": (2.0, None, None), "other": (1.5, None, None)}
+    assert (counts["rules_created"], counts["rules_updated"]) == (1, 0)
+
+
+def test_demo_rewards_of_failed_pages_are_never_promoted(db):
+    _, card = add_card(db, "a@example.com", "Premium Rewards", [("other", 1.5, None)])
+    demo = BankOfAmericaScraper()._get_fallback_data("Premium Rewards")
+    page = PageResult("Premium Rewards", "https://example.com/premium", "fallback", None, 0.1)
+    scrape_store.save_scrape(db, ISSUER, [page], demo)
+
+    assert db.query(database.ScrapedReward).filter(database.ScrapedReward.fallback.is_(True)).count() == len(demo)
+    assert reconcile.reconcile(db)["products"] == 0
+
+    add_reward(db, "Premium Rewards", "dining", 2.0)
+    counts = reconcile.reconcile(db)
+
+    assert card_rules(db, card) == {"dining": (2.0, None, None), "other": (1.5, None, None)}
+    assert (counts["rules_created"], counts["rules_updated"], counts["rewards_processed"]) == (1, 0, 1)
+
+
+def test_points_and_miles_are_not_taken_for_cashback(db):
+    _, card = add_card(db, "a@example.com", "Premium Rewards", [("dining", 2.0, None), ("other", 1.5, None)])
+    page = PageResult("Premium Rewards", "https://example.com/premium", "changed", None, 0.1)
+    texts = ["Earn 3 points per $1 on dining", "2 miles per $1 on gas", "3% cash back on groceries"]
+    scrape_store.save_scrape(db, ISSUER, [page], [
+        {"card_name": "Premium Rewards", "raw_text": text, "scraped_at": "2025-01-01T00:00:00"} for text in texts
+    ])
+
+    counts = reconcile.reconcile(db)
+
+    assert card_rules(db, card) == {"dining": (2.0, None, None), "groceries": (3.0, None, None),
+                                    "other": (1.5, None, None)}
+    assert (counts["rules_created"], counts["rules_updated"], counts["rewards_processed"]) == (1, 0, 3)
+
+
+def test_statement_count_does_not_grow_with_the_catalog(db, statements):
+    def count(products):
+        for i in range(products):
+            add_card(db, f"user{products}-{i}@example.com", f"Card {products}-{i}", [("dining", 1.0, None)])
+            add_reward(db, f"Card {products}-{i}", "dining", 2.0)
+        statements.clear()
+        reconcile.reconcile(db)
+        return len(statements)
+
+    assert count(5) == count(200)
+
+
+def test_migration_adds_cap_column_and_forces_a_rescrape(engine):
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE scraped_rewards DROP COLUMN parsed_cap_cents"))
+        conn.execute(text("DELETE FROM schema_migrations WHERE version = 3"))
+        conn.execute(text("INSERT INTO scraped_pages (url, etag, content_hash) VALUES ('u', '\"e\"', 'h')"))
+
+    database.init_db(bind=engine)
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT parsed_cap_cents FROM scraped_rewards")).fetchall() == []
+        assert conn.execute(text("SELECT etag, content_hash FROM scraped_pages")).fetchall() == [(None, None)]
+
+
+def test_migration_adds_unit_column_and_only_trusts_plain_percentages(engine):
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE scraped_rewards DROP COLUMN parsed_unit"))
+        conn.execute(text("DELETE FROM schema_migrations WHERE version = 8"))
+        conn.execute(text(
+            "INSERT INTO scraped_rewards (raw_text, parsed_multiplier) VALUES "
+            "('3% cash back on dining', 3.0), ('Earn 2 Points per $1 at Pharmacies', 2.0), "
+            "('2 miles per $1, plus 1% back', 2.0)"
+        ))
+        conn.execute(text("INSERT INTO scraped_pages (url, etag, content_hash) VALUES ('u', '\"e\"', 'h')"))
+
+    database.init_db(bind=engine)
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT parsed_unit FROM scraped_rewards ORDER BY id")).scalars().all() == [
+            "percent", None, None
+        ]
+        assert conn.execute(text("SELECT etag, content_hash FROM scraped_pages")).fetchall() == [(None, None)]
+
+
+def test_migration_flags_demo_rewards_stored_before_the_fallback_column(engine):
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE scraped_rewards DROP COLUMN fallback"))
+        conn.execute(text("DELETE FROM schema_migrations WHERE version = 6"))
+        conn.execute(text(
+            "INSERT INTO scraped_rewards (issuer, card_name, raw_text) VALUES "
+            "('Bank of America', 'Unlimited Cash Rewards', '1.5% unlimited cash back on all purchases'), "
+            "('Bank of America', 'Unlimited Cash Rewards', '2% unlimited cash back on all purchases')"
+        ))
+
+    database.init_db(bind=engine)
+
+    with engine.connect() as conn:
+        flags = conn.execute(text("SELECT fallback FROM scraped_rewards ORDER BY id")).scalars().all()
+    assert [bool(flag) for flag in flags] == [True, False]
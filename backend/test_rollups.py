@@ -0,0 +1,82 @@
+"""
+Tests for per-day transaction rollups
+Run with: python3 -m pytest test_rollups.py
+"""
+from datetime import date, datetime
+
+import pytest
+
+import database
+import main
+import rollups
+
+
+@pytest.fixture
+def dining_card(db, categories, tap_account):
+    """The tap user's card, with 3% on dining"""
+    db.add(database.CardRule(card_id=tap_account.card_id, category_id=categories["dining"], multiplier=3.0))
+    db.commit()
+    return tap_account
+
+
+def stored(db):
+    return {key[:3]: totals for key, totals in rollups.load_rollups(db).items()}
+
+
+def test_every_write_path_keeps_rollups_in_step(db, dining_card):
+    main.create_transaction(main.TransactionCreate(
+        user_id=dining_card.user_id, card_id=dining_card.card_id, amount_cents=1000, mcc_code="5812"
+    ), db=db)
+    main.recommend_batch(main.BatchRecommendRequest(items=[
+        main.RecommendRequest(user_id=dining_card.user_id, mcc_code="5812", amount_cents=2000),
+        main.RecommendRequest(user_id=dining_card.user_id, mcc_code="5813", amount_cents=3000),
+    ], persist=True), db=db)
+    main.process_tap({"uid": "0A1B2C3D", "mcc": "5812", "ts": 1700000000}, db)
+
+    rows = db.query(database.Transaction.amount_cents, database.Transaction.rewards).all()
+    assert len(rows) == 4
+    assert stored(db) == {
+        (dining_card.user_id, dining_card.card_id, "dining"): (4, sum(row[0] for row in rows), sum(row[1] for row in rows))
+    }
+    assert rollups.find_drift(db) == []
+
+
+def test_same_key_is_incremented_in_place(db, dining_card):
+    rows = [
+        {"user_id": dining_card.user_id, "card_id": dining_card.card_id, "category": "dining", "amount_cents": amount,
+         "rewards": amount // 100, "transaction_date": datetime(2025, 3, 1, hour)}
+        for amount, hour in ((1000, 9), (2500, 18))
+    ]
+    rollups.add_rows(db, rows[:1])
+    db.commit()
+    rollups.add_rows(db, rows[1:] + [dict(rows[0], transaction_date=datetime(2025, 3, 2, 9))])
+    db.commit()
+
+    assert rollups.load_rollups(db) == {
+        (dining_card.user_id, dining_card.card_id, "dining", date(2025, 3, 1)): (2, 3500, 35),
+        (dining_card.user_id, dining_card.card_id, "dining", date(2025, 3, 2)): (1, 1000, 10),
+    }
+
+
+def test_drift_is_reported_and_rebuilt(db, dining_card):
+    db.add_all([
+        database.Transaction(user_id=dining_card.user_id, card_id=dining_card.card_id, amount_cents=amount, mcc_code="5812",
+                             category="dining", rewards=amount // 100, multiplier=1.0,
+                             transaction_date=datetime(2025, 3, day, 12))
+        for amount, day in ((1000, 1), (2000, 1), (500, 2))
+    ])
+    db.commit()
+
+    # Databases from before the rollups table get it filled once
+    assert rollups.backfill_if_empty(db)
+    assert not rollups.backfill_if_empty(db)
+    assert rollups.find_drift(db) == []
+
+    rollup = db.query(database.TransactionRollup).filter(database.TransactionRollup.day == date(2025, 3, 1)).one()
+    rollup.spent_cents += 1
+    db.commit()
+    key = (dining_card.user_id, dining_card.card_id, "dining", date(2025, 3, 1))
+    assert rollups.find_drift(db) == [(key, (2, 3000, 30), (2, 3001, 30))]
+
+    assert rollups.rebuild(db) == 2
+    assert rollups.find_drift(db) == []
@@ -0,0 +1,73 @@
+"""
+Tests for the in-memory reward-rule index
+Run with: python3 -m pytest test_rule_index.py
+"""
+import database
+import main
+import rule_index
+
+
+def multipliers(index, session, user_id, category):
+    return [c.multiplier for c in index.candidates(session, user_id, category)]
+
+
+def test_card_and_rule_writes_rebuild_only_the_affected_user(db, account):
+    other = database.User(email="other@example.com", name="other", hashed_password="x")
+    db.add(other)
+    db.commit()
+    cached = rule_index.get_user(db, account.user_id)
+    others = rule_index.get_user(db, other.id)
+    assert rule_index.get_user(db, account.user_id) is cached
+
+    card = main.add_card(account.user_id, main.CardCreate(issuer="Issuer", card_name="Second", last_four="0002"), db=db)
+    assert set(rule_index.get_user(db, account.user_id).cards) == {account.card_id, card["id"]}
+
+    main.add_card_rule(card["id"], main.CardRuleCreate(category="dining", multiplier=4.0), db=db)
+    main.add_card_rule(account.card_id, main.CardRuleCreate(category="other", multiplier=1.0), db=db)
+    assert [(c.card_id, c.multiplier) for c in rule_index.get_candidates(db, account.user_id, "dining")] == [
+        (card["id"], 4.0), (account.card_id, 1.0)
+    ]
+
+    rule = main.add_card_rule(account.card_id, main.CardRuleCreate(category="dining", multiplier=5.0,
+                                                              requires_activation=True), db=db)
+    assert rule_index.get_candidates(db, account.user_id, "dining")[0].multiplier == 4.0
+    main.activate_card_rule(account.card_id, rule["id"], db=db)
+    assert rule_index.get_candidates(db, account.user_id, "dining")[0].multiplier == 5.0
+
+    assert rule_index.get_user(db, other.id) is others
+
+
+def test_instances_sharing_a_database_see_each_others_writes(db, account, session_factory):
+    # Two API processes: each has its own index, both read the same database
+    mine, theirs = rule_index.RuleIndex(), rule_index.RuleIndex()
+    other_db = session_factory()
+    assert multipliers(mine, db, account.user_id, "dining") == []
+    assert multipliers(theirs, other_db, account.user_id, "dining") == []
+
+    main.add_card_rule(account.card_id, main.CardRuleCreate(category="dining", multiplier=3.0), db=db)
+
+    assert multipliers(theirs, other_db, account.user_id, "dining") == [3.0]
+    assert multipliers(mine, db, account.user_id, "dining") == [3.0]
+    cached = theirs.get_user(other_db, account.user_id)
+    assert theirs.get_user(other_db, account.user_id) is cached
+    other_db.close()
+
+
+def test_invalidate_all_reaches_every_user_on_every_instance(db, account, tap_account, categories, session_factory):
+    theirs, other_db = rule_index.RuleIndex(), session_factory()
+    for user_id in (account.user_id, tap_account.user_id):
+        assert multipliers(theirs, other_db, user_id, "dining") == []
+        cached = theirs.get_user(other_db, user_id)
+    rule_index.get_user(db, account.user_id)  # cached here too; the tap user isn't
+
+    # A bulk write that bypasses the per-user bumps, e.g. a data fix
+    db.add_all([database.CardRule(card_id=card_id, category_id=categories["dining"], multiplier=2.0)
+                for card_id in (account.card_id, tap_account.card_id)])
+    rule_index.invalidate_all(db)
+    db.commit()
+
+    for user_id in (account.user_id, tap_account.user_id):
+        assert multipliers(theirs, other_db, user_id, "dining") == [2.0]
+        assert rule_index.get_candidates(db, user_id, "dining")[0].multiplier == 2.0
+    assert theirs.get_user(other_db, tap_account.user_id) is not cached
+    other_db.close()
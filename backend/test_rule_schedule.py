@@ -0,0 +1,126 @@
+"""
+Tests for date-window rule activation
+Run with: python3 -m pytest test_rule_schedule.py
+"""
+from datetime import date
+from typing import NamedTuple
+
+import pytest
+from sqlalchemy import text
+
+import database
+import main
+import rule_index
+import rule_schedule
+from rule_schedule import Interval
+
+
+class Rules(NamedTuple):
+    intro_id: int
+    quarterly_id: int
+    base_id: int
+
+
+@pytest.fixture
+def rules(db, categories, account):
+    db.get(database.Card, account.card_id).opened_date = date(2025, 1, 31)
+    rules = [
+        # 5% dining for the first 3 months, 4% dining in Q2 once activated, 1% on everything
+        database.CardRule(card_id=account.card_id, category_id=categories["dining"], multiplier=5.0,
+                          intro_duration_months=3),
+        database.CardRule(card_id=account.card_id, category_id=categories["dining"], multiplier=4.0,
+                          start_date=date(2025, 4, 1), end_date=date(2025, 6, 30), requires_activation=True),
+        database.CardRule(card_id=account.card_id, category_id=categories["other"], multiplier=1.0),
+    ]
+    db.add_all(rules)
+    db.commit()
+    return Rules(*(rule.id for rule in rules))
+
+
+def test_interval_combines_dates_intro_period_and_activation():
+    assert rule_schedule.active_interval(date(2025, 1, 1), None) == Interval(date(2025, 1, 1), None)
+    # Intro months end the day before the same date N months on (clamped to short months)
+    assert rule_schedule.active_interval(None, None, 1, date(2025, 1, 31)) == Interval(date(2025, 1, 31), date(2025, 2, 27))
+    assert rule_schedule.active_interval(None, None, 3, None) == Interval(None, None)
+    assert rule_schedule.active_interval(date(2025, 4, 1), date(2025, 6, 30), requires_activation=True) is None
+    assert rule_schedule.active_interval(
+        date(2025, 4, 1), date(2025, 6, 30), requires_activation=True, activated_on=date(2025, 5, 10)
+    ) == Interval(date(2025, 5, 10), date(2025, 6, 30))
+    assert rule_schedule.active_interval(None, date(2025, 1, 1), 3, date(2025, 2, 1)) is None
+
+
+def test_active_rules_recompute_only_at_boundaries():
+    calls = []
+
+    def select(items):
+        calls.append(sorted(items))
+        return sorted(items)
+
+    active = rule_schedule.ActiveRules([
+        ("a", Interval(None, date(2025, 3, 31))),
+        ("b", Interval(date(2025, 2, 1), None)),
+        ("c", None),
+    ], select)
+
+    assert active.at(date(2025, 1, 15)) == ["a"]
+    assert active.at(date(2025, 1, 31)) == ["a"]
+    assert active.at(date(2025, 2, 1)) == ["a", "b"]
+    assert active.at(date(2025, 3, 31)) == ["a", "b"]
+    assert active.at(date(2025, 4, 1)) == ["b"]
+    assert active.at(date(2030, 1, 1)) == ["b"]
+    assert len(calls) == 3
+
+
+def test_index_serves_the_rules_active_on_each_day(db, account, rules):
+    def dining(day):
+        return [(c.rule_id, c.multiplier) for c in rule_index.get_candidates(db, account.user_id, "dining", day)]
+
+    assert dining(date(2025, 2, 1)) == [(rules.intro_id, 5.0), (rules.base_id, 1.0)]
+    assert dining(date(2025, 5, 1)) == [(rules.base_id, 1.0)]  # intro over, quarterly not activated
+    assert rule_index.get_candidates(db, account.user_id, "dining", date(2025, 2, 1))[0].active_until == date(2025, 4, 29)
+
+    rule = db.get(database.CardRule, rules.quarterly_id)
+    rule.activated_on = date(2025, 4, 15)
+    db.commit()
+    rule_index.invalidate_user(account.user_id)
+
+    assert dining(date(2025, 4, 14)) == [(rules.intro_id, 5.0), (rules.base_id, 1.0)]
+    assert dining(date(2025, 4, 15)) == [(rules.intro_id, 5.0), (rules.quarterly_id, 4.0), (rules.base_id, 1.0)]
+    assert dining(date(2025, 7, 1)) == [(rules.base_id, 1.0)]
+
+
+def test_activate_endpoint_switches_the_rule_on_from_today(db, account, rules, monkeypatch):
+    class Today(date):
+        @classmethod
+        def today(cls):
+            return date(2025, 5, 1)
+
+    monkeypatch.setattr(main, "date", Today)
+    before = rule_index.get_candidates(db, account.user_id, "dining", date(2025, 5, 1))
+
+    activated = main.activate_card_rule(account.card_id, rules.quarterly_id, db=db)
+    again = main.activate_card_rule(account.card_id, rules.quarterly_id, db=db)
+
+    assert activated["activated_on"] == again["activated_on"] == date(2025, 5, 1)
+    assert [c.rule_id for c in before] == [rules.base_id]
+    after = rule_index.get_candidates(db, account.user_id, "dining", date(2025, 5, 1))
+    assert [c.rule_id for c in after] == [rules.quarterly_id, rules.base_id]
+    with pytest.raises(main.HTTPException):
+        main.activate_card_rule(account.card_id + 1, rules.quarterly_id, db=db)
+
+
+def test_migration_keeps_rules_that_need_activation_active(engine):
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE cards DROP COLUMN opened_date"))
+        conn.execute(text("ALTER TABLE card_rules DROP COLUMN activated_on"))
+        conn.execute(text("DELETE FROM schema_migrations WHERE version = 4"))
+        conn.execute(text(
+            "INSERT INTO card_rules (card_id, category_id, multiplier, requires_activation) VALUES (1, 1, 5.0, 1), (1, 1, 1.0, 0)"
+        ))
+
+    database.init_db(bind=engine)
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT requires_activation, activated_on FROM card_rules ORDER BY id")).fetchall()
+        assert rows == [(1, date.today().isoformat()), (0, None)]
+        assert conn.execute(text("SELECT opened_date FROM cards")).fetchall() == []
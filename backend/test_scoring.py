@@ -0,0 +1,93 @@
+"""
+Tests for the shared reward-scoring engine
+Run with: python3 -m pytest test_scoring.py
+"""
+from datetime import date
+
+import database
+import main
+import rule_index
+import scoring
+from rule_index import Candidate
+
+
+def candidate(rule_id, card_id, category, multiplier, cap_cents=None):
+    return Candidate(card_id, f"Card {card_id}", "Issuer", rule_id, category, multiplier, cap_cents, None, None)
+
+
+def add_card(db, user_id, rules, **card):
+    db_card = database.Card(user_id=user_id, issuer="Issuer", card_name="Card", last_four="0000", **card)
+    db.add(db_card)
+    db.flush()
+    for name, multiplier, extra in rules:
+        category = db.query(database.Category).filter(database.Category.name == name).first()
+        if category is None:
+            category = database.Category(name=name, mcc_codes="")
+            db.add(category)
+            db.flush()
+        db.add(database.CardRule(card_id=db_card.id, category_id=category.id, multiplier=multiplier, **extra))
+    db.commit()
+    rule_index.invalidate_user(user_id)
+    return db_card.id
+
+
+def test_batch_scores_match_single_scores():
+    candidates = [
+        candidate(1, 1, "dining", 4.0, cap_cents=10000),
+        candidate(2, 2, "dining", 3.0),
+        candidate(3, 1, "other", 1.0),
+    ]
+    scorer = scoring.Scorer(candidates)
+    amounts = [5000, 8000, 500, 0]
+
+    for spent in (None, {1: 6000}):
+        single = [scorer.score(amount, dict(spent) if spent else spent) for amount in amounts]
+        assert list(zip(*scorer.score_many(amounts, spent))) == single
+    assert scorer.score(8000, {1: 6000}) == (candidates[1], 240, 3.0)
+    assert scorer.score(8000, {1: 6000}, card_id=1) == (candidates[0], 200, 2.5)
+    assert scoring.Scorer([]).score_many([100]) == ([None], [0], [0])
+
+
+def test_valuation_and_cap_rules_are_pluggable():
+    cashback = candidate(1, 1, "dining", 2.0)
+    points = candidate(2, 2, "dining", 1.5, cap_cents=10000)
+
+    def value(c):
+        return 1.5 if c.card_id == 2 else 1.0
+
+    def hard_cap(amount, multiplier, cap, spent, base):
+        return int(min(amount, max(cap - spent, 0)) * multiplier / 100), multiplier
+
+    assert scoring.Scorer([cashback, points]).score(10000) == (cashback, 200, 2.0)
+    assert scoring.Scorer([cashback, points], value).score(10000) == (points, 225, 2.25)
+    assert scoring.Scorer([cashback, points], value, hard_cap).score(10000, {2: 5000}) == (cashback, 200, 2.0)
+
+
+def test_transactions_score_active_rules_without_a_query_per_rule(db, user_id, statements):
+    def count(extra_rules):
+        card_id = add_card(db, user_id, [("groceries", 2.0, {})]
+                           + [(f"category{i}", 1.5, {}) for i in range(extra_rules)] + [("other", 1.0, {})])
+        statements.clear()
+        response = main.create_transaction(main.TransactionCreate(
+            user_id=user_id, card_id=card_id, amount_cents=10000, mcc_code="5411"
+        ), db=db)
+        assert (response.cashback_cents, response.multiplier) == (200, 2.0)
+        return len(statements)
+
+    assert count(1) == count(40)
+
+
+def test_transactions_and_recommendations_agree_on_dates(db, user_id):
+    card_id = add_card(db, user_id, [
+        ("groceries", 6.0, {"end_date": date(2000, 1, 1)}),
+        ("groceries", 5.0, {"requires_activation": True}),
+        ("groceries", 2.0, {}),
+        ("other", 1.0, {}),
+    ])
+
+    response = main.create_transaction(main.TransactionCreate(
+        user_id=user_id, card_id=card_id, amount_cents=10000, mcc_code="5411"
+    ), db=db)
+
+    assert (response.cashback_cents, response.multiplier) == (200, 2.0)
+    assert rule_index.get_candidates(db, user_id, "groceries")[0].multiplier == 2.0
@@ -0,0 +1,378 @@
+"""
+Tests for the concurrent scraper, against a local server serving fixture pages
+Run with: python3 -m pytest test_scraper.py
+"""
+import hashlib
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+import jobs
+import main
+import scrape_pipeline
+import scrape_store
+from fetcher import Fetcher
+from scraper import BankOfAmericaScraper, RewardParser
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "bofa"
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """Serves fixtures/bofa/<last path segment>.html and records every request"""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FixtureHandler)
+        self.lock = threading.Lock()
+        self.requests = []  # (path, monotonic start time)
+        self.failures = {}  # path -> number of 503s still to send
+        self.delay = 0.0
+        self.pages = {}  # path -> HTML served instead of the fixture file
+        self.validators = True  # send ETag/Last-Modified and answer conditional GETs
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, time.monotonic()))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            failing = server.failures.get(self.path, 0) > 0
+            if failing:
+                server.failures[self.path] -= 1
+        try:
+            time.sleep(server.delay)
+            page = FIXTURES / f"{self.path.strip('/').split('/')[-1]}.html"
+            if failing:
+                self.send_error(503)
+            elif self.path not in server.pages and not page.exists():
+                self.send_error(404)
+            else:
+                body = server.pages[self.path].encode() if self.path in server.pages else page.read_bytes()
+                etag = f'"{hashlib.md5(body).hexdigest()}"'
+                if server.validators and self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                if server.validators:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = FixtureServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_fetcher(**kwargs):
+    options = dict(max_concurrency=4, host_interval=0, max_retries=2, backoff=0.01)
+    options.update(kwargs)
+    return Fetcher(**options)
+
+
+def test_scrapes_every_card_from_fixture_pages(server):
+    with make_fetcher() as fetcher:
+        scraper = BankOfAmericaScraper(base_url=server.url, fetcher=fetcher)
+        rewards = scraper.scrape_rewards()
+
+    texts = {(r["card_name"], r["raw_text"]) for r in rewards}
+    assert ("Unlimited Cash Rewards", "1.5% unlimited cash back on all purchases") in texts
+    assert ("Premium Rewards", "2 points per $1 spent on travel and dining purchases") in texts
+    assert {r["card_name"] for r in rewards} == set(BankOfAmericaScraper.CARD_URLS)
+    assert all(result.ok for result in scraper.last_results.values())
+    # Output stays in card order whatever order the pages finished in
+    order = [r["card_name"] for r in rewards]
+    assert order == sorted(order, key=list(BankOfAmericaScraper.CARD_URLS).index)
+
+
+def test_extraction_keeps_first_of_each_text_in_page_order():
+    html = (
+        '<nav><li class="nav-benefit">Menu</li></nav>'
+        '<span class="percent-off">5% back</span>'
+        '<div class="card-benefits"><p class="reward-copy">2x points on dining</p></div>'
+        '<p class="reward-copy">2x points on dining</p>'
+        '<div class="reward">No annual fee</div>'
+        '<section class="reward">10% cash back</section>'
+    )
+    scraper = BankOfAmericaScraper()
+    rewards = scraper._extract_reward_texts(scraper.parse_html(html), "Test Card")
+
+    assert [r["raw_text"] for r in rewards] == ["5% back", "2x points on dining"]
+    assert len({r["scraped_at"] for r in rewards}) == 1
+
+
+def test_reward_parser_picks_first_category_in_priority_order():
+    texts = [
+        "3% cash back on gas and dining until December 31, 2025",
+        "Earn 2 Points per $1 at Pharmacies",
+        "5% on up to $1,500 in combined purchases each quarter",
+        "Free checked bags",
+        "3% cash back on gas and dining until December 31, 2025",
+    ]
+    parsed = RewardParser.parse_many(texts)
+
+    assert parsed[0] == {"multiplier": 3.0, "unit": "percent", "category": "dining", "end_date": "2025-12-31",
+                         "cap_cents": None}
+    assert (parsed[1]["multiplier"], parsed[1]["unit"], parsed[1]["category"]) == (2.0, "points", "drugstores")
+    assert RewardParser.parse_reward_text("3 miles per $1 on travel, 1% otherwise")["unit"] == "miles"
+    assert (parsed[2]["category"], parsed[2]["cap_cents"]) == (None, 150000)
+    assert parsed[3] is None
+    assert parsed[4] == parsed[0] and parsed[4] is not parsed[0]
+    assert parsed == [RewardParser.parse_reward_text(text) for text in texts]
+
+
+def test_one_scan_finds_the_category_a_search_per_category_would():
+    def by_priority(lowered):
+        return next((category for category, pattern in RewardParser.CATEGORIES.items()
+                     if re.search(pattern, lowered)), None)
+
+    texts = [
+        "unlimited 1.5% on all purchases", "2% at gas stations and 1% on everything else",
+        "3% on streaming subscriptions, online shopping and food delivery", "movies, then groceries",
+        "5x at pharmacies and supermarkets", "gasoline", "no category here", "foods at the drug store",
+    ]
+    for text in texts:
+        assert RewardParser.find_category(text.lower()) == by_priority(text.lower()), text
+
+
+def test_transient_errors_are_retried(server):
+    path = BankOfAmericaScraper.CARD_URLS["Travel Rewards"]
+    server.failures[path] = 2
+
+    with make_fetcher() as fetcher:
+        result = fetcher.fetch(server.url + path)
+
+    assert result.ok
+    assert result.attempts == 3
+
+
+def test_missing_page_is_not_retried(server):
+    with make_fetcher() as fetcher:
+        result = fetcher.fetch(server.url + "/en-us/credit-cards/products/no-such-card/")
+
+    assert not result.ok
+    assert (result.status, result.attempts) == (404, 1)
+
+
+def test_failing_card_falls_back(server):
+    server.failures[BankOfAmericaScraper.CARD_URLS["Premium Rewards"]] = 10
+
+    with make_fetcher(max_retries=1) as fetcher:
+        scraper = BankOfAmericaScraper(base_url=server.url, fetcher=fetcher)
+        rewards = scraper.scrape_rewards()
+
+    premium = [r["raw_text"] for r in rewards if r["card_name"] == "Premium Rewards"]
+    assert premium == [r["raw_text"] for r in scraper._get_fallback_data("Premium Rewards")]
+    assert scraper.last_results["Premium Rewards"].attempts == 2
+
+
+def test_requests_to_one_host_are_spaced(server):
+    urls = {card: server.url + path for card, path in BankOfAmericaScraper.CARD_URLS.items()}
+    with make_fetcher(host_interval=0.1) as fetcher:
+        fetcher.fetch_all(urls)
+
+    starts = sorted(start for _, start in server.requests)
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    assert min(gaps) >= 0.09
+
+
+def test_fetches_run_concurrently_up_to_the_cap(server):
+    server.delay = 0.2
+    urls = {i: f"{server.url}/page-{i}" for i in range(8)}
+
+    started = time.perf_counter()
+    with make_fetcher(max_concurrency=4) as fetcher:
+        fetcher.fetch_all(urls)
+    elapsed = time.perf_counter() - started
+
+    assert server.max_in_flight == 4
+    assert elapsed < 8 * 0.2 / 2
+
+
+def scrape(server, db):
+    """One /scraper/run: conditional scrape, then store"""
+    with make_fetcher() as fetcher:
+        scraper = BankOfAmericaScraper(base_url=server.url, fetcher=fetcher)
+        rewards = scraper.scrape_rewards(scrape_store.load_page_states(db, scraper.card_urls().values()))
+    counts = scrape_store.save_scrape(db, scraper.ISSUER, scraper.pages.values(), rewards)
+    return scraper, counts
+
+
+def stored_rewards(db):
+    return {(r.card_name, r.raw_text): r.id for r in db.query(database.ScrapedReward)}
+
+
+def test_unchanged_pages_come_back_304(server, db):
+    _, first = scrape(server, db)
+    rows = stored_rewards(db)
+    scraper, second = scrape(server, db)
+
+    assert first["inserted"] == len(rows) > 0
+    assert {page.status for page in scraper.pages.values()} == {"unchanged"}
+    assert all(result.status == 304 for result in scraper.last_results.values())
+    assert second == {"inserted": 0, "updated": 0, "deleted": 0,
+                      "pages_changed": 0, "pages_unchanged": 4, "pages_failed": 0}
+    assert stored_rewards(db) == rows
+
+
+def test_same_content_is_not_reparsed_without_validators(server, db, monkeypatch):
+    server.validators = False
+    scrape(server, db)
+
+    def fail(*args):
+        raise AssertionError("unchanged page was parsed")
+
+    monkeypatch.setattr(BankOfAmericaScraper, "_extract_reward_texts", fail)
+    scraper, counts = scrape(server, db)
+
+    assert {page.status for page in scraper.pages.values()} == {"unchanged"}
+    assert counts["pages_unchanged"] == 4
+
+
+def test_only_changed_rows_are_written(server, db):
+    scrape(server, db)
+    before = stored_rewards(db)
+
+    path = BankOfAmericaScraper.CARD_URLS["Unlimited Cash Rewards"]
+    server.pages[path] = '<div class="reward">2% cash back on all purchases</div>'
+    scraper, counts = scrape(server, db)
+    after = stored_rewards(db)
+
+    assert scraper.pages["Unlimited Cash Rewards"].status == "changed"
+    assert counts["inserted"] == 1
+    assert after[("Unlimited Cash Rewards", "2% cash back on all purchases")]
+    assert not any(card == "Unlimited Cash Rewards" and text != "2% cash back on all purchases" for card, text in after)
+    # Other cards' rows are untouched
+    assert {k: v for k, v in after.items() if k[0] != "Unlimited Cash Rewards"} == \
+        {k: v for k, v in before.items() if k[0] != "Unlimited Cash Rewards"}
+
+
+class ManyCardsScraper(BankOfAmericaScraper):
+    CARD_URLS = {f"Card {i}": f"/cards/card-{i}/" for i in range(120)}
+
+
+def test_pipeline_streams_many_pages_in_bounded_batches(server, db, session_factory):
+    for i, path in enumerate(ManyCardsScraper.CARD_URLS.values()):
+        server.pages[path] = (f'<div class="reward">{i % 5 + 1}% cash back on dining</div>'
+                              f'<li class="benefit">{i} bonus points per $1 on travel</li>')
+
+    def run():
+        # Threads instead of the default process pool keep the test fast
+        with make_fetcher() as fetcher, ThreadPoolExecutor(2) as executor:
+            scraper = ManyCardsScraper(base_url=server.url, fetcher=fetcher)
+            pipeline = scrape_pipeline.ScrapePipeline(scraper, session_factory, executor=executor,
+                                                      queue_size=4, batch_pages=10)
+            return pipeline, pipeline.run()
+
+    pipeline, counts = run()
+    assert (counts["pages_changed"], counts["inserted"], counts["scraped_count"]) == (120, 240, 240)
+    # One page in the fetch loop, 4 queued, a batch of 10 and one being resolved
+    assert pipeline.peak_held <= 1 + 4 + 10 + 1
+    dining = db.query(database.ScrapedReward).filter(database.ScrapedReward.parsed_category == "dining").count()
+    assert dining == 120
+
+    _, again = run()
+    assert (again["pages_unchanged"], again["inserted"], again["deleted"]) == (120, 0, 0)
+
+
+def test_pipeline_falls_back_when_parsing_fails(server, db, session_factory, monkeypatch):
+    extract_rewards = BankOfAmericaScraper.extract_rewards
+
+    def flaky(self, card_name, html):
+        if card_name == "Premium Rewards":
+            raise ValueError("bad markup")
+        return extract_rewards(self, card_name, html)
+
+    monkeypatch.setattr(BankOfAmericaScraper, "extract_rewards", flaky)
+    with make_fetcher() as fetcher, ThreadPoolExecutor(2) as executor:
+        scraper = BankOfAmericaScraper(base_url=server.url, fetcher=fetcher)
+        counts = scrape_pipeline.ScrapePipeline(scraper, session_factory, executor=executor).run()
+
+    assert (counts["pages_changed"], counts["pages_failed"]) == (3, 1)
+    premium = {text for card, text in stored_rewards(db) if card == "Premium Rewards"}
+    assert premium == {r["raw_text"] for r in scraper._get_fallback_data("Premium Rewards")}
+
+
+def test_runs_share_one_parse_pool(server, db, session_factory, monkeypatch):
+    pool = ThreadPoolExecutor(2)  # stands in for the process pool
+    monkeypatch.setattr(scrape_pipeline, "_parse_pool", pool)
+    submitted = []
+    monkeypatch.setattr(pool, "submit", lambda *args: submitted.append(args) or ThreadPoolExecutor.submit(pool, *args))
+
+    for text in ("2% cash back on dining", "3% cash back on dining"):
+        server.pages[BankOfAmericaScraper.CARD_URLS["Travel Rewards"]] = f'<div class="reward">{text}</div>'
+        with make_fetcher() as fetcher:
+            scraper = BankOfAmericaScraper(base_url=server.url, fetcher=fetcher)
+            scrape_pipeline.ScrapePipeline(scraper, session_factory).run()
+
+    assert len(submitted) == 4 + 1  # every page, then only the changed one
+    assert scrape_pipeline.parse_pool() is pool
+    pool.shutdown()
+
+
+def test_job_runner_allows_one_job_per_kind():
+    runner = jobs.JobRunner()
+    release = threading.Event()
+    first = runner.submit("scraper", lambda job: release.wait(5) and "done")
+
+    with pytest.raises(jobs.JobAlreadyRunning) as e:
+        runner.submit("scraper", lambda job: None)
+    assert e.value.job is first
+    other = runner.submit("other", lambda job: 1 / 0)
+
+    release.set()
+    runner.shutdown(cancel_pending=False)
+    assert (first.status, first.result) == ("succeeded", "done")
+    assert other.status == "failed"
+    assert "division by zero" in other.error
+
+
+def test_scraper_run_is_a_background_job(server, db, session_factory, monkeypatch):
+    monkeypatch.setenv("BOFA_BASE_URL", server.url)
+    monkeypatch.setattr(database, "SessionLocal", session_factory)
+    monkeypatch.setattr(main, "job_runner", jobs.JobRunner())
+    client = TestClient(main.app)
+    server.delay = 0.2
+
+    started = client.post("/scraper/run")
+    assert started.status_code == 202
+    job_id = started.json()["job_id"]
+    assert client.post("/scraper/run").status_code == 409
+
+    main.job_runner.shutdown(cancel_pending=False)
+    job = client.get(f"/scraper/jobs/{job_id}").json()
+    assert job["status"] == "succeeded"
+    assert job["progress"] == {"done": 4, "total": 4}
+    assert {step["name"] for step in job["steps"]} == set(BankOfAmericaScraper.CARD_URLS)
+    assert all(step["status"] == "changed" and step["seconds"] > 0 for step in job["steps"])
+    assert job["result"]["inserted"] == db.query(database.ScrapedReward).count()
+    assert client.get("/scraper/jobs/nope").status_code == 404
@@ -0,0 +1,86 @@
+"""
+Tests for cap-aware rewards backed by period-to-date spend counters
+Run with: python3 -m pytest test_spend_caps.py
+"""
+from datetime import date
+from typing import NamedTuple
+
+import pytest
+
+import database
+import main
+import spend_caps
+
+
+class Cards(NamedTuple):
+    user_id: int
+    capped_id: int
+    flat_id: int
+
+
+@pytest.fixture
+def cards(db, categories, tap_account):
+    # The tap user's card becomes a 6% grocery card capped at $100 a
+    # quarter; they get an uncapped 3% one too
+    capped_id = tap_account.card_id
+    flat = database.Card(user_id=tap_account.user_id, issuer="Issuer", card_name="Flat", last_four="0003")
+    db.add(flat)
+    db.flush()
+    db.add_all([
+        database.CardRule(card_id=capped_id, category_id=categories["groceries"], multiplier=6.0, cap_cents=10000),
+        database.CardRule(card_id=capped_id, category_id=categories["other"], multiplier=1.0),
+        database.CardRule(card_id=flat.id, category_id=categories["groceries"], multiplier=3.0),
+    ])
+    db.commit()
+    return Cards(tap_account.user_id, capped_id, flat.id)
+
+
+def spent(db, card_id):
+    return db.query(database.RuleSpend.spent_cents).join(
+        database.CardRule, database.CardRule.id == database.RuleSpend.rule_id
+    ).filter(database.CardRule.card_id == card_id).scalar()
+
+
+def test_purchase_is_split_at_the_cap():
+    assert spend_caps.capped_reward(8000, 6.0, 10000, 0, 1.0) == (480, 6.0)
+    assert spend_caps.capped_reward(5000, 6.0, 10000, 8000, 1.0) == (150, 3.0)
+    assert spend_caps.capped_reward(1000, 6.0, 10000, 13000, 1.0) == (10, 1.0)
+    assert spend_caps.period_start(date(2025, 8, 17)) == date(2025, 7, 1)
+    assert spend_caps.PERIOD_NAME == "quarterly"
+
+
+def test_transactions_count_toward_the_quarterly_cap(db, cards):
+    def buy(amount_cents):
+        return main.create_transaction(main.TransactionCreate(
+            user_id=cards.user_id, card_id=cards.capped_id, amount_cents=amount_cents, mcc_code="5411"
+        ), db=db)
+
+    first, second, third = buy(8000), buy(5000), buy(1000)
+
+    assert (first.cashback_cents, first.multiplier) == (480, 6.0)
+    assert (second.cashback_cents, second.multiplier) == (150, 3.0)
+    assert (third.cashback_cents, third.multiplier) == (10, 1.0)
+    assert spent(db, cards.capped_id) == 14000
+
+
+def test_batch_switches_cards_once_the_cap_is_used_up(db, cards):
+    items = [{"user_id": cards.user_id, "mcc_code": "5411", "amount_cents": 8000}] * 3
+
+    preview = main.recommend_batch(main.BatchRecommendRequest(items=items), db=db)
+    recorded = main.recommend_batch(main.BatchRecommendRequest(items=items, persist=True), db=db)
+
+    assert [r.recommended_card_id for r in preview.results] == [cards.capped_id] * 3
+    assert [r.recommended_card_id for r in recorded.results] == [cards.capped_id, cards.flat_id, cards.flat_id]
+    assert [r.cashback_cents for r in recorded.results] == [480, 240, 240]
+    assert spent(db, cards.capped_id) == 8000
+
+
+def test_taps_read_and_update_the_counter(db, cards, monkeypatch):
+    monkeypatch.setattr(main.random, "randint", lambda low, high: 8000)
+
+    first = main.process_tap({"uid": "AA", "mcc": "5411", "ts": 1}, db)
+    second = main.process_tap({"uid": "AA", "mcc": "5411", "ts": 2}, db)
+
+    assert (first.recommended_card_id, first.cashback_cents) == (cards.capped_id, 480)
+    assert (second.recommended_card_id, second.cashback_cents) == (cards.flat_id, 240)
+    assert spent(db, cards.capped_id) == 8000
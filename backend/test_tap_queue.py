@@ -0,0 +1,220 @@
+"""
+Tests for the durable tap queue and the bridge's push path into it
+Run with: python3 -m pytest test_tap_queue.py
+"""
+import asyncio
+import importlib.util
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+import database
+import main
+from tap_queue import QueueFull, TapConsumer, TapQueue
+
+BLE_PATH = Path(__file__).resolve().parent.parent / "firmware" / "ble.py"
+
+
+def test_burst_in_same_second_is_kept(tmp_path):
+    queue = TapQueue(str(tmp_path / "taps.db"))
+    first = queue.append("AAAA", "5411", 100)
+    second = queue.append("BBBB", 5812, 100)
+
+    assert second > first
+    assert [(t.uid, t.mcc) for t in queue.read_batch("c")] == [("AAAA", "5411"), ("BBBB", "5812")]
+
+
+def test_duplicate_tap_returns_original_seq(tmp_path):
+    queue = TapQueue(str(tmp_path / "taps.db"))
+    seq = queue.append("AAAA", "5411", 100)
+
+    assert queue.append("AAAA", "5411", 100) == seq
+    assert queue.depth("c") == 1
+
+
+def test_uncommitted_batch_is_redelivered(tmp_path):
+    queue = TapQueue(str(tmp_path / "taps.db"))
+    for ts in range(5):
+        queue.append("AAAA", "5411", ts)
+
+    calls = []
+
+    def flaky(batch):
+        calls.append([t.ts for t in batch])
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+
+    consumer = TapConsumer(queue, flaky, name="c", batch_size=3)
+    with pytest.raises(RuntimeError):
+        consumer.drain_once()
+    assert consumer.drain_once() == 3
+    assert consumer.drain_once() == 2
+    assert calls == [[0, 1, 2], [0, 1, 2], [3, 4]]
+    assert queue.depth("c") == 0
+
+
+def test_backpressure_when_full(tmp_path):
+    queue = TapQueue(str(tmp_path / "taps.db"), max_depth=2)
+    queue.append("AAAA", "5411", 1)
+    queue.append("AAAA", "5411", 2)
+
+    with pytest.raises(QueueFull):
+        queue.append("AAAA", "5411", 3)
+    # A resent tap is already queued, so it is acknowledged even when full
+    assert queue.append("AAAA", "5411", 2) == 2
+
+    queue.commit("recommend", 2)
+    queue.append("AAAA", "5411", 3)
+    assert queue.compact() == 2
+
+
+@pytest.fixture
+def taps(db, session_factory, tmp_path, monkeypatch):
+    """POST /taps into a scratch queue; taps are processed against the scratch database"""
+    dining = database.Category(name="dining", mcc_codes="5812")
+    users = [database.User(email=f"user{i}@example.com", name=f"user{i}", hashed_password="x") for i in (1, 2)]
+    db.add_all([dining] + users)
+    db.flush()
+    card = database.Card(user_id=users[1].id, issuer="Issuer", card_name="Card", last_four="0001")
+    db.add(card)
+    db.flush()
+    db.add(database.CardRule(card_id=card.id, category_id=dining.id, multiplier=3.0))
+    db.commit()
+
+    queue = TapQueue(str(tmp_path / "taps.db"), max_depth=2)
+    monkeypatch.setattr(main, "tap_log", queue)
+    monkeypatch.setattr(database, "SessionLocal", session_factory)
+    yield TestClient(main.app), queue
+    queue.close()
+
+
+def test_pushed_taps_are_queued_and_recorded_once(taps, db):
+    client, queue = taps
+    tap = {"uid": "0A1B2C3D", "mcc": "5811", "ts": 1700000000}
+
+    first = client.post("/taps", json=tap)
+    again = client.post("/taps", json=tap)
+    assert first.status_code == again.status_code == 202
+    assert first.json() == again.json() == {"seq": first.json()["seq"], "depth": 1}
+
+    consumer = TapConsumer(queue, main.handle_tap_batch)
+    assert consumer.drain_once() == 1
+    # Redelivery of a processed tap is answered from its receipt
+    main.handle_tap_batch(queue.read_batch("other"))
+    rows = db.query(database.Transaction.user_id, database.Transaction.category, database.Transaction.multiplier).all()
+    assert rows == [(2, "dining", 3.0)]
+    assert queue.depth("recommend") == 0
+
+
+def test_a_failing_tap_is_skipped_but_transient_errors_retry_the_batch(taps, db, tmp_path, monkeypatch, caplog):
+    queue = TapQueue(str(tmp_path / "batches.db"))
+    for ts in (1, 2, 3):
+        queue.append("0A1B2C3D", "5811", ts)
+    process_tap = main.process_tap
+    failure = {2: ValueError("bad tap")}
+
+    def flaky_process_tap(data, session):
+        if data["ts"] in failure:
+            raise failure.pop(data["ts"])
+        return process_tap(data, session)
+
+    monkeypatch.setattr(main, "process_tap", flaky_process_tap)
+    consumer = TapConsumer(queue, main.handle_tap_batch)
+
+    assert consumer.drain_once() == 3
+    assert "Dropping tap 2" in caplog.text
+    assert db.query(database.TapReceipt.ts).order_by(database.TapReceipt.ts).all() == [(1,), (3,)]
+
+    queue.append("0A1B2C3D", "5811", 4)
+    failure[4] = OperationalError("SELECT 1", {}, Exception("database is locked"))
+    with pytest.raises(OperationalError):
+        consumer.drain_once()
+    assert queue.depth("recommend") == 1
+    queue.close()
+
+
+def test_integrity_errors_other_than_a_repeat_are_raised(taps, db, monkeypatch):
+    def conflicting_rollup(session, transactions):
+        session.add(database.Category(name="dining", mcc_codes=""))  # names are unique
+
+    monkeypatch.setattr(main.rollups, "add_transactions", conflicting_rollup)
+
+    for ts in (1700000000000, None):
+        with pytest.raises(IntegrityError):
+            main.process_tap({"uid": "0A1B2C3D", "mcc": "5811", "ts": ts}, db)
+    assert db.query(database.Transaction).count() == 0
+
+
+def test_taps_without_a_timestamp_are_rejected(taps):
+    client, queue = taps
+
+    assert client.post("/taps", json={"uid": "0A1B2C3D", "mcc": "5811"}).status_code == 422
+    assert queue.depth("recommend") == 0
+
+
+def test_full_backlog_asks_the_bridge_to_back_off(taps):
+    client, queue = taps
+    for ts in (1, 2):
+        assert client.post("/taps", json={"uid": "0A1B2C3D", "mcc": 5411, "ts": ts}).status_code == 202
+
+    full = client.post("/taps", json={"uid": "0A1B2C3D", "mcc": 5411, "ts": 3})
+
+    assert full.status_code == 429
+    assert full.headers["Retry-After"] == "1"
+
+
+def load_ble():
+    pytest.importorskip("bleak")
+    spec = importlib.util.spec_from_file_location("ble", BLE_PATH)
+    ble = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(ble)
+    return ble
+
+
+def test_bridge_stamps_every_read_distinctly():
+    ble = load_ble()
+    clock = ble.TapClock()
+    before = time.time_ns() // 1_000_000
+
+    stamps = [clock.stamp() for _ in range(2000)]
+
+    assert stamps == sorted(set(stamps))
+    assert before <= stamps[0] <= time.time_ns() // 1_000_000
+
+
+def test_bridge_retries_until_the_backend_accepts(monkeypatch):
+    ble = load_ble()
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            status, body = (429, {"detail": "full"}) if len(received) == 1 else (202, {"seq": 7, "depth": 1})
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(json.dumps(body).encode("utf-8"))
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(ble, "TAPS_URL", f"http://127.0.0.1:{server.server_port}/taps")
+    record = ble.make_record("0A1B2C3D", "dining", ble.TapClock().stamp())
+
+    async def push():
+        return await ble.push_tap(asyncio.get_running_loop(), record)
+
+    try:
+        assert asyncio.run(push()) == {"seq": 7, "depth": 1}
+    finally:
+        server.shutdown()
+    assert received == [record, record]
+    assert record["mcc"] == "5811" and isinstance(record["ts"], int)
@@ -2,10 +2,14 @@
 # python3 -m venv venv && source venv/bin/activate
 # pip install bleak
 # python ble_to_json.py
+# WALLZY_TAPS_URL=http://host:8000/taps to point at another backend,
+# HELLO_JSON_AUDIT=1 to also keep writing hello.json
 
 # ble_rfid_to_json_persistent.py
 # pip install bleak
 import asyncio, json, time, os, signal
+import urllib.error
+import urllib.request
 from pathlib import Path
 from bleak import BleakScanner, BleakClient
 
@@ -15,22 +19,68 @@ CHAR_UUID    = "9b2a6a1f-4f8a-4c67-9d2a-62b3c1a8e0ff"
 
 JSON_PATH = Path(os.getenv("HELLO_JSON", "~/Desktop/dubhacksv5/firmware/hello.json")).expanduser().resolve()
 
+# Taps are pushed straight to the backend; hello.json is only an optional audit copy
+TAPS_URL  = os.getenv("WALLZY_TAPS_URL", "http://localhost:8000/taps")
+WRITE_AUDIT_JSON = os.getenv("HELLO_JSON_AUDIT", "0") == "1"
+
 MCC_BY_CATEGORY = {
     "grocery": "5411",   # Grocery
     "dining":  "5811",   # Dining
     "online":  "5311",   #online_shopping
 }
 
-def write_json(uid: str, category: str):
-    record = {
+class TapClock:
+    """
+    Tap timestamps in milliseconds since the epoch, taken when the card is read
+    The backend dedupes on (uid, ts), so stamps are strictly increasing:
+    two reads in the same millisecond (or a clock step back) still differ.
+    """
+    def __init__(self):
+        self.last = 0
+
+    def stamp(self) -> int:
+        self.last = max(time.time_ns() // 1_000_000, self.last + 1)
+        return self.last
+
+def make_record(uid: str, category: str, ts: int) -> dict:
+    return {
         "uid": uid,
         "mcc": MCC_BY_CATEGORY.get(category, 5999),
-        "ts": int(time.time()),
+        "ts": ts,
     }
+
+def write_json(record: dict):
     JSON_PATH.parent.mkdir(parents=True, exist_ok=True)
     JSON_PATH.write_text(json.dumps(record, indent=2))
     print("Wrote:", JSON_PATH, "->", record)
 
+def post_tap(record: dict) -> dict:
+    """POST one tap to the backend's durable tap queue (blocking)"""
+    req = urllib.request.Request(
+        TAPS_URL,
+        data=json.dumps(record).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        return json.loads(resp.read().decode("utf-8"))
+
+async def push_tap(loop, record: dict) -> dict:
+    """Deliver a tap, backing off while the backend is full or unreachable"""
+    delay = 0.5
+    while True:
+        try:
+            # urllib blocks, so keep it off the event loop
+            return await loop.run_in_executor(None, post_tap, record)
+        except urllib.error.HTTPError as e:
+            if e.code not in (429, 503):
+                raise
+            print(f"Backend busy ({e.code}), retrying tap in {delay:.1f}s")
+        except urllib.error.URLError as e:
+            print(f"Backend unreachable ({e.reason}), retrying tap in {delay:.1f}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 10.0)
+
 async def main():
     print("Output file:", JSON_PATH)
     print("Scanning for ESP32… (close LightBlue so it doesn't hold the connection)")
@@ -45,12 +95,15 @@ async def main():
         raise RuntimeError("ESP32 not found. Is it advertising?")
 
     loop = asyncio.get_running_loop()
-    queue: asyncio.Queue[bytes] = asyncio.Queue()  # unbounded; each notify will be queued
+    queue: asyncio.Queue[tuple] = asyncio.Queue()  # unbounded; each notify will be queued
+    clock = TapClock()
 
     # notify callback (may be called from another thread)
     def on_notify(_, data: bytearray):
-        # schedule putting bytes into the asyncio queue on the correct loop
-        loop.call_soon_threadsafe(queue.put_nowait, bytes(data))
+        # stamp the tap now, not when it's posted: posts can wait behind retries
+        tap = (clock.stamp(), bytes(data))
+        # schedule putting it into the asyncio queue on the correct loop
+        loop.call_soon_threadsafe(queue.put_nowait, tap)
 
     print("Connecting to:", device)
     async with BleakClient(device) as client:
@@ -60,14 +113,23 @@ async def main():
 
         try:
             while True:
-                raw = await queue.get()             # wait for the next notification
+                ts, raw = await queue.get()         # wait for the next notification
                 try:
                     payload = json.loads(raw.decode("utf-8"))
                     uid = payload.get("uid", "")
                     category = payload.get("category", "online")
-                    write_json(uid, category)      # overwrite JSON with latest tap
+                    record = make_record(uid, category, ts)
                 except Exception as e:
                     print("Failed to parse payload:", raw, "error:", e)
+                    continue
+                if WRITE_AUDIT_JSON:
+                    write_json(record)             # audit copy of the latest tap
+                try:
+                    # Taps keep arriving in `queue` while this one is retried
+                    result = await push_tap(loop, record)
+                    print("Queued tap", record, "-> seq", result.get("seq"))
+                except Exception as e:
+                    print("Failed to post tap:", record, "error:", e)
         except asyncio.CancelledError:
             # graceful shutdown if externally cancelled
             pass
@@ -31,6 +31,9 @@ export const API_ENDPOINTS = {
   CREATE_USER: '/users',
   LIST_USERS: '/users',
 
+  // Sessions
+  REFRESH_SESSION: '/sessions/refresh',
+
   // Cards
   ADD_CARD: (userId) => `/users/${userId}/cards`,
   GET_USER_CARDS: (userId) => `/users/${userId}/cards`,
@@ -57,6 +60,7 @@ export const API_ENDPOINTS = {
 
   // Scraper
   RUN_SCRAPER: '/scraper/run',
+  GET_SCRAPER_JOB: (jobId) => `/scraper/jobs/${jobId}`,
   GET_SCRAPER_RESULTS: '/scraper/results',
 };
 
@@ -71,6 +71,8 @@ const LoginScreen = ({ navigateTo }) => {
           id: data.id,
           email: data.email,
           name: data.name,
+          token: data.access_token,
+          expiresAt: data.expires_at,
         });
 
         Alert.alert('Success', `Welcome back, ${data.name}!`, [
@@ -4,24 +4,82 @@
  */
 
 import { API_BASE_URL, API_ENDPOINTS, DEFAULT_USER_ID } from '../config/api';
+import { authStorage } from './authStorage';
+
+// Renew the session token this long before it expires
+const REFRESH_MARGIN_SECONDS = 60;
 
 class ApiService {
+  constructor() {
+    this.refreshing = null;
+  }
+
+  /**
+   * Exchange the session token for a fresh one via /sessions/refresh
+   * Concurrent callers share one refresh; if it fails the token is dropped
+   * (the user has to log in again where the backend requires it)
+   */
+  refreshSession() {
+    const token = authStorage.getToken();
+    if (!token) {
+      return Promise.resolve(false);
+    }
+    if (!this.refreshing) {
+      this.refreshing = fetch(`${API_BASE_URL}${API_ENDPOINTS.REFRESH_SESSION}`, {
+        method: 'POST',
+        headers: { Authorization: `Bearer ${token}` },
+      })
+        .then(async (response) => {
+          if (!response.ok) {
+            authStorage.setToken(null, null);
+            return false;
+          }
+          const data = await response.json();
+          authStorage.setToken(data.access_token, data.expires_at);
+          return true;
+        })
+        .catch(() => false)
+        .finally(() => {
+          this.refreshing = null;
+        });
+    }
+    return this.refreshing;
+  }
+
+  /**
+   * Refresh the session token if it is about to expire
+   */
+  async ensureFreshToken() {
+    const expiresAt = authStorage.getTokenExpiresAt();
+    if (authStorage.getToken() && expiresAt && expiresAt - Date.now() / 1000 < REFRESH_MARGIN_SECONDS) {
+      await this.refreshSession();
+    }
+  }
+
   /**
    * Generic fetch wrapper with error handling
+   * A 401 on a request that carried a token triggers one refresh and retry
    */
-  async request(endpoint, options = {}) {
+  async request(endpoint, options = {}, retried = false) {
     const url = `${API_BASE_URL}${endpoint}`;
+    await this.ensureFreshToken();
+    const token = authStorage.getToken();
     const config = {
+      ...options,
       headers: {
         'Content-Type': 'application/json',
+        ...(token ? { Authorization: `Bearer ${token}` } : {}),
         ...options.headers,
       },
-      ...options,
     };
 
     try {
       console.log(`API Request: ${options.method || 'GET'} ${url}`);
       const response = await fetch(url, config);
+
+      if (response.status === 401 && token && !retried && await this.refreshSession()) {
+        return this.request(endpoint, options, true);
+      }
       
       if (!response.ok) {
         const errorData = await response.json().catch(() => ({}));
@@ -162,12 +220,17 @@ class ApiService {
 
   // ============ Scraper APIs ============
 
+  // Starts a background scrape; returns { job_id, status }
   async runScraper() {
     return this.request(API_ENDPOINTS.RUN_SCRAPER, {
       method: 'POST',
     });
   }
 
+  async getScraperJob(jobId) {
+    return this.request(API_ENDPOINTS.GET_SCRAPER_JOB(jobId));
+  }
+
   async getScraperResults() {
     return this.request(API_ENDPOINTS.GET_SCRAPER_RESULTS);
   }
@@ -1,7 +1,9 @@
 /**
  * Authentication Storage Service
  * Simple in-memory storage for current user session
- * In production, use AsyncStorage or SecureStore
+ * The session (and its token) is not persisted: every app launch logs in
+ * again. Keeping it across launches needs SecureStore/AsyncStorage, which
+ * the app doesn't depend on yet.
  */
 
 let currentUser = null;
@@ -20,6 +22,22 @@ export const authStorage = {
     return currentUser?.id || null;
   },
 
+  // Session token from /login; renew with POST /sessions/refresh before expiresAt
+  getToken: () => {
+    return currentUser?.token || null;
+  },
+
+  getTokenExpiresAt: () => {
+    return currentUser?.expiresAt || null;
+  },
+
+  // Swap in the token returned by /sessions/refresh (or drop it with null)
+  setToken: (token, expiresAt) => {
+    if (currentUser) {
+      currentUser = { ...currentUser, token, expiresAt };
+    }
+  },
+
   clearUser: () => {
     currentUser = null;
     console.log('User logged out');